@@ -0,0 +1,384 @@
+import numpy as np
+
+from astropy.time import Time
+
+import asyncio
+import logging
+import time
+
+from helios_interface import *
+
+# asyncio client for the Helios shell. It offers the same API as HeliosUnit
+# with awaitable methods, so that one event loop can drive many units:
+#
+#   h = await AsyncHeliosUnit.create('192.168.1.10')
+#   await h.absolute_move(30., 180.)
+#
+# Every method accepts a timeout (seconds) for its whole exchange with the
+# unit, on expiry it returns None/False like a failed command.
+
+class AsyncHeliosUnit(HeliosUnitBase):
+    def __init__(self, ip_addr, nickname=None, port=23, timeout=10., settle=1.):
+        self._init_state(ip_addr, nickname)
+        self.port = port
+        self.timeout = timeout
+        self.settle = settle
+        self.reader = None
+        self.writer = None
+        self.parser = HeliosStreamParser()
+        self.lock = asyncio.Lock()
+
+    @classmethod
+    async def create(cls, ip_addr, nickname=None, port=23, timeout=10., settle=1.):
+        h = cls(ip_addr, nickname, port, timeout, settle)
+        if not await h.connect():
+            return None
+        if not await h.load_state():
+            return None
+        return h
+
+    async def connect(self, timeout=None, settle=None):
+        timeout = self.timeout if timeout is None else timeout
+        settle = self.settle if settle is None else settle
+        try:
+            self.reader, self.writer = await asyncio.wait_for(asyncio.open_connection(self.ip_addr, self.port), timeout)
+            await asyncio.wait_for(self.reader.readuntil(b'> '), timeout)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+            log.warning("Cannot connect to %s", self.ip_addr)
+            self._drop_link()
+            return False
+        self.session.connected()
+        self.metrics.connected()
+        await asyncio.sleep(settle)
+        return await self.cmd_get_answare("", timeout) is not None
+
+    def _drop_link(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = None
+        self.writer = None
+        self.parser.clear()
+        self.session.failed()
+
+    async def ensure_connected(self):
+        if self.writer is not None:
+            return True
+        if not self.session.can_attempt():
+            return False
+        return await self.connect()
+
+    async def keepalive(self, timeout=None):
+        if self.writer is None:
+            return await self.ensure_connected()
+        if not self.session.needs_keepalive(self.cfg.get('TELNET_WATCHDOG_TIME', 60)):
+            return True
+        return await self.cmd_get_answare("", timeout) is not None
+
+    async def disconnect(self):
+        if self.writer is None:
+            return
+        try:
+            self.writer.write(b"quit\n")
+            self.metrics.sent(5)
+            self.writer.close()
+            await self.writer.wait_closed()
+        except OSError:
+            pass
+        self.reader = None
+        self.writer = None
+        self.parser.clear()
+        self.session.closed()
+
+    async def load_state(self, timeout=None):
+        ans = await self.cmd_get_answares(self.STATE_CMDS, timeout)
+        if any(a is None for a in ans):
+            log.warning("Cannot read state of %s", self.ip_addr)
+            return False
+        current_time = self.answer_time(self.STATE_CMDS.index('time'))
+        return self._parse_state(ans, current_time)
+
+    async def refresh(self, *what, timeout=None):
+        if len(what) == 0:
+            what = self.REFRESH_CMDS.keys()
+        what = [w for w in self.REFRESH_CMDS if w in what]
+        ans = await self.cmd_get_answares([self.REFRESH_CMDS[w][0] for w in what], timeout)
+        for w, a in zip(what, ans):
+            if a is not None:
+                getattr(self, self.REFRESH_CMDS[w][1])(a)
+        return all(a is not None for a in ans)
+
+    async def _read_answare(self):
+        lines = []
+        while True:
+            l, end = self.parser.next_lines()
+            lines += l
+            if end is not None:
+                break
+            data = await self.reader.read(1 << 16)
+            if not data:
+                raise asyncio.IncompleteReadError(b'', None)
+            self.metrics.received(len(data))
+            self.parser.feed(data)
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("%s > %s %s", self.ip_addr, lines, "[OK]" if end else "[!!]")
+        return lines if end else None
+
+    async def cmd_get_answares(self, cmds, timeout=None, window=None, progress=None):
+        # Same pipelining as HeliosUnit.cmd_get_answares, timeout is for the
+        # whole batch.
+        timeout = self.timeout if timeout is None else timeout
+        if not await self.ensure_connected():
+            return [None] * len(cmds)
+        if window is None:
+            window = len(cmds)
+
+        for cmd in cmds:
+            log.debug("%s < %s", self.ip_addr, cmd)
+        answers = []
+        self.answer_window = []
+        async def _exchange():
+            sent = 0
+            sent_at = []
+            sent_wall = []
+            for cmd in cmds:
+                if sent < len(cmds) and sent - len(answers) < window:
+                    n = min(len(cmds), len(answers) + window)
+                    data = "".join("{:s}\n".format(c) for c in cmds[sent:n]).encode()
+                    self.writer.write(data)
+                    self.metrics.sent(len(data))
+                    sent_at += [time.monotonic()] * (n - sent)
+                    sent_wall += [time.time()] * (n - sent)
+                    sent = n
+                answers.append(await self._read_answare())
+                i = len(answers) - 1
+                start = sent_wall[i] if i == 0 else max(sent_wall[i], self.answer_window[-1][1])
+                self.answer_window.append((start, time.time()))
+                self.metrics.observe(cmd, time.monotonic() - sent_at[i], answers[-1] is not None)
+                self.session.activity()
+                if progress is not None:
+                    progress(len(answers), len(cmds))
+
+        async with self.lock:
+            if self.writer is None:
+                # Dropped by a concurrent batch
+                return [None] * len(cmds)
+            try:
+                await asyncio.wait_for(_exchange(), timeout)
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+                log.warning("No answare from %s", self.ip_addr)
+                if isinstance(e, asyncio.TimeoutError) and len(answers) < len(cmds):
+                    self.metrics.timeout(cmds[len(answers)])
+                # The stream is out of sync with the commands, drop it
+                self._drop_link()
+        return answers + [None] * (len(cmds) - len(answers))
+
+    async def cmd_get_answare(self, cmd, timeout=None):
+        return (await self.cmd_get_answares([cmd], timeout))[0]
+
+    async def solar_move(self, alt, azi, timeout=None):
+        return await self.cmd_get_answare("sc {:.1f} {:.1f}".format(alt, azi), timeout) is not None
+
+    async def set_ory(self, alt, azi, timeout=None):
+        return await self.cmd_get_answare("set-ory {:.1f} {:.1f}".format(alt, azi), timeout) is not None
+
+    async def absolute_move(self, alt, azi, timeout=None):
+        self.alt_setpoint = alt
+        self.azi_setpoint = azi
+        return await self.cmd_get_answare("mc {:.1f} {:.1f}".format(alt, azi), timeout) is not None
+
+    async def stop_move(self, timeout=None):
+        return await self.cmd_get_answare("stop", timeout) is not None
+
+    async def alt_move(self, t, s, timeout=None):
+        return await self.cmd_get_answare('alt-move {:d} {:d}'.format(t,s), timeout) is not None
+
+    async def azi_move(self, t, s, timeout=None):
+        return await self.cmd_get_answare('azi-move {:d} {:d}'.format(t,s), timeout) is not None
+
+    async def driver_on(self, timeout=None):
+        return await self.cmd_get_answare("driver-on", timeout) is not None
+
+    async def driver_off(self, timeout=None):
+        return await self.cmd_get_answare("driver-off", timeout) is not None
+
+    async def get_id(self, timeout=None):
+        return self._parse_id(await self.cmd_get_answare("id", timeout))
+
+    async def get_time(self, timeout=None):
+        return self._parse_time(await self.cmd_get_answare('time', timeout))
+
+    async def check_device_clock(self, tol=2.0, timeout=None):
+        # Compared with the local time halfway through the round trip
+        t0 = Time.now()
+        device_time = await self.get_time(timeout)
+        return self._check_clock(device_time, t0 + (Time.now() - t0) / 2., tol)
+
+    async def get_position(self, timeout=None):
+        return self._parse_position(await self.cmd_get_answare('current-position', timeout))
+
+    async def get_status(self, timeout=None):
+        ans = await self.cmd_get_answare("status", timeout)
+        if ans is None:
+            return None
+        return self._parse_status(ans)
+
+    async def battery_charge(self, timeout=None):
+        return self._parse_battery(await self.cmd_get_answare('battery', timeout))
+
+    async def get_geo(self, timeout=None):
+        return self._parse_geo(await self.cmd_get_answare("get-geo", timeout))
+
+    async def set_geo(self, lat, lon, timeout=None):
+        return await self.cmd_get_answare('set-geo {:.3f} {:.3f}'.format(lat, lon), timeout) is not None
+
+    async def get_cfg(self, timeout=None):
+        return self._parse_cfg(await self.cmd_get_answare('configs', timeout))
+
+    async def get_prm(self, key, timeout=None):
+        return self._parse_prm(await self.cmd_get_answare("get {:s}".format(key), timeout))
+
+    async def set_prm(self, key, value, timeout=None):
+        return await self.cmd_get_answare(self._set_prm_cmd(key, value), timeout) is not None
+
+    async def apply_config(self, changes, timeout=None):
+        # As HeliosUnit.apply_config
+        ans = await self.cmd_get_answares(self._config_cmds(changes), timeout)
+        return self._check_config(changes, ans)
+
+    async def reload_prm(self, timeout=None):
+        return await self.cmd_get_answare('reload-prm', timeout) is not None
+
+    async def get_list_scene(self, timeout=None):
+        ans = await self.cmd_get_answare('list-scene', timeout)
+        if ans is None:
+            return None
+        return self._parse_list_scene(ans)
+
+    async def get_scene(self, name, timeout=None):
+        if name in self.scenes:
+            s = self._cached_scene(name)
+            if s is None:
+                s = self._parse_scene(await self.cmd_get_answare('print-scene {:d}'.format(self.scenes[name]), timeout))
+                self._cache_scene(name, s)
+            return s
+
+    async def sync_scenes(self, timeout=None):
+        # As HeliosUnit.sync_scenes, the stale scenes are fetched in one batch
+        if self.scene_cache is None or await self.get_list_scene(timeout) is None:
+            return None
+        stale = self._stale_scenes()
+        ans = await self.cmd_get_answares(['print-scene {:d}'.format(self.scenes[n]) for n in stale], timeout)
+        if any(a is None for a in ans):
+            return None
+        for name, a in zip(stale, ans):
+            self._cache_scene(name, self._parse_scene(a))
+        return stale
+
+    async def delete_scene(self, name, timeout=None):
+        if name not in self.scenes:
+            log.warning("Scene name wrong %s", name)
+            return False
+        if self.scene_is_used(name):
+            log.warning("Scene is used!")
+            return False
+        if await self.cmd_get_answare('remove-scene {:d}'.format(self.scenes[name]), timeout) is None:
+            return False
+        self._forget_scene(name)
+        return True
+
+    async def make_room(self, n=1, keep=(), timeout=None):
+        evict = self._scenes_to_evict(n, keep)
+        if evict is None:
+            log.warning("No room for %d scenes on %s", n, self.ip_addr)
+            return None
+        if len(evict) > 0 and not self._check_evict(evict, await self.cmd_get_answares(self._evict_cmds(evict), timeout)):
+            return None
+        return evict
+
+    async def upload_scene(self, scene_name, data, progress=None, window=32, timeout=None, evict=False, tolerance=None):
+        if tolerance is not None:
+            data = self._decimate_scene(data, tolerance)
+        if self._scene_is_current(scene_name, data):
+            log.info("Scene %s is already on %s", scene_name, self.ip_addr)
+            return True
+        if not self._check_scene_data(scene_name, data):
+            return False
+        if evict and await self.make_room(1, timeout=timeout) is None:
+            return False
+        t0 = time.perf_counter()
+        scene_id = self._parse_new_scene(await self.cmd_get_answare('new-scene {:s}'.format(scene_name), timeout))
+        if scene_id is None:
+            log.warning("Error in scene creation")
+            return False
+        ans = await self.cmd_get_answares(self._upload_scene_cmds(scene_id, data), timeout, window, progress)
+        return self._check_upload(scene_name, scene_id, data, ans, time.perf_counter() - t0)
+
+    async def test_scene(self, scene, timeout=None):
+        self._touch_scenes(scene)
+        return await self.cmd_get_answare("test-scene {:s}".format(scene), timeout) is not None
+
+    async def test_sequence(self, scenes, timeout=None):
+        for s in scenes:
+            if s not in self.scenes:
+                log.warning("Scene %s is not present", s)
+                return None
+        self._touch_scenes(*scenes)
+        return await self.cmd_get_answare('run-test-sequence ' + ' '.join(scenes), timeout) is not None
+
+    async def get_schedule(self, timeout=None):
+        return self._parse_schedule(await self.cmd_get_answare('print-schedule', timeout))
+
+    async def add_schedule(self, s, timeout=None):
+        cmd = self._add_schedule_cmd(s.time.hour, s.time.minute, s.time.second, s.type, s.sequence, s.year, s.month, s.day)
+        if cmd is None:
+            return False
+        ans = await self.cmd_get_answares([cmd, 'save-schedule', 'print-schedule'], timeout)
+        self._parse_schedule(ans[2])
+        return ans[0] is not None and ans[1] is not None
+
+    async def remove_schedule(self, s, timeout=None):
+        ans = await self.cmd_get_answares(['delete-schedule {:d}'.format(s.id), 'save-schedule', 'print-schedule'], timeout)
+        self._parse_schedule(ans[2])
+        return ans[0] is not None and ans[1] is not None
+
+    async def get_wifi_conn(self, timeout=None):
+        ans = await self.cmd_get_answare('print-wifi', timeout)
+        if ans is None:
+            return None
+        return self._parse_wifi_conn(ans)
+
+    async def add_wifi_network(self, ssid, password, timeout=None):
+        ans = await self.cmd_get_answares(['add-wifi {:s} {:s}'.format(ssid, password), 'print-wifi', 'save-wifi'], timeout)
+        if ans[1] is not None:
+            self._parse_wifi_conn(ans[1])
+        return ans[0] is not None and ans[2] is not None
+
+    async def delete_wifi_network(self, ssid, timeout=None):
+        ans = await self.cmd_get_answares(['delete-wifi {:d}'.format(self.wifi_conn[ssid]), 'print-wifi', 'save-wifi'], timeout)
+        if ans[1] is not None:
+            self._parse_wifi_conn(ans[1])
+        return ans[0] is not None and ans[2] is not None
+
+    async def sync_rtc_ntp(self, timeout=None):
+        return await self.cmd_get_answare('sync-rtc-ntp', timeout) is not None
+
+    async def syslog(self, timeout=None):
+        ans = await self.cmd_get_answare('syslog', timeout)
+        if ans is None:
+            return None
+        return [a.strip() for a in ans]
+
+async def connect_fleet(addresses, timeout=10., settle=1.):
+    # Connects to all the (ip, nickname) pairs at once, None for the failures
+    return await asyncio.gather(*[AsyncHeliosUnit.create(ip, nickname, timeout=timeout, settle=settle)
+                                  for ip, nickname in addresses])
+
+if __name__ == "__main__":
+    import sys
+    async def _main():
+        units = await connect_fleet([(ip, None) for ip in sys.argv[1:]])
+        for h in units:
+            if h is not None:
+                print(h.nickname, await h.get_position(), await h.battery_charge())
+                await h.disconnect()
+    asyncio.run(_main())
@@ -0,0 +1,221 @@
+import numpy as np
+
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import platform
+import sys
+import time
+
+from helios_interface import *
+from helios_geometry import *
+from helios_trajectory import *
+from helios_ephemeris import sun_ephemeris_cache
+from helios_simulator import HeliosSimulatorPool
+
+# Benchmarks of the hot paths of the client, the protocol ones run against
+# local simulated units with injected latency. Results are written as JSON
+# and can be checked against a baseline run:
+#
+#   python helios_benchmark.py -o before.json
+#   ... change the code ...
+#   python helios_benchmark.py -o after.json --baseline before.json
+#
+# which prints the before/after table and exits with 1 if any benchmark got
+# slower than the baseline by more than the tolerance factor.
+
+BENCH_LOC = (11.34, 44.49)
+BENCH_TIME = '2024-06-21T10:00:00'
+
+def timeit(fn, number=1, repeat=5):
+    # Best time per call over repeat runs of number calls
+    best = np.inf
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        for j in range(number):
+            fn()
+        best = min(best, (time.perf_counter() - t0) / number)
+    return best
+
+def bench_scene(n=120):
+    t = np.linspace(0., 1., n)
+    return np.c_[20. + 30. * np.sin(np.pi * t), 100. + 80. * t]
+
+def bench_times(n):
+    start = np.datetime64(BENCH_TIME, 'us')
+    return start + np.arange(n) * np.timedelta64(60 * 10**6, 'us')
+
+def bench_ephemeris(quick):
+    res = {}
+    t = bench_times(1440)
+    for backend in ['astropy', 'noaa', 'cached']:
+        sun_ephemeris_cache.clear()
+        # The cache is measured warm, a table per day is built once
+        get_sun_position(BENCH_LOC, BENCH_TIME, backend=backend)
+        res['sun_position.{:s}.scalar'.format(backend)] = timeit(lambda: get_sun_position(BENCH_LOC, BENCH_TIME, backend=backend),
+                                                                 number=1 if backend == 'astropy' else 100,
+                                                                 repeat=3 if quick else 5)
+        res['sun_position.{:s}.day_1440'.format(backend)] = timeit(lambda: get_sun_position(BENCH_LOC, t, backend=backend),
+                                                                   repeat=3 if quick else 5)
+    return res
+
+def bench_geometry(quick):
+    res = {}
+    n = 1000
+    alt = np.random.default_rng(0).uniform(0., 90., n)
+    azi = np.random.default_rng(1).uniform(0., 360., n)
+    res['ory2mir.scalar'] = timeit(lambda: ory2mir(30., 120., BENCH_LOC, BENCH_TIME), number=20)
+    res['mir2ory.scalar'] = timeit(lambda: mir2ory(30., 120., BENCH_LOC, BENCH_TIME), number=20)
+    res['ory2mir.array_1000'] = timeit(lambda: ory2mir(alt, azi, BENCH_LOC, BENCH_TIME))
+    res['mir2ory.array_1000'] = timeit(lambda: mir2ory(alt, azi, BENCH_LOC, BENCH_TIME))
+    return res
+
+def bench_trajectory(quick):
+    res = {}
+    key_points = bench_scene(12)
+    res['interp_scene.12_points'] = timeit(lambda: interp_scene(key_points, 0.5, 0.5, 120), number=20)
+    c = interp_scene(key_points, 0.5, 0.5, 120)
+    res['scene_max_speed.120_frames'] = timeit(lambda: scene_max_speed(c, 0.5), number=100)
+    res['decimate_scene.120_frames'] = timeit(lambda: decimate_scene(c, 0.05, [4., 5.]), number=20)
+    res['check_scene_kinematics.120_frames'] = timeit(lambda: check_scene_kinematics(c, 0.5, [8., 10.], [20., 20.]), number=20)
+    res['retime_scene.120_frames'] = timeit(lambda: retime_scene(c, 0.5, [8., 10.], [20., 20.], 120), number=20)
+    return res
+
+def bench_parsing(quick):
+    # Offline parsing of typical answers, no I/O
+    res = {}
+    h = HeliosUnitBase()
+    h._init_state('bench')
+    cfg = ["{:s} {:f}".format(k, 1.) for k in list(HELIOS_FLOAT_EDITABLE_CFG) + list(HELIOS_INT_EDITABLE_CFG)
+           + HELIOS_INT_COMPTIME_CFG + HELIOS_FLOAT_COMPTIME_CFG]
+    h._parse_cfg(cfg)
+    scene = ["SCENE 0 bench 120"] + ["FRAME {:d} T {:d} {:.1f} {:.1f}".format(i, i * 500, a, z)
+                                     for i, (a, z) in enumerate(bench_scene())]
+    schedule = ["[{:d}] * * * {:02d}:{:02d}:00 sequence s1 s2".format(i, 6 + i // 2, (i % 2) * 30) for i in range(16)]
+    scenes = ["[{:d}] scene{:d} 120".format(i, i) for i in range(16)]
+    res['parse.configs'] = timeit(lambda: h._parse_cfg(cfg), number=100)
+    res['parse.print_scene_120'] = timeit(lambda: h._parse_scene(scene), number=100)
+    res['parse.print_schedule_16'] = timeit(lambda: h._parse_schedule(schedule), number=100)
+    res['parse.list_scene_16'] = timeit(lambda: h._parse_list_scene(scenes), number=100)
+
+    # Framing of a 10000 lines answer received in 4 kB reads
+    stream = "".join(l + "\n" for l in scene[1:] * 84).encode() + HELIOS_OK
+    def _stream():
+        p = HeliosStreamParser()
+        n = 0
+        for i in range(0, len(stream), 4096):
+            p.feed(stream[i:i+4096])
+            n += len(p.next_lines()[0])
+        return n
+    res['parse.stream_10000_lines'] = timeit(_stream, number=5)
+    return res
+
+def bench_protocol(quick, latency):
+    res = {}
+    pool = HeliosSimulatorPool()
+    try:
+        sim = pool.spawn(latency=latency)[0]
+        # Keep any client output out of the report
+        with contextlib.redirect_stdout(io.StringIO()):
+            res['bootstrap'] = timeit(lambda: HeliosUnit('127.0.0.1', port=sim.port, settle=0.).disconnect(),
+                                      repeat=2 if quick else 3)
+            h = HeliosUnit('127.0.0.1', port=sim.port, settle=0.)
+            res['cmd.id'] = timeit(h.get_id, number=5, repeat=3)
+            # max_age=0 forces the round trip, get_cfg is served from the cache otherwise
+            res['cmd.configs'] = timeit(lambda: h.get_cfg(max_age=0), number=5, repeat=3)
+            res['cmd.configs.cached'] = timeit(h.get_cfg, number=100, repeat=3)
+            res['cmd.print_schedule'] = timeit(h.get_schedule, number=5, repeat=3)
+
+            data = bench_scene()
+            def _upload():
+                assert h.upload_scene('bench', data)
+                h.delete_scene('bench')
+            res['upload_scene_120'] = timeit(_upload, repeat=2 if quick else 3)
+            h.upload_scene('bench', data)
+            res['cmd.print_scene_120'] = timeit(lambda: h.get_scene('bench'), number=3, repeat=3)
+            h.delete_scene('bench')
+            h.disconnect()
+    finally:
+        pool.close()
+    return res
+
+BENCH_GROUPS = {'ephemeris': bench_ephemeris,
+                'geometry': bench_geometry,
+                'trajectory': bench_trajectory,
+                'parsing': bench_parsing,
+                'protocol': bench_protocol}
+
+def run_benchmarks(groups=None, quick=False, latency=0.02):
+    if groups is None:
+        groups = list(BENCH_GROUPS)
+    results = {}
+    for g in groups:
+        if g == 'protocol':
+            results.update(BENCH_GROUPS[g](quick, latency))
+        else:
+            results.update(BENCH_GROUPS[g](quick))
+    return {'meta': {'date': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                     'python': platform.python_version(),
+                     'numpy': np.__version__,
+                     'machine': platform.machine(),
+                     'latency_s': latency,
+                     'quick': quick},
+            'results': results}
+
+def compare(base, new, tolerance=1.5):
+    # Returns the rows of the before/after table and the regressed names
+    rows = []
+    regressions = []
+    for k in sorted(new['results']):
+        t = new['results'][k]
+        t0 = base['results'].get(k)
+        if t0 is None:
+            rows += [(k, None, t, None)]
+            continue
+        rows += [(k, t0, t, t0 / t)]
+        if t > t0 * tolerance:
+            regressions += [k]
+    return rows, regressions
+
+def format_time(t):
+    if t is None:
+        return '-'
+    if t < 1e-3:
+        return "{:.1f} us".format(t * 1e6)
+    if t < 1.:
+        return "{:.2f} ms".format(t * 1e3)
+    return "{:.2f} s".format(t)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Helios client benchmarks")
+    parser.add_argument("-o", "--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="JSON results to compare with")
+    parser.add_argument("--tolerance", type=float, default=1.5,
+                        help="fail if a benchmark is this many times slower than the baseline")
+    parser.add_argument("--latency", type=float, default=0.02, help="simulated link latency [s]")
+    parser.add_argument("--groups", nargs='+', choices=list(BENCH_GROUPS), help="benchmark groups to run")
+    parser.add_argument("--quick", action='store_true', help="fewer repetitions")
+    args = parser.parse_args()
+
+    r = run_benchmarks(args.groups, args.quick, args.latency)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(r, f, indent=1, sort_keys=True)
+
+    if args.baseline is None:
+        for k in sorted(r['results']):
+            print("{:40s} {:>12s}".format(k, format_time(r['results'][k])))
+        sys.exit(0)
+
+    with open(args.baseline) as f:
+        base = json.load(f)
+    rows, regressions = compare(base, r, args.tolerance)
+    print("{:40s} {:>12s} {:>12s} {:>8s}".format("benchmark", "before", "after", "speedup"))
+    for k, t0, t, speedup in rows:
+        print("{:40s} {:>12s} {:>12s} {:>8s}".format(k, format_time(t0), format_time(t),
+                                                    '-' if speedup is None else "{:.2f}x".format(speedup)))
+    if len(regressions) > 0:
+        print("Regressions beyond {:.2f}x: {:s}".format(args.tolerance, ' '.join(regressions)))
+        sys.exit(1)
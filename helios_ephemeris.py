@@ -0,0 +1,205 @@
+import numpy as np
+
+import astropy.coordinates as coord
+from astropy.time import Time
+import astropy.units as u
+
+import time
+import threading
+from collections import OrderedDict
+
+# Solar ephemeris backends. Every backend takes longitude/latitude in degrees
+# and UTC times (isot strings, datetimes, datetime64 or unix seconds), scalar
+# or array, broadcast together, and returns (azimuth, altitude) in degrees.
+# 'astropy' is the high precision reference, 'noaa' is the closed-form NOAA
+# algorithm in pure NumPy (~0.01 deg, orders of magnitude faster) and
+# 'cached' (the default) interpolates daily tables built by SunEphemerisCache.
+
+def to_unix_seconds(t):
+    t = np.asarray(t)
+    if t.dtype.kind in 'fiu':
+        return t.astype(float)
+    return t.astype('datetime64[us]').astype(np.int64) / 1e6
+
+def sun_position_astropy(lon, lat, t):
+    t = Time(to_unix_seconds(t), format='unix')
+    loc = coord.EarthLocation(lon=np.asarray(lon) * u.deg,
+                              lat=np.asarray(lat) * u.deg)
+    altaz = coord.AltAz(location=loc, obstime=t)
+    sun = coord.get_sun(t).transform_to(altaz)
+    return sun.az.deg, sun.alt.deg
+
+def sun_position_noaa(lon, lat, t):
+    unix = to_unix_seconds(t)
+    lon = np.asarray(lon, dtype=float)
+    lat_rad = np.radians(np.asarray(lat, dtype=float))
+
+    jc = (unix / 86400. + 2440587.5 - 2451545.) / 36525.
+    mean_long = np.mod(280.46646 + jc * (36000.76983 + jc * 0.0003032), 360.)
+    mean_anom = np.radians(357.52911 + jc * (35999.05029 - 0.0001537 * jc))
+    ecc = 0.016708634 - jc * (0.000042037 + 0.0000001267 * jc)
+    eq_ctr = (np.sin(mean_anom) * (1.914602 - jc * (0.004817 + 0.000014 * jc))
+              + np.sin(2 * mean_anom) * (0.019993 - 0.000101 * jc)
+              + np.sin(3 * mean_anom) * 0.000289)
+    omega = np.radians(125.04 - 1934.136 * jc)
+    app_long = np.radians(mean_long + eq_ctr - 0.00569 - 0.00478 * np.sin(omega))
+    obliq = np.radians(23. + (26. + (21.448 - jc * (46.815 + jc * (0.00059 - jc * 0.001813))) / 60.) / 60.
+                       + 0.00256 * np.cos(omega))
+    decl = np.arcsin(np.sin(obliq) * np.sin(app_long))
+
+    y = np.tan(obliq / 2) ** 2
+    l0 = np.radians(mean_long)
+    eq_time = 4 * np.degrees(y * np.sin(2 * l0)
+                             - 2 * ecc * np.sin(mean_anom)
+                             + 4 * ecc * y * np.sin(mean_anom) * np.cos(2 * l0)
+                             - 0.5 * y * y * np.sin(4 * l0)
+                             - 1.25 * ecc * ecc * np.sin(2 * mean_anom))
+
+    true_solar_time = np.mod(unix / 60. + eq_time + 4 * lon, 1440.)
+    hour_angle = np.radians(true_solar_time / 4. - 180.)
+
+    alt = np.arcsin(np.sin(lat_rad) * np.sin(decl)
+                    + np.cos(lat_rad) * np.cos(decl) * np.cos(hour_angle))
+    az = np.arctan2(np.sin(hour_angle),
+                    np.cos(hour_angle) * np.sin(lat_rad) - np.tan(decl) * np.cos(lat_rad))
+    az = np.mod(np.degrees(az) + 180., 360.)
+    return az[()], np.degrees(alt)[()]
+
+class SunEphemerisCache:
+    # Per-site, per-UTC-day tables of the sun position sampled every step_s
+    # seconds in a single vectorized backend call, served by linear
+    # interpolation. Least recently used days are evicted beyond max_days.
+    def __init__(self, step_s=60., max_days=16, backend='astropy'):
+        self.step_s = step_s
+        self.max_days = max_days
+        self.backend = backend
+        self.tables = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evaluations = 0
+
+    def _table(self, lon, lat, day):
+        key = (round(float(lon), 4), round(float(lat), 4), int(day))
+        with self.lock:
+            tab = self.tables.get(key)
+            if tab is not None:
+                self.tables.move_to_end(key)
+                self.hits += 1
+                return tab
+            self.misses += 1
+
+        t = day * 86400. + np.arange(0., 86400. + self.step_s, self.step_s)
+        az, alt = SUN_POSITION_BACKENDS[self.backend](lon, lat, t)
+        tab = (np.unwrap(np.asarray(az), period=360.), np.asarray(alt))
+
+        with self.lock:
+            self.evaluations += t.shape[0]
+            self.tables[key] = tab
+            while len(self.tables) > self.max_days:
+                self.tables.popitem(last=False)
+        return tab
+
+    def _lookup(self, lon, lat, day, unix):
+        az, alt = self._table(lon, lat, day)
+        x = (unix - day * 86400.) / self.step_s
+        i = np.minimum(np.floor(x).astype(int), az.shape[0] - 2)
+        f = x - i
+        return (np.mod(az[i] * (1 - f) + az[i+1] * f, 360.),
+                alt[i] * (1 - f) + alt[i+1] * f)
+
+    def sun_position(self, lon, lat, t):
+        unix = to_unix_seconds(t)
+        if np.ndim(lon) == 0 and np.ndim(lat) == 0 and unix.ndim == 0:
+            az, alt = self._lookup(lon, lat, np.floor(unix / 86400.), unix)
+            return az[()], alt[()]
+
+        lon, lat, unix = np.broadcast_arrays(np.asarray(lon, dtype=float),
+                                             np.asarray(lat, dtype=float), unix)
+        az = np.empty(unix.shape)
+        alt = np.empty(unix.shape)
+        keys = np.stack((lon.ravel(), lat.ravel(), np.floor(unix.ravel() / 86400.)), axis=-1)
+        groups, inverse = np.unique(keys, axis=0, return_inverse=True)
+        inverse = inverse.reshape(unix.shape)
+        for g, (glon, glat, gday) in enumerate(groups):
+            sel = inverse == g
+            az[sel], alt[sel] = self._lookup(glon, glat, gday, unix[sel])
+        return az, alt
+
+    def stats(self):
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'evaluations': self.evaluations,
+                'tables': len(self.tables)}
+
+    def clear(self):
+        with self.lock:
+            self.tables.clear()
+
+sun_ephemeris_cache = SunEphemerisCache()
+
+SUN_POSITION_BACKENDS = {'astropy': sun_position_astropy,
+                         'noaa': sun_position_noaa,
+                         'cached': lambda lon, lat, t: sun_ephemeris_cache.sun_position(lon, lat, t)}
+
+sun_position_backend = 'cached'
+
+def set_sun_position_backend(name):
+    global sun_position_backend
+    assert name in SUN_POSITION_BACKENDS
+    sun_position_backend = name
+
+def sun_position(lon, lat, t, backend=None):
+    if backend is None:
+        backend = sun_position_backend
+    return SUN_POSITION_BACKENDS[backend](lon, lat, t)
+
+def compare_backends(loc, year=2024, step_s=3600., repeat=3):
+    start = np.datetime64('{:04d}-01-01T00:00:00'.format(year), 'us')
+    stop = np.datetime64('{:04d}-01-01T00:00:00'.format(year+1), 'us')
+    t = np.arange(start, stop, np.timedelta64(int(step_s * 1e6), 'us'))
+
+    res = {'n': t.shape[0]}
+    pos = {}
+    for name in ['astropy', 'noaa']:
+        best = np.inf
+        for i in range(repeat):
+            t0 = time.perf_counter()
+            pos[name] = sun_position(loc[0], loc[1], t, backend=name)
+            best = min(best, time.perf_counter() - t0)
+        res[name + '_s'] = best
+
+        t0 = time.perf_counter()
+        for ts in t[:100]:
+            sun_position(loc[0], loc[1], ts, backend=name)
+        res[name + '_scalar_s'] = (time.perf_counter() - t0) / 100
+
+    ref_az, ref_alt = pos['astropy']
+    az, alt = pos['noaa']
+    d_alt = np.abs(alt - ref_alt)
+    d_az = np.abs(np.mod(az - ref_az + 180., 360.) - 180.)
+    # Azimuth is ill defined near the zenith, weight it by the horizontal projection
+    d_az_proj = d_az * np.cos(np.radians(ref_alt))
+    up = ref_alt > 0
+    res['max_alt_err'] = d_alt.max()
+    res['rms_alt_err'] = np.sqrt(np.mean(d_alt ** 2))
+    res['max_azi_err'] = d_az_proj.max()
+    res['rms_azi_err'] = np.sqrt(np.mean(d_az_proj ** 2))
+    res['max_alt_err_day'] = d_alt[up].max()
+    res['max_azi_err_day'] = d_az_proj[up].max()
+    return res
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) >= 3:
+        loc = (float(sys.argv[1]), float(sys.argv[2]))
+    else:
+        loc = (11.34, 44.49)
+    year = int(sys.argv[3]) if len(sys.argv) >= 4 else 2024
+    r = compare_backends(loc, year)
+    print("Sun ephemeris report, lon {:.3f} lat {:.3f}, {:d} hourly samples in {:d}".format(loc[0], loc[1], r['n'], year))
+    print("  astropy: {:8.3f} ms vectorized, {:8.3f} ms per scalar call".format(r['astropy_s'] * 1e3, r['astropy_scalar_s'] * 1e3))
+    print("  noaa:    {:8.3f} ms vectorized, {:8.3f} ms per scalar call".format(r['noaa_s'] * 1e3, r['noaa_scalar_s'] * 1e3))
+    print("  speedup: {:.0f}x vectorized, {:.0f}x scalar".format(r['astropy_s'] / r['noaa_s'], r['astropy_scalar_s'] / r['noaa_scalar_s']))
+    print("  alt error: max {:.4f} deg, rms {:.4f} deg (sun up: max {:.4f} deg)".format(r['max_alt_err'], r['rms_alt_err'], r['max_alt_err_day']))
+    print("  azi error: max {:.4f} deg, rms {:.4f} deg (sun up: max {:.4f} deg, horizontal arc)".format(r['max_azi_err'], r['rms_azi_err'], r['max_azi_err_day']))
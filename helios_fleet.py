@@ -0,0 +1,265 @@
+import numpy as np
+
+import concurrent.futures
+import os
+import time
+
+from helios_interface import *
+
+# Fleet level operations on many HeliosUnit at once
+
+def read_fleet_config(fname='helios.config'):
+    # Lines are "<ip>[:<port>] <nickname>", lines with a # are skipped
+    fleet = []
+    with open(fname) as f:
+        for l in f:
+            if '#' in l or not l.strip():
+                continue
+            tok = l.strip().split()
+            fleet += [(tok[0], tok[1] if len(tok) > 1 else None)]
+    return fleet
+
+def split_address(addr, port=23):
+    if ':' in addr:
+        host, port = addr.rsplit(':', 1)
+        return host, int(port)
+    return addr, port
+
+class FleetLoadReport:
+    def __init__(self):
+        self.units = []
+        self.failed = {}
+        self.durations = {}
+        self.wall_time = 0.
+
+    def slowest(self, n=5):
+        return sorted(self.durations.items(), key=lambda x: -x[1])[:n]
+
+    def __str__(self):
+        s = "Loaded {:d} units in {:.2f} s".format(len(self.units), self.wall_time)
+        if len(self.failed) > 0:
+            s += ", {:d} failed".format(len(self.failed))
+        for name, err in self.failed.items():
+            s += "\n  FAILED {:s}: {:s}".format(name, err)
+        for name, dt in self.slowest():
+            s += "\n  {:s} {:.2f} s".format(name, dt)
+        return s
+
+def _bootstrap_unit(addr, nickname, timeout, settle):
+    t0 = time.perf_counter()
+    host, port = split_address(addr)
+    h = HeliosUnit(host, nickname, port=port, timeout=timeout, settle=settle)
+    return h, time.perf_counter() - t0
+
+def _close_abandoned(fut):
+    if fut.cancelled() or fut.exception() is not None:
+        return
+    h, dt = fut.result()
+    log.info("Closing %s, ready after %.1f s but already reported as failed", h.ip_addr, dt)
+    h.disconnect()
+
+def _duplicate_name(name, addr, taken):
+    # Report key of a duplicate fleet entry, distinct from the names taken
+    key = "{:s} ({:s})".format(name, addr)
+    i = 2
+    while key in taken:
+        key = "{:s} ({:s} #{:d})".format(name, addr, i)
+        i += 1
+    return key
+
+def load_fleet(fleet, max_workers=16, timeout=10, settle=1.):
+    # Bootstraps all the (address, nickname) pairs in parallel on a bounded
+    # pool. A unit failing or not ready within its time budget is reported
+    # in the FleetLoadReport without holding back the others. The units
+    # keep the order of the fleet list. An entry with the name or the
+    # address of an earlier one is reported as failed, not connected.
+    report = FleetLoadReport()
+    t0 = time.perf_counter()
+    # connect, settle and the bootstrap batch, each bounded by the timeout
+    budget = 3 * timeout + settle
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+    futures = []
+    names = set()
+    addrs = set()
+    for addr, nickname in fleet:
+        name = nickname if nickname is not None else addr
+        if name in names or split_address(addr) in addrs:
+            key = _duplicate_name(name, addr, set(report.failed) | names)
+            report.failed[key] = "duplicate fleet entry"
+            continue
+        names.add(name)
+        addrs.add(split_address(addr))
+        futures += [(name, executor.submit(_bootstrap_unit, addr, nickname, timeout, settle))]
+
+    for name, fut in futures:
+        # Units still queued when their turn comes get a full budget
+        try:
+            h, dt = fut.result(timeout=budget)
+            report.units += [h]
+            report.durations[name] = dt
+        except concurrent.futures.TimeoutError:
+            report.failed[name] = "not ready after {:.0f} s".format(budget)
+            # Reported as failed, so nobody owns the unit if its bootstrap
+            # still completes: close it then
+            fut.add_done_callback(_close_abandoned)
+        except Exception as e:
+            report.failed[name] = "{:s}: {:s}".format(type(e).__name__, str(e))
+    executor.shutdown(wait=False, cancel_futures=True)
+
+    report.wall_time = time.perf_counter() - t0
+    return report
+
+def load_fleet_from_file(fname='helios.config', **kwargs):
+    return load_fleet(read_fleet_config(fname), **kwargs)
+
+def load_scene_library(path, max_frames=120):
+    # Scenes of a directory, one per <name>.npy or <name>.csv file of
+    # (alt, azi) rows. Files that are not (n, 2) arrays are skipped.
+    library = {}
+    for fname in sorted(os.listdir(path)):
+        name, ext = os.path.splitext(fname)
+        try:
+            if ext == '.npy':
+                data = np.load(os.path.join(path, fname))
+            elif ext == '.csv':
+                data = np.loadtxt(os.path.join(path, fname), delimiter=',', ndmin=2)
+            else:
+                continue
+        except (OSError, ValueError) as e:
+            log.warning("Cannot read scene %s: %s", fname, str(e))
+            continue
+        if data.ndim != 2 or data.shape[1] != 2 or not 0 < data.shape[0] <= max_frames:
+            log.warning("Scene %s has wrong shape %s", fname, str(data.shape))
+            continue
+        library[name] = data.astype(float)
+    return library
+
+class SceneDistributionReport:
+    def __init__(self):
+        self.uploaded = {}
+        self.skipped = {}
+        self.failed = {}
+        self.frames = {}
+        self.durations = {}
+        self.wall_time = 0.
+
+    def total_frames(self):
+        return sum(self.frames.values())
+
+    def fps(self):
+        if self.wall_time == 0.:
+            return 0.
+        return self.total_frames() / self.wall_time
+
+    def __str__(self):
+        s = "Uploaded {:d} frames on {:d} units in {:.2f} s ({:.1f} frames/s)".format(
+            self.total_frames(), len(self.durations), self.wall_time, self.fps())
+        for name in list(self.durations) + [n for n in self.failed if n not in self.durations]:
+            s += "\n  {:s}: {:d} uploaded, {:d} up to date, {:.2f} s".format(
+                name, len(self.uploaded.get(name, [])), len(self.skipped.get(name, [])), self.durations.get(name, 0.))
+            for scene, err in self.failed.get(name, {}).items():
+                s += "\n    FAILED {:s}: {:s}".format(scene, err)
+        return s
+
+def _scenes_to_upload(h, library):
+    # Names of the library scenes the unit does not hold with the same
+    # frames: the scene cache answers if it can, otherwise the scenes with
+    # the same length are read back in one batch and compared
+    todo = []
+    check = []
+    for name, data in library.items():
+        if name not in h.scenes or h.scenes_frames.get(name) != data.shape[0]:
+            todo += [name]
+        elif not h._scene_is_current(name, data):
+            check += [name]
+    ans = h.cmd_get_answares(['print-scene {:d}'.format(h.scenes[n]) for n in check])
+    for name, a in zip(check, ans):
+        s = h._parse_scene(a)
+        h._cache_scene(name, s)
+        if s is None or s.shape != library[name].shape or \
+           not np.allclose(s, np.round(library[name], 1), atol=0.051):
+            todo += [name]
+    return todo
+
+def _distribute_unit(h, library, report, name, window, progress):
+    t0 = time.perf_counter()
+    report.uploaded[name] = []
+    report.skipped[name] = []
+    report.frames[name] = 0
+    failed = {}
+    if h.get_list_scene() is None:
+        failed['*'] = "cannot list scenes"
+        todo = []
+    else:
+        todo = _scenes_to_upload(h, library)
+        report.skipped[name] = [n for n in library if n not in todo]
+
+    # Room for all the new scenes at once, never evicting library ones
+    if h.make_room(len([n for n in todo if n not in h.scenes]), keep=library) is None:
+        failed['*'] = "not enough free scene slots"
+        todo = [n for n in todo if n in h.scenes]
+
+    total = sum(library[n].shape[0] for n in todo)
+    done = 0
+    for scene in todo:
+        if scene in h.scenes:
+            # Changed content, the old copy goes first
+            h.delete_scene(scene)
+            if scene in h.scenes:
+                failed[scene] = "old copy cannot be deleted"
+                continue
+        n = library[scene].shape[0]
+        def _progress(i, tot, done=done):
+            if progress is not None:
+                progress(name, done + min(i, n), total)
+        if h.upload_scene(scene, library[scene], progress=_progress, window=window, evict=False):
+            report.uploaded[name] += [scene]
+            report.frames[name] += n
+        else:
+            failed[scene] = "upload failed"
+        done += n
+        if progress is not None:
+            progress(name, done, total)
+    if failed:
+        report.failed[name] = failed
+    report.durations[name] = time.perf_counter() - t0
+
+def distribute_scenes(units, library, max_workers=8, window=32, progress=None):
+    # Makes every unit hold all the scenes of library (name -> frames, see
+    # load_scene_library), uploading only what is missing or different.
+    # Units are served in parallel, at most max_workers at a time, each by
+    # a single thread. progress(unit name, frames done, frames to upload)
+    # is called from the worker threads.
+    report = SceneDistributionReport()
+    t0 = time.perf_counter()
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+    futures = []
+    names = set()
+    addrs = set()
+    for h in units:
+        name = h.nickname if h.nickname is not None else h.ip_addr
+        if name in names or (h.ip_addr, h.port) in addrs:
+            # Two threads would share one unit, or the report one name
+            key = _duplicate_name(name, h.ip_addr, set(report.failed) | names)
+            report.failed[key] = {'*': "duplicate unit"}
+            continue
+        names.add(name)
+        addrs.add((h.ip_addr, h.port))
+        futures += [(name, executor.submit(_distribute_unit, h, library, report, name, window, progress))]
+    for name, fut in futures:
+        try:
+            fut.result()
+        except Exception as e:
+            report.failed[name] = {'*': "{:s}: {:s}".format(type(e).__name__, str(e))}
+    executor.shutdown()
+    report.wall_time = time.perf_counter() - t0
+    return report
+
+if __name__ == "__main__":
+    # helios_fleet.py [fleet config [scene directory]]
+    import sys
+    report = load_fleet_from_file(sys.argv[1] if len(sys.argv) > 1 else 'helios.config')
+    print(report)
+    if len(sys.argv) > 2:
+        print(distribute_scenes(report.units, load_scene_library(sys.argv[2])))
@@ -0,0 +1,63 @@
+import numpy as np
+
+from helios_interface import get_sun_position
+
+# Mirror and ray geometry. All the kernels broadcast: alt/azi can be scalars
+# or arrays of any shape and vectors are arrays with the 3 components on the
+# last axis, so a whole scene or a full day of sun positions for many mirrors
+# is converted in one call, e.g. ory2mir(alt[:, None], azi[:, None], loc, t)
+# with t an array of times gives one (N, M) alt/azi pair per mirror and time.
+
+def sc2a(s, c):
+    a = np.asin(s)
+    a = np.where(c < 0, np.pi - a, a)
+    return a[()]
+
+def absolute_to_geo(v):
+    v = np.asarray(v)
+    absolute_alt_cosine = np.sqrt(v[..., 0] * v[..., 0] + v[..., 1] * v[..., 1])
+    absolute_alt_sine = v[..., 2]
+    absolute_alt = sc2a(absolute_alt_sine, absolute_alt_cosine)
+
+    absolute_azi_sine = v[..., 1] / absolute_alt_cosine
+    absolute_azi_cosine = v[..., 0] / absolute_alt_cosine
+    absolute_azi = sc2a(absolute_azi_sine, absolute_azi_cosine)
+    absolute_azi = 90.0 - absolute_azi * 180/np.pi
+    return absolute_alt * 180/np.pi, absolute_azi
+
+def geo_to_absolute(alt, azi):
+    azi_rad = np.asarray(azi) * np.pi / 180.
+    absolute_azi_rad = np.pi/2 - azi_rad
+    absolute_alt_rad = np.asarray(alt) * np.pi/180
+
+    return np.stack(np.broadcast_arrays(np.cos(absolute_alt_rad) * np.cos(absolute_azi_rad),
+                                        np.cos(absolute_alt_rad) * np.sin(absolute_azi_rad),
+                                        np.sin(absolute_alt_rad)), axis=-1)
+
+def get_sun_unit_vec(loc, t):
+    azi, alt = get_sun_position(loc, t)
+    return geo_to_absolute(alt, azi)
+
+def get_normal_vec(sun, ory):
+    norm = np.sum(sun * ory, axis=-1, keepdims=True)
+    norm = -2 * np.sqrt((1+norm)/2.)
+    mir = (-sun - ory)/norm
+    return mir
+
+def get_reflected_vec(sun, mir):
+    norm = np.sum(mir * sun, axis=-1, keepdims=True)
+    ory = -sun + 2*norm*mir
+    return ory
+
+def ory2mir(alt, azi, loc, t):
+    ory = geo_to_absolute(alt, azi)
+    sun = get_sun_unit_vec(loc, t)
+
+    mir = get_normal_vec(sun, ory)
+    return absolute_to_geo(mir)
+
+def mir2ory(alt, azi, loc, t):
+    mir = geo_to_absolute(alt, azi)
+    sun = get_sun_unit_vec(loc, t)
+    ory = get_reflected_vec(sun, mir)
+    return absolute_to_geo(ory)
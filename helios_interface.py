@@ -1,23 +1,26 @@
 import numpy as np
 
-import astropy.coordinates as coord
 from astropy.time import Time
-import astropy.units as u
 
 import time
-import telnetlib
+try:
+    import telnetlib
+except ImportError:
+    # Removed from the standard library in Python 3.13, AsyncHeliosUnit
+    # does not need it
+    telnetlib = None
 import datetime
+import select
+import logging
 
-def get_sun_position(loc, t):
-    t = Time(t, format='isot')
-    loc = coord.EarthLocation(lon=loc[0] * u.deg,
-                                         lat=loc[1] * u.deg)
-    altaz = coord.AltAz(location=loc, obstime=t)
-    sun = coord.get_sun(t)
+from helios_ephemeris import sun_position, set_sun_position_backend
+from helios_protocol import *
+from helios_metrics import *
+from helios_scene_cache import *
+from helios_trajectory import decimate_scene, check_scene_kinematics, retime_scene
 
-    alt = sun.transform_to(altaz).alt.deg
-    az = sun.transform_to(altaz).az.deg
-    return az, alt
+def get_sun_position(loc, t, backend=None):
+    return sun_position(loc[0], loc[1], t, backend=backend)
 
 HELIOS_FLOAT_EDITABLE_CFG = {
  "ALT_ENCODER_ZERO": "alte0",
@@ -31,7 +34,7 @@ HELIOS_FLOAT_EDITABLE_CFG = {
  "AZI_MAX_SPEED_VALUE":  "azi_Msv",
  "AZI_VOLT_TO_DEG": "aziv2d",
  "ALT_MAX_SPEED_VALUE": "alt_Msv",
- "ALT_VOLT_TO_DEG": "aziv2d",
+ "ALT_VOLT_TO_DEG": "altv2d",
  "SPEED_TO_PWM_ALT": "alt_s2p",
  "SPEED_TO_PWM_AZI": "azi_s2p",
  "SLEEP_ALT": "altnap",
@@ -47,6 +50,9 @@ HELIOS_INT_EDITABLE_CFG = {"ENCODER_OVERSAMPLING": 'overs',
                             "LOG_LEVEL": 'logl',
                             "LOG_DELETE_AFTER_DAYS": 'logr'}
 
+# Short parameter names of get/set to configs names
+HELIOS_PRM_CFG = {v: k for k, v in list(HELIOS_FLOAT_EDITABLE_CFG.items()) + list(HELIOS_INT_EDITABLE_CFG.items())}
+
 HELIOS_INT_COMPTIME_CFG = ["MAX_BLIND_MOVE_TIME_MS",
 "MAX_DAILY_TASKS",
 "MAX_LOG_FILES",
@@ -118,17 +124,216 @@ class HeliosSchedule:
             s += ' [{:04d}/{:02d}/{:02d}]'.format(self.year, self.day, self.month)
         return s
 
-class HeliosUnit:
-    def __init__(self, ip_addr, nickname=None):
-        self.ip_addr = ip_addr
+class HeliosSession:
+    # Link state of one unit, without any I/O: the clients report connects,
+    # traffic and failures and ask here whether a reconnect may be tried.
+    # Reconnects back off exponentially, after max_failures consecutive
+    # failures the circuit opens and the unit fails fast for open_time
+    # seconds, then a single attempt is allowed (and reopens it on failure).
+    CONNECTED = 'connected'
+    DISCONNECTED = 'disconnected'
+    OPEN = 'open'
+
+    def __init__(self, backoff=0.5, max_backoff=30., max_failures=3, open_time=60.):
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_failures = max_failures
+        self.open_time = open_time
+
+        self.state = self.DISCONNECTED
+        self.failures = 0
+        self.reconnects = 0
+        self.next_attempt = 0.
+        self.last_activity = time.monotonic()
+
+    def connected(self):
+        # Failures are cleared by the first answer, not by the connection
+        self.state = self.CONNECTED
+        self.last_activity = time.monotonic()
+
+    def closed(self):
+        # Clean disconnection, the next command reconnects right away
+        self.state = self.DISCONNECTED
+        self.failures = 0
+        self.next_attempt = 0.
+
+    def activity(self):
+        self.last_activity = time.monotonic()
+        if self.failures > 0:
+            self.reconnects += 1
+            self.failures = 0
+
+    def failed(self):
+        self.failures += 1
+        now = time.monotonic()
+        if self.failures >= self.max_failures:
+            self.state = self.OPEN
+            self.next_attempt = now + self.open_time
+        else:
+            self.state = self.DISCONNECTED
+            self.next_attempt = now + min(self.max_backoff, self.backoff * 2 ** (self.failures - 1))
 
-        self.connect()
+    def can_attempt(self):
+        return self.state != self.CONNECTED and time.monotonic() >= self.next_attempt
 
-        self.id = self.get_id()
-        if nickname is None:
-            self.nickname = self.id
-        else:
-            self.nickname = nickname
+    def idle_time(self):
+        return time.monotonic() - self.last_activity
+
+    def needs_keepalive(self, watchdog):
+        # The unit drops telnet sessions silent for watchdog seconds
+        return self.state == self.CONNECTED and self.idle_time() >= watchdog / 2
+
+    def __str__(self):
+        if self.state == self.CONNECTED:
+            return "connected, idle {:.0f} s".format(self.idle_time())
+        return "{:s}, {:d} failures, retry in {:.0f} s".format(self.state, self.failures,
+                                                               max(0., self.next_attempt - time.monotonic()))
+
+class HeliosStateCache:
+    # Last answers to the read-only queries, each served again until its
+    # time to live (s) expires. Commands changing the unit state invalidate
+    # what they affect, see HeliosUnit.
+    TTL = {'status': 5.,
+           'position': 1.,
+           'battery': 60.,
+           'cfg': 600.}
+
+    def __init__(self, ttl=None):
+        self.ttl = dict(self.TTL)
+        if ttl is not None:
+            self.ttl.update(ttl)
+        self.values = {}
+        self.hits = 0
+        self.misses = 0
+
+    def put(self, field, value):
+        self.values[field] = (time.monotonic(), value)
+
+    def get(self, field, max_age=None):
+        # The cached value, None if missing or older than max_age (the TTL
+        # of the field by default)
+        if max_age is None:
+            max_age = self.ttl.get(field, 0.)
+        if field in self.values:
+            t, value = self.values[field]
+            if time.monotonic() - t < max_age:
+                self.hits += 1
+                return value
+        self.misses += 1
+        return None
+
+    def invalidate(self, *fields):
+        # All the fields if none is given
+        if len(fields) == 0:
+            self.values = {}
+        for f in fields:
+            self.values.pop(f, None)
+
+class HeliosConfigResult:
+    # Outcome of a config transaction: the keys verified in the configs read
+    # back after reload-prm, and the reason for each key that was not
+    def __init__(self):
+        self.applied = []
+        self.failed = {}
+        self.reloaded = False
+
+    def ok(self):
+        return self.reloaded and len(self.failed) == 0
+
+    def __str__(self):
+        s = "Applied {:d} parameters".format(len(self.applied))
+        if not self.reloaded:
+            s += ", reload-prm failed"
+        for k, err in self.failed.items():
+            s += "\n  FAILED {:s}: {:s}".format(k, err)
+        return s
+
+class HeliosConfigTransaction:
+    # Parameter changes staged and then applied in one pipelined burst:
+    # all the set commands, a single reload-prm and configs to verify.
+    #
+    #   tx = h.config_transaction()
+    #   tx.set('alte0', 12.5)
+    #   tx.set('ALT_KP', 0.8)
+    #   res = tx.commit()       # HeliosConfigResult
+    def __init__(self, unit):
+        self.unit = unit
+        self.changes = {}
+
+    def set(self, key, value):
+        # key is a get/set name (alte0) or a configs one (ALT_ENCODER_ZERO),
+        # values of the wrong type are not staged
+        key = config_prm_name(key)
+        if key is None:
+            return False
+        value = check_prm_value(key, value)
+        if value is None:
+            return False
+        self.changes[key] = value
+        return True
+
+    def commit(self):
+        res = self.unit.apply_config(self.changes)
+        self.changes = {}
+        return res
+
+def config_prm_name(key):
+    # The get/set name of a parameter, None if it is not editable
+    if key in HELIOS_FLOAT_EDITABLE_CFG:
+        return HELIOS_FLOAT_EDITABLE_CFG[key]
+    if key in HELIOS_INT_EDITABLE_CFG:
+        return HELIOS_INT_EDITABLE_CFG[key]
+    if key in HELIOS_PRM_CFG:
+        return key
+    log.warning("Parameter %s is not editable", key)
+    return None
+
+def check_prm_value(key, value):
+    # The value converted to the type of key, None if it does not fit
+    if isinstance(value, (bool, np.bool_)):
+        log.warning("Wrong value %r for %s", value, key)
+        return None
+    try:
+        v = float(value)
+    except (TypeError, ValueError):
+        log.warning("Wrong value %r for %s", value, key)
+        return None
+    if not np.isfinite(v):
+        log.warning("Wrong value %r for %s", value, key)
+        return None
+    if key in HELIOS_INT_EDITABLE_CFG.values():
+        if not v.is_integer():
+            log.warning("Parameter %s must be an integer, not %r", key, value)
+            return None
+        return int(v)
+    return v
+
+class HeliosUnitBase:
+    # Unit state and answer parsing, shared by the blocking HeliosUnit and
+    # the asyncio AsyncHeliosUnit which only differ in how they do I/O.
+    STATE_CMDS = ['id', 'get-geo', 'configs', 'current-position', 'list-scene',
+                  'print-wifi', 'print-schedule', 'time']
+
+    # State groups that can be re-read with refresh(), in reading order
+    # (scene lengths need SCENE_DT from the configs)
+    REFRESH_CMDS = {'geo': ('get-geo', '_parse_geo'),
+                    'cfg': ('configs', '_parse_cfg'),
+                    'position': ('current-position', '_parse_position'),
+                    'scenes': ('list-scene', '_parse_list_scene'),
+                    'wifi': ('print-wifi', '_parse_wifi_conn'),
+                    'schedule': ('print-schedule', '_parse_schedule')}
+
+    def _init_state(self, ip_addr, nickname=None):
+        self.ip_addr = ip_addr
+        self.nickname = nickname
+        self.session = HeliosSession()
+        self.metrics = HeliosMetrics()
+        self.cache = HeliosStateCache()
+        # Local (unix) times bracketing each answer of the last batch, see
+        # answer_time
+        self.answer_window = []
+        # Optional SceneCache of the scene frames
+        self.scene_cache = None
 
         self.alt = np.nan
         self.azi = np.nan
@@ -140,77 +345,286 @@ class HeliosUnit:
         self.sequence_dt = 0.5
 
         self.cfg = {}
+        self.scenes = {}
+        self.scenes_len = {}
+        self.scenes_frames = {}
+        # Unix time of the last upload or test run of each scene
+        self.scene_use = {}
+        self.schedule = []
+        self.wifi_conn = {}
+        self.wifi_pass = {}
+
+    def _parse_state(self, ans, current_time):
+        # ans are the answers to STATE_CMDS
+        self.id = self._parse_id(ans[0])
+        if self.nickname is None:
+            self.nickname = self.id
 
-        self.get_geo()
-        self.get_cfg()
-        self.get_position()
-        self.get_list_scene()
-        self.get_wifi_conn()
-        self.get_schedule()
+        self._parse_geo(ans[1])
+        self._parse_cfg(ans[2])
+        self._parse_position(ans[3])
+        self._parse_list_scene(ans[4])
+        self._parse_wifi_conn(ans[5])
+        self._parse_schedule(ans[6])
 
         self.alt_setpoint = self.alt
         self.azi_setpoint = self.azi
 
-        #assert self.check_sun_position()
-        assert self.check_device_clock()
+        return self._check_clock(self._parse_time(ans[7]), current_time)
 
-    def __del__(self):
-        self.disconnect()
+    def answer_time(self, i):
+        # Local time at which the unit ran command i of the last batch: the
+        # midpoint between the earliest it could have started it (sent, and
+        # the previous answer in) and its answer
+        if i >= len(self.answer_window):
+            return Time.now()
+        t0, t1 = self.answer_window[i]
+        return Time((t0 + t1) / 2., format='unix')
 
-    def reboot(self):
-        self.cmd_get_answare("reboot", 0)
-        time.sleep(10)
+    def _check_clock(self, device_time, current_time, tol=2.0):
+        delta = device_time-current_time
+        try:
+            assert delta.to_value('sec') < tol
+        except AssertionError:
+            log.warning("Device clock %s, local clock %s", device_time, current_time)
+            return False
+        return True
 
-    def connect(self):
+    def _set_prm_cmd(self, key, value):
+        if key in HELIOS_INT_EDITABLE_CFG.values():
+            return "set {:s} {:d}".format(key, value)
+        else:
+            return "set {:s} {:f}".format(key, value)
+
+    def _config_cmds(self, changes):
+        return [self._set_prm_cmd(k, v) for k, v in changes.items()] + ['reload-prm', 'configs']
+
+    def _check_config(self, changes, ans):
+        # ans are the answers to _config_cmds(changes)
+        res = HeliosConfigResult()
+        res.reloaded = ans[-2] is not None
+        cfg = self._parse_cfg(ans[-1])
+        for (k, v), a in zip(changes.items(), ans):
+            name = HELIOS_PRM_CFG[k]
+            if a is None:
+                res.failed[k] = "rejected"
+            elif cfg is None or name not in cfg:
+                res.failed[k] = "not verified"
+            elif not np.isclose(cfg[name], v, rtol=1e-6, atol=2e-6):
+                res.failed[k] = "reads {:f}".format(cfg[name])
+            else:
+                res.applied += [k]
+        if not res.ok():
+            log.warning("Config of %s: %s", self.ip_addr, str(res))
+        return res
+
+    def _parse_prm(self, ans):
         try:
-            self.tn = telnetlib.Telnet(self.ip_addr, timeout=10)
-        except TimeoutError:
-            self.tn = None
+            assert ans is not None and len(ans) == 1
+        except AssertionError:
+            log.warning("Wrong answare from get")
+            return False
+        s = ans[0].strip().split()[2]
+        return float(s)
 
-        self.tn.read_until("> ".encode(encoding='ascii'))
-        time.sleep(1.)
-        self.cmd_get_answare("")
+    def _parse_status(self, ans):
+        if ans is None:
+            return None
+        res = {'ntp': False, 'rtc': False, 'adc': False, 'intrtc': False}
+        if ans[0].startswith('NTP: OK'):
+            res['ntp'] = True
+        if ans[1].startswith('RTC: OK'):
+            res['rtc'] = True
+        if ans[2].startswith('internal RTC: OK'):
+            res['intrtc'] = True
+        if ans[3].startswith('external ADC: OK'):
+            res['adc'] = True
+        if ans[4].startswith('driver is ON'):
+            res['driver'] = True
+        else:
+            res['driver'] = False
+        return res
 
-    def solar_move(self, alt, azi):
-        self.cmd_get_answare("sc {:.1f} {:.1f}".format(alt, azi))
+    def _parse_battery(self, ans):
+        if ans is None:
+            return -1.
+        return float(ans[0].strip().split()[0])
 
-    def set_ory(self, alt, azi):
-        self.cmd_get_answare("set-ory {:.1f} {:.1f}".format(alt, azi))
+    def _parse_new_scene(self, ans):
+        if ans is None:
+            return None
+        scene_id = int(ans[0].strip().split()[3])
+        return scene_id
 
-    def get_id(self):
-        ans = self.cmd_get_answare("id")
+    def _forget_scene(self, name):
+        scene_id = self.scenes[name]
+        for sn in self.scenes:
+            if self.scenes[sn] > scene_id:
+                self.scenes[sn] -= 1
+        del self.scenes[name]
+        self.scenes_len.pop(name, None)
+        self.scenes_frames.pop(name, None)
+        self.scene_use.pop(name, None)
+        if self.scene_cache is not None:
+            self.scene_cache.forget(self._scene_cache_id(), name)
+
+    def _scene_cache_id(self):
+        # Scenes are cached per unit id, the address if it is unknown
+        uid = getattr(self, 'id', None)
+        if isinstance(uid, str) and uid:
+            return uid
+        return self.ip_addr
+
+    def _cached_scene(self, name):
+        # The cached frames of a scene of the unit, if still valid
+        if self.scene_cache is None or name not in self.scenes:
+            return None
+        return self.scene_cache.get(self._scene_cache_id(), name, self.scenes_frames.get(name))
+
+    def _cache_scene(self, name, data):
+        if self.scene_cache is not None and data is not None:
+            self.scene_cache.put(self._scene_cache_id(), name, data)
+
+    def _scene_is_current(self, name, data):
+        # Whether the unit already holds these frames as scene name
+        return self.scene_cache is not None and name in self.scenes and \
+            self.scenes_frames.get(name) == len(data) and \
+            self.scene_cache.holds(self._scene_cache_id(), name, data)
+
+    def _stale_scenes(self):
+        # Scenes of the unit missing from the cache or with another length,
+        # forgets the cached scenes the unit does not have any more
+        uid = self._scene_cache_id()
+        for name in self.scene_cache.names(uid):
+            if name not in self.scenes:
+                self.scene_cache.forget(uid, name)
+        stale = []
+        for name in self.scenes:
+            e = self.scene_cache.entry(uid, name)
+            if e is None or e['frames'] != self.scenes_frames.get(name):
+                stale += [name]
+        return stale
+
+    def _check_scene_data(self, scene_name, data):
         try:
-            assert ans is not None and len(ans) == 1
+            assert scene_name not in self.scenes
+        except AssertionError:
+            log.warning("This scene name is already used")
+        try:
+            assert data.shape[0] <= 120 and data.shape[1] == 2
         except AssertionError:
-            print("Wrong answare from id")
+            log.warning("Data has wrong shape")
             return False
-        return ans[0]
+        return True
 
-    def get_time(self):
-        ans = self.cmd_get_answare('time')
-        return Time(ans[1], format='isot')
+    def _decimate_scene(self, data, tolerance):
+        # decimate_scene within tolerance degrees, with the moves between
+        # frames bounded by the axis speeds of the unit. That does not bound
+        # the accelerations, so the result is checked with
+        # check_scene_kinematics: if decimating made the scene too fast it is
+        # decimated again with shorter moves, and uploaded whole if that
+        # does not help either.
+        lim = self.scene_limits()
+        if lim is None:
+            data, self.last_decimation = decimate_scene(data, tolerance)
+        else:
+            max_speed, max_accel, dt = lim
+            max_step = max_speed * dt
+            before = check_scene_kinematics(data, dt, max_speed, max_accel)
+            for i in range(4):
+                out, report = decimate_scene(data, tolerance, max_step)
+                report['violations'] = check_scene_kinematics(out, dt, max_speed, max_accel)
+                if len(report['violations']) <= len(before):
+                    break
+                max_step = max_step / 2.
+            else:
+                log.warning("Decimated scene too fast for %s, keeping all the frames", self.ip_addr)
+                out = np.asarray(data, dtype=float)
+                report = {'frames_in': len(out), 'frames_out': len(out), 'reduction': 0.,
+                          'max_deviation': 0., 'violations': before}
+            data, self.last_decimation = out, report
+            if len(report['violations']) > 0:
+                log.warning("Scene too fast for %s: %d violations, first at frame %d",
+                            self.ip_addr, len(report['violations']), report['violations'][0]['frame'])
+        log.info("Scene decimated from %d to %d frames, max deviation %.3f deg",
+                 self.last_decimation['frames_in'], self.last_decimation['frames_out'],
+                 self.last_decimation['max_deviation'])
+        return data
+
+    def scene_limits(self):
+        # ([alt, azi] max speed deg/s, [alt, azi] max acceleration deg/s^2,
+        # frame period s) from the configs, None if they are not known
+        keys = ['ALT_MAX_SPEED_VALUE', 'AZI_MAX_SPEED_VALUE', 'ALT_SCENE_ACCEL', 'AZI_SCENE_ACCEL', 'SCENE_DT']
+        if not all(k in self.cfg for k in keys):
+            return None
+        return (np.array([self.cfg['ALT_MAX_SPEED_VALUE'], self.cfg['AZI_MAX_SPEED_VALUE']]),
+                np.array([self.cfg['ALT_SCENE_ACCEL'], self.cfg['AZI_SCENE_ACCEL']]),
+                self.cfg['SCENE_DT'] / 1000.)
+
+    def check_scene(self, data):
+        # Frames of data the axes of the unit cannot follow, see
+        # check_scene_kinematics
+        lim = self.scene_limits()
+        if lim is None:
+            return None
+        max_speed, max_accel, dt = lim
+        return check_scene_kinematics(data, dt, max_speed, max_accel)
+
+    def retime_scene(self, data):
+        # The path of data played as fast as the unit allows, see
+        # retime_scene in helios_trajectory. (frames, report), None if the
+        # limits are not known.
+        lim = self.scene_limits()
+        if lim is None:
+            return None
+        max_speed, max_accel, dt = lim
+        return retime_scene(data, dt, max_speed, max_accel, int(self.cfg.get('SCENE_LEN', self.sequence_max)))
 
-    def set_geo(self, lat, lon):
-        return self.cmd_get_answare('set-geo {:.3f} {:.3f}'.format(lat, lon)) is not None
+    def _upload_scene_cmds(self, scene_id, data):
+        cmds = ['add-frame-scene {:d} {:.1f} {:.1f}'.format(scene_id, fr[0], fr[1]) for fr in data]
+        cmds += ['write-scene {:d}'.format(scene_id), 'print-scene {:d}'.format(scene_id)]
+        return cmds
 
-    def set_prm(self, key:str, value):
-        if key in HELIOS_INT_EDITABLE_CFG.values():
-            ans = self.cmd_get_answare("set {:s} {:d}".format(key, value))
-        else:
-            ans = self.cmd_get_answare("set {:s} {:f}".format(key, value))
+    def _check_upload(self, scene_name, scene_id, data, ans, dt):
+        if any(a is None for a in ans[:data.shape[0]]):
+            log.warning("Error in uploading data")
+            return False
+        if ans[-2] is None:
+            log.warning("Error in saving")
+            return False
+        uploaded = self._parse_scene(ans[-1])
         try:
-            assert ans is not None
+            assert uploaded is not None and uploaded.shape == data.shape
+            assert np.allclose(uploaded, np.round(data, 1), atol=0.051)
         except AssertionError:
-            print("Wrong answare from set")
+            log.warning("Uploaded scene does not match")
             return False
+
+        self.last_upload = {'frames': data.shape[0], 'seconds': dt, 'fps': data.shape[0] / dt}
+        log.info("Uploaded %d frames in %.2f s (%.1f frames/s)", data.shape[0], dt, data.shape[0] / dt)
+        self.scenes[scene_name] = scene_id
+        self.scenes_len[scene_name] = data.shape[0] * self.cfg['SCENE_DT']
+        self.scenes_frames[scene_name] = data.shape[0]
+        self._touch_scenes(scene_name)
+        self._cache_scene(scene_name, uploaded)
         return True
 
-    def get_geo(self):
-        ans = self.cmd_get_answare("get-geo")
+    def _parse_id(self, ans):
         try:
             assert ans is not None and len(ans) == 1
         except AssertionError:
-            print("Wrong answare from get-geo")
+            log.warning("Wrong answare from id")
+            return False
+        return ans[0]
+
+    def _parse_time(self, ans):
+        return Time(ans[1], format='isot')
+
+    def _parse_geo(self, ans):
+        try:
+            assert ans is not None and len(ans) == 1
+        except AssertionError:
+            log.warning("Wrong answare from get-geo")
             return False
 
         tok = ans[0].split()
@@ -223,137 +637,516 @@ class HeliosUnit:
         self.lon = res['lon']
         return res
 
-    def get_prm(self, key):
-        ans = self.cmd_get_answare("get {:s}".format(key))
+    def _parse_cfg(self, ans):
+        if ans is None:
+            return None
+        cfg = {}
+        for a in ans:
+            cfg[a.split()[0]] = float(a.split()[1])
+        self.cfg = cfg
+        self.cache.put('cfg', cfg)
+        return self.cfg
+
+    def _parse_list_scene(self, ans):
+        if ans is None:
+            return None
+        self.scenes = {}
+        self.scenes_len = {}
+        self.scenes_frames = {}
+        for s in ans:
+            tok = s.strip().split()
+            scene_id = int(tok[0][1:-1])
+            scene_name = tok[1]
+            scene_len = int(tok[2])
+            self.scenes[scene_name] = scene_id
+            self.scenes_len[scene_name] = scene_len * self.cfg['SCENE_DT']
+            self.scenes_frames[scene_name] = scene_len
+        return self.scenes
+
+    def scene_is_used(self, scene):
+        for s in self.schedule:
+            if s.type == 'sequence' and scene in s.sequence:
+                return True
+        return False
+
+    # The scene slots of the unit (MAX_SCENES) can be managed as a cache:
+    # make_room evicts the least recently used scenes, except those pinned by
+    # tasks the schedule will still run. Only make_room and
+    # upload_scene(evict=True) ever delete scenes. The recency of the runs
+    # from this client (scene_use) is kept in memory only, it restarts from
+    # the dated tasks of the schedule on every new HeliosUnit.
+
+    def _schedule_time(self, s):
+        return datetime.datetime.combine(datetime.date(s.year, s.month, s.day), s.time,
+                                         tzinfo=datetime.timezone.utc)
+
+    def scene_pins(self):
+        # Scenes of the daily tasks and of the dated ones not past yet
+        now = datetime.datetime.now(datetime.timezone.utc)
+        pins = set()
+        for s in self.schedule:
+            if s.type == 'sequence' and (s.year is None or self._schedule_time(s) >= now):
+                pins.update(s.sequence)
+        return pins
+
+    def scene_last_use(self, name):
+        # Unix time of the last known run of a scene, from this client and
+        # from the past dated tasks, 0 if never seen
+        t = self.scene_use.get(name, 0.)
+        now = time.time()
+        for s in self.schedule:
+            if s.type == 'sequence' and s.year is not None and name in s.sequence:
+                ts = self._schedule_time(s).timestamp()
+                if ts <= now:
+                    t = max(t, ts)
+        return t
+
+    def _touch_scenes(self, *names):
+        now = time.time()
+        for n in names:
+            self.scene_use[n] = now
+
+    def _scenes_to_evict(self, n, keep=()):
+        # Scenes to remove to have n free slots, least recently used first,
+        # None if the unpinned ones are not enough
+        if 'MAX_SCENES' not in self.cfg:
+            return []
+        missing = n - (int(self.cfg['MAX_SCENES']) - len(self.scenes))
+        if missing <= 0:
+            return []
+        pins = self.scene_pins()
+        candidates = sorted((s for s in self.scenes if s not in pins and s not in keep),
+                            key=self.scene_last_use)
+        if len(candidates) < missing:
+            return None
+        return candidates[:missing]
+
+    def _evict_cmds(self, names):
+        # Highest ids first, so that the ids still to remove do not change,
+        # then the new ids
+        return ['remove-scene {:d}'.format(self.scenes[n]) for n in
+                sorted(names, key=lambda n: -self.scenes[n])] + ['list-scene']
+
+    def _check_evict(self, names, ans):
+        # ans are the answers to _evict_cmds(names)
+        removed = sorted(names, key=lambda n: -self.scenes[n])
+        if self._parse_list_scene(ans[-1]) is None:
+            # Renumbered here instead, as the unit did
+            for n, a in zip(removed, ans):
+                if a is not None:
+                    self._forget_scene(n)
+        for n in removed:
+            if n not in self.scenes:
+                self.scene_use.pop(n, None)
+                if self.scene_cache is not None:
+                    self.scene_cache.forget(self._scene_cache_id(), n)
+        if any(n in self.scenes for n in names):
+            log.warning("Cannot evict scenes from %s", self.ip_addr)
+            return False
+        log.info("Evicted %s from %s", " ".join(names), self.ip_addr)
+        return True
+
+    def _parse_scene(self, ans):
+        if ans is None:
+            return None
+        s = []
+        for fr in ans[1:]:
+            fr_s = fr.strip().split()
+            alt = float(fr_s[4])
+            azi = float(fr_s[5])
+            s += [[alt, azi]]
+
+        return np.array(s)
+
+    def _parse_position(self, ans):
         try:
             assert ans is not None and len(ans) == 1
         except AssertionError:
-            print("Wrong answare from get")
+            log.warning("Wrong answare from current-position")
             return False
-        s = ans[0].strip().split()[2]
-        return float(s)
+
+        tok = ans[0].split()
+        assert tok[0] == 'ABSOLUTE'
+        assert tok[1] == 'ALT'
+        self.alt = float(tok[2])
+        assert tok[3] == 'AZI'
+        self.azi = float(tok[4])
+
+        self.cache.put('position', [self.alt, self.azi])
+        return [self.alt, self.azi]
+
+    def _parse_wifi_conn(self, ans):
+        self.wifi_conn = {}
+        self.wifi_pass = {}
+
+        for s in ans:
+            tok = s.strip().split()
+            wifi_id = int(tok[0][1:-1])
+            ssid = tok[1]
+            password = tok[2]
+
+            self.wifi_conn[ssid] = wifi_id
+            self.wifi_pass[ssid] = password
+
+        return self.wifi_conn
+
+    def _parse_schedule(self, ans):
+        if ans is None:
+            return False
+        self.schedule = []
+        for s in ans:
+            tok = s.strip().split()
+            if tok[1] == '*':
+                self.schedule += [HeliosSchedule(int(tok[0][1:-1]), tok[4], tok[5], tok[6:])]
+            else:
+                self.schedule += [HeliosSchedule(int(tok[0][1:-1]), tok[4], tok[5], tok[6:], int(tok[1]), int(tok[2]), int(tok[3]))]
+        self.schedule = sorted(self.schedule)
+        return self.schedule
+
+    def _add_schedule_cmd(self, h, m, s, sch_type, seq=[], year=None, month=None, day=None):
+        if year is not None and month is not None and day is not None:
+            dates = "{:04d} {:02d} {:02d}".format(year, month, day)
+        else:
+            dates = "0 0 0"
+
+        if sch_type == 'wifi':
+            return 'add-task-wifi {:s} {:d} {:d} {:d}'.format(dates, h, m, s)
+        elif sch_type == 'sequence' and len(seq) > 0:
+            cmd = 'add-task-sequence {:s} {:d} {:d} {:d}'.format(dates, h, m, s)
+            for i in seq:
+                cmd += ' {:s}'.format(i)
+            return cmd
+        return None
+
+
+class HeliosUnit(HeliosUnitBase):
+    # With lazy=True these attributes are read from the unit on first access
+    # (through the state group that holds them) instead of in __init__
+    LAZY_STATE = {'id': None,
+                  'nickname': None,
+                  'lat': 'geo', 'lon': 'geo',
+                  'cfg': 'cfg',
+                  'alt': 'position', 'azi': 'position',
+                  'alt_setpoint': None, 'azi_setpoint': None,
+                  'scenes': 'scenes', 'scenes_len': 'scenes', 'scenes_frames': 'scenes',
+                  'wifi_conn': 'wifi', 'wifi_pass': 'wifi',
+                  'schedule': 'schedule'}
+
+    def __init__(self, ip_addr, nickname=None, port=23, timeout=10, settle=1., lazy=False):
+        self._init_state(ip_addr, nickname)
+        self.tn = None
+        self.parser = HeliosStreamParser()
+        self.port = port
+        self.timeout = timeout
+        self.settle = settle
+        self.lazy = lazy
+
+        self.connect()
+
+        if lazy:
+            for a in self.LAZY_STATE:
+                if a != 'nickname' or nickname is None:
+                    self.__dict__.pop(a, None)
+            return
+
+        # The whole initial state is requested in one pipelined burst
+        ans = self.cmd_get_answares(self.STATE_CMDS)
+        current_time = self.answer_time(self.STATE_CMDS.index('time'))
+
+        #assert self.check_sun_position()
+        assert self._parse_state(ans, current_time)
+
+    def __getattr__(self, name):
+        # Only called for missing attributes, i.e. lazy state not loaded yet.
+        # A failed load raises ConnectionError, not AttributeError, so that
+        # hasattr/getattr with a default do not hide it; nothing is cached
+        # then and the next access tries again.
+        if name not in self.LAZY_STATE or not self.__dict__.get('lazy', False):
+            raise AttributeError(name)
+        if name == 'id':
+            unit_id = self.get_id()
+            if unit_id is not False:
+                self.id = unit_id
+        elif name == 'nickname':
+            self.nickname = self.id
+        elif name in ['alt_setpoint', 'azi_setpoint']:
+            self.alt_setpoint = self.alt
+            self.azi_setpoint = self.azi
+        else:
+            self.refresh(self.LAZY_STATE[name])
+        if name not in self.__dict__:
+            raise ConnectionError("Cannot read {:s} from {:s}".format(name, self.ip_addr))
+        return self.__dict__[name]
+
+    def refresh(self, *what):
+        # Re-reads the given state groups (all of them by default) in one batch
+        if len(what) == 0:
+            what = self.REFRESH_CMDS.keys()
+        what = [w for w in self.REFRESH_CMDS if w in what]
+        ans = self.cmd_get_answares([self.REFRESH_CMDS[w][0] for w in what])
+        for w, a in zip(what, ans):
+            if a is not None:
+                getattr(self, self.REFRESH_CMDS[w][1])(a)
+        return all(a is not None for a in ans)
+
+    def __del__(self):
+        self.disconnect()
+
+    def reboot(self):
+        self.cache.invalidate()
+        self._send_and_close("reboot")
+        time.sleep(10)
+
+    def connect(self):
+        try:
+            self.tn = telnetlib.Telnet(self.ip_addr, self.port, timeout=self.timeout)
+            prompt = self.tn.read_until("> ".encode(encoding='ascii'), self.timeout)
+        except (OSError, EOFError):
+            prompt = b''
+        if not prompt.endswith(b'> '):
+            self._drop_link()
+            raise ConnectionError("Cannot connect to {:s}".format(self.ip_addr))
+        self.session.connected()
+        self.metrics.connected()
+        time.sleep(self.settle)
+        self.cmd_get_answares([""])
+        if self.tn is None:
+            raise ConnectionError("Cannot connect to {:s}".format(self.ip_addr))
+
+    def _drop_link(self):
+        # The stream is closed or out of sync with the commands
+        if self.tn is not None:
+            try:
+                self.tn.close()
+            except OSError:
+                pass
+        self.tn = None
+        self.parser.clear()
+        self.session.failed()
+
+    def ensure_connected(self):
+        # Reconnects if the link is down and the session allows it, fails
+        # fast while backing off or with the circuit open
+        if self.tn is not None:
+            return True
+        if not self.session.can_attempt():
+            return False
+        try:
+            self.connect()
+        except ConnectionError as e:
+            log.warning(str(e))
+            return False
+        return True
+
+    def keepalive(self):
+        # Pings the unit only when the link has been idle long enough for
+        # the device telnet watchdog to matter, reconnects if it is down
+        if self.tn is None:
+            return self.ensure_connected()
+        if not self.session.needs_keepalive(self.cfg.get('TELNET_WATCHDOG_TIME', 60)):
+            return True
+        return self.cmd_get_answare("") is not None
+
+    def _cached_query(self, field, cmd, parse, max_age=None):
+        # Served from the cache while fresh, see HeliosStateCache
+        res = self.cache.get(field, max_age)
+        if res is not None:
+            return res
+        ans = self.cmd_get_answare(cmd)
+        res = parse(ans)
+        if ans is not None:
+            self.cache.put(field, res)
+        return res
+
+    def _write_cmd(self, cmd, *invalidate):
+        # A command changing the state read by the invalidate queries
+        self.cache.invalidate(*invalidate)
+        return self.cmd_get_answare(cmd)
+
+    def solar_move(self, alt, azi):
+        return self._write_cmd("sc {:.1f} {:.1f}".format(alt, azi), 'position') is not None
+
+    def set_ory(self, alt, azi):
+        self._write_cmd("set-ory {:.1f} {:.1f}".format(alt, azi), 'position')
+
+    def get_id(self):
+        return self._parse_id(self.cmd_get_answare("id"))
+
+    def get_time(self):
+        return self._parse_time(self.cmd_get_answare('time'))
+
+    def set_geo(self, lat, lon):
+        return self._write_cmd('set-geo {:.3f} {:.3f}'.format(lat, lon), 'cfg') is not None
+
+    def set_prm(self, key:str, value):
+        ans = self._write_cmd(self._set_prm_cmd(key, value), 'cfg')
+        try:
+            assert ans is not None
+        except AssertionError:
+            log.warning("Wrong answare from set")
+            return False
+        return True
+
+    def get_geo(self):
+        return self._parse_geo(self.cmd_get_answare("get-geo"))
+
+    def config_transaction(self):
+        return HeliosConfigTransaction(self)
+
+    def apply_config(self, changes):
+        # changes maps get/set names to values checked with
+        # check_prm_value, see HeliosConfigTransaction
+        self.cache.invalidate('cfg')
+        return self._check_config(changes, self.cmd_get_answares(self._config_cmds(changes)))
+
+    def get_prm(self, key):
+        # From the configs, which hold all the parameters
+        cfg = self.get_cfg()
+        if cfg is not None and HELIOS_PRM_CFG.get(key) in cfg:
+            return cfg[HELIOS_PRM_CFG[key]]
+        return self._parse_prm(self.cmd_get_answare("get {:s}".format(key)))
 
     def factory_reset(self):
+        self.cache.invalidate()
         return self.cmd_get_answare('factory-reset') is not None
 
     def disconnect(self):
-        self.cmd_get_answare('quit', maxlines=0)
+        self._send_and_close('quit')
+
+    def _send_and_close(self, cmd):
+        # For the commands after which the unit closes the connection
+        if self.tn is not None:
+            log.debug("%s < %s", self.ip_addr, cmd)
+            try:
+                self._send("{:s}\n".format(cmd))
+                self.tn.close()
+            except OSError:
+                pass
         self.tn = None
+        self.parser.clear()
+        self.session.closed()
 
     def alt_move(self, t, s):
-        self.cmd_get_answare('alt-move {:d} {:d}'.format(t,s))
+        self._write_cmd('alt-move {:d} {:d}'.format(t,s), 'position')
 
     def azi_move(self, t, s):
-        self.cmd_get_answare('azi-move {:d} {:d}'.format(t,s))
+        self._write_cmd('azi-move {:d} {:d}'.format(t,s), 'position')
 
-    def get_cfg(self):
-        ans = self.cmd_get_answare('configs')
-        for a in ans:
-            self.cfg[a.split()[0]] = float(a.split()[1])
+    def get_cfg(self, max_age=None):
+        return self._cached_query('cfg', 'configs', self._parse_cfg, max_age)
 
     def reload_prm(self):
-        ans = self.cmd_get_answare('reload-prm')
+        ans = self._write_cmd('reload-prm', 'cfg')
 
     def absolute_move(self, alt, azi):
         self.alt_setpoint = alt
         self.azi_setpoint = azi
-        self.cmd_get_answare("mc {:.1f} {:.1f}".format(alt, azi))
+        return self._write_cmd("mc {:.1f} {:.1f}".format(alt, azi), 'position') is not None
 
     def stop_move(self):
-        self.cmd_get_answare("stop")
+        self._write_cmd("stop", 'position')
 
     def driver_off(self):
-        self.cmd_get_answare("driver-off")
+        self._write_cmd("driver-off", 'status')
 
     def driver_on(self):
-        self.cmd_get_answare("driver-on")
+        self._write_cmd("driver-on", 'status')
 
     def test_scene(self, scene):
-        self.cmd_get_answare("test-scene {:s}".format(scene))
+        self._touch_scenes(scene)
+        self._write_cmd("test-scene {:s}".format(scene), 'position')
 
     def sleep(self, nseconds):
         self.cmd_get_answare("sleep {:d}".format(nseconds))
 
-    def get_status(self):
-        ans = self.cmd_get_answare("status")
-        res = {'ntp': False, 'rtc': False, 'adc': False, 'intrtc': False}
-        if ans[0].startswith('NTP: OK'):
-            res['ntp'] = True
-        if ans[1].startswith('RTC: OK'):
-            res['rtc'] = True
-        if ans[2].startswith('internal RTC: OK'):
-            res['intrtc'] = True
-        if ans[3].startswith('external ADC: OK'):
-            res['adc'] = True
-        if ans[4].startswith('driver is ON'):
-            res['driver'] = True
-        else:
-            res['driver'] = False
-        return res
+    def get_status(self, max_age=None):
+        return self._cached_query('status', 'status', self._parse_status, max_age)
 
     def list_dir(self, dir):
         return [a.strip() for a in self.cmd_get_answare('ls {:s}'.format(dir))]
 
     def get_list_scene(self):
-        ans = self.cmd_get_answare('list-scene')
-        self.scenes = {}
-        self.scenes_len = {}
-        for s in ans:
-            tok = s.strip().split()
-            scene_id = int(tok[0][1:-1])
-            scene_name = tok[1]
-            scene_len = int(tok[2])
-            self.scenes[scene_name] = scene_id
-            self.scenes_len[scene_name] = scene_len * self.cfg['SCENE_DT']
-        return self.scenes
-
-    def scene_is_used(self, scene):
-        for s in self.schedule:
-            if s.type == 'sequence' and scene in s.sequence:
-                return True
-        return False
+        return self._parse_list_scene(self.cmd_get_answare('list-scene'))
 
     def delete_scene(self, name):
         if name in self.scenes:
             scene_id = self.scenes[name]
             if self.scene_is_used(name):
-                print("Scene is used!")
+                log.warning("Scene is used!")
                 return None
             self._remove_scene(scene_id)
-            for sn in self.scenes:
-                if self.scenes[sn] > scene_id:
-                    self.scenes[sn] -= 1
-            del self.scenes[name]
+            self._forget_scene(name)
         else:
-            print("Scene name wrong ", name)
+            log.warning("Scene name wrong %s", name)
+
+    def make_room(self, n=1, keep=()):
+        # Frees n scene slots evicting unpinned scenes not in keep, in one
+        # batch. Returns the evicted names, None if there is no room.
+        evict = self._scenes_to_evict(n, keep)
+        if evict is None:
+            log.warning("No room for %d scenes on %s", n, self.ip_addr)
+            return None
+        if len(evict) > 0 and not self._check_evict(evict, self.cmd_get_answares(self._evict_cmds(evict))):
+            return None
+        return evict
 
     def get_scene(self, name):
         if name in self.scenes:
-            return self._get_scene(self.scenes[name])
+            s = self._cached_scene(name)
+            if s is None:
+                s = self._get_scene(self.scenes[name])
+                self._cache_scene(name, s)
+            return s
+
+    def sync_scenes(self):
+        # Brings the scene cache up to date: one list-scene, then print-scene
+        # of the new scenes and of those whose length changed only. Returns
+        # the names fetched, None without a cache or on error.
+        if self.scene_cache is None or self.get_list_scene() is None:
+            return None
+        fetched = []
+        for name in self._stale_scenes():
+            s = self._get_scene(self.scenes[name])
+            if s is None:
+                return None
+            self._cache_scene(name, s)
+            fetched += [name]
+        return fetched
 
     def _new_scene(self, scene_name):
-        ans = self.cmd_get_answare('new-scene {:s}'.format(scene_name))
-        if ans is None:
-            return None
-        scene_id = int(ans[0].strip().split()[3])
-        return scene_id
+        return self._parse_new_scene(self.cmd_get_answare('new-scene {:s}'.format(scene_name)))
 
     def _remove_scene(self, scene_id):
         ans = self.cmd_get_answare('remove-scene {:d}'.format(scene_id))
         return ans is not None
 
     def _get_scene(self, scene_id):
-        ans = self.cmd_get_answare('print-scene {:d}'.format(scene_id))
-        if ans is None:
+        # Frames are parsed while they are received into a growing array,
+        # the first line is the scene header. Parsing stops at the first
+        # line that is not a frame (e.g. the messages of a [!!] answer), the
+        # rest of the answer is only drained.
+        s = np.empty((256, 2))
+        n = -1
+        bad = False
+        for fr in self.iter_answer('print-scene {:d}'.format(scene_id)):
+            if n >= 0 and not bad:
+                fr_s = fr.split()
+                try:
+                    assert len(fr_s) == 6 and fr_s[0] == 'FRAME'
+                    alt, azi = float(fr_s[4]), float(fr_s[5])
+                except (AssertionError, ValueError):
+                    bad = True
+                    continue
+                if n == s.shape[0]:
+                    s = np.concatenate((s, np.empty_like(s)))
+                s[n] = alt, azi
+            n += 1
+        if not self.answer_ok:
             return None
-        s = []
-        for fr in ans[1:]:
-            fr_s = fr.strip().split()
-            alt = float(fr_s[4])
-            azi = float(fr_s[5])
-            s += [[alt, azi]]
-
-        return np.array(s)
+        if bad:
+            log.warning("Wrong answare from print-scene %d", scene_id)
+            return None
+        return s[:max(n, 0)].copy()
 
     def _add_frame_to_scene(self, scene_id, alt, azi):
         ans = self.cmd_get_answare('add-frame-scene {:d} {:.1f} {:.1f}'.format(scene_id, alt, azi))
@@ -363,92 +1156,69 @@ class HeliosUnit:
         ans = self.cmd_get_answare('write-scene {:d}'.format(scene_id))
         return ans is not None
 
-    def upload_scene(self, scene_name, data):
-        try:
-            assert scene_name not in self.scenes
-        except AssertionError:
-            print("This scene name is already used")
-        try:
-            assert data.shape[0] <= 120 and data.shape[1] == 2
-        except AssertionError:
-            print("Data has wrong shape")
+    def upload_scene(self, scene_name, data, progress=None, window=32, evict=False, tolerance=None):
+        # Frames are streamed with up to window commands in flight, the
+        # device copy is then read back with print-scene and compared.
+        # Nothing is sent if the scene cache knows the unit has it already.
+        # With evict, a full unit makes room with make_room, otherwise the
+        # upload fails when there is no free slot. With a
+        # tolerance (deg) the frames are decimated first, see
+        # decimate_scene and self.last_decimation.
+        if tolerance is not None:
+            data = self._decimate_scene(data, tolerance)
+        if self._scene_is_current(scene_name, data):
+            log.info("Scene %s is already on %s", scene_name, self.ip_addr)
+            return True
+        if not self._check_scene_data(scene_name, data):
             return False
+        if evict and self.make_room(1) is None:
+            return False
+        t0 = time.perf_counter()
         scene_id = self._new_scene(scene_name)
         if scene_id is None:
-            print("Error in scene creation")
-            return False
-        for fr in data:
-            if self._add_frame_to_scene(scene_id, fr[0], fr[1]) is None:
-                print("Error in uploading data")
-                return False
-
-        if not self._save_scene(scene_id):
-            print("Error in saving")
+            log.warning("Error in scene creation")
             return False
-        self.scenes[scene_name] = scene_id
-        return True
 
-    def get_position(self):
-        ans = self.cmd_get_answare('current-position')
+        ans = self.cmd_get_answares(self._upload_scene_cmds(scene_id, data), window=window, progress=progress)
+        return self._check_upload(scene_name, scene_id, data, ans, time.perf_counter() - t0)
 
-        try:
-            assert ans is not None and len(ans) == 1
-        except AssertionError:
-            print("Wrong answare from current-position")
-            return False
-
-        tok = ans[0].split()
-        assert tok[0] == 'ABSOLUTE'
-        assert tok[1] == 'ALT'
-        self.alt = float(tok[2])
-        assert tok[3] == 'AZI'
-        self.azi = float(tok[4])
-
-        return [self.alt, self.azi]
+    def get_position(self, max_age=None):
+        return self._cached_query('position', 'current-position', self._parse_position, max_age)
 
     def sync_rtc_ntp(self):
-        ans = self.cmd_get_answare('sync-rtc-ntp')
+        ans = self._write_cmd('sync-rtc-ntp', 'status')
         return ans is not None
 
     def wifi_off(self):
-        ans = self.cmd_get_answare('wifi-off', maxlines=0)
-        self.tn = None
+        self._send_and_close('wifi-off')
+
+    def iter_syslog(self):
+        for a in self.iter_answer('syslog'):
+            yield a.strip()
 
     def syslog(self):
-        ans = self.cmd_get_answare('syslog')
-        return [a.strip() for a in ans]
+        ans = list(self.iter_syslog())
+        if not self.answer_ok:
+            return None
+        return ans
 
-    def battery_charge(self):
-        ans = self.cmd_get_answare('battery')
-        if ans is None:
-            return -1.
-        return float(ans[0].strip().split()[0])
+    def battery_charge(self, max_age=None):
+        return self._cached_query('battery', 'battery', self._parse_battery, max_age)
 
     def get_wifi_conn(self):
-        self.wifi_conn = {}
-        self.wifi_pass = {}
-
-        ans = self.cmd_get_answare('print-wifi')
-        for s in ans:
-            tok = s.strip().split()
-            wifi_id = int(tok[0][1:-1])
-            ssid = tok[1]
-            password = tok[2]
-
-            self.wifi_conn[ssid] = wifi_id
-            self.wifi_pass[ssid] = password
-
-        return self.wifi_conn
+        return self._parse_wifi_conn(self.cmd_get_answare('print-wifi'))
 
     def add_wifi_network(self, ssid, password):
-        self._add_wifi(ssid, password)
-        self.get_wifi_conn()
-        self._save_wifi()
+        ans = self.cmd_get_answares(['add-wifi {:s} {:s}'.format(ssid, password), 'print-wifi', 'save-wifi'])
+        if ans[1] is not None:
+            self._parse_wifi_conn(ans[1])
+        return ans[0] is not None and ans[2] is not None
 
     def delete_wifi_network(self, ssid):
-        self._delete_wifi(self.wifi_conn[ssid])
-        self.get_wifi_conn()
-        self._save_wifi()
+        ans = self.cmd_get_answares(['delete-wifi {:d}'.format(self.wifi_conn[ssid]), 'print-wifi', 'save-wifi'])
+        if ans[1] is not None:
+            self._parse_wifi_conn(ans[1])
+        return ans[0] is not None and ans[2] is not None
 
     def _add_wifi(self, ssid, password):
         ans = self.cmd_get_answare('add-wifi {:s} {:s}'.format(ssid, password))
@@ -468,55 +1238,38 @@ class HeliosUnit:
             try:
                 assert s in self.scenes
             except AssertionError:
-                print("Scene {:s} is not present".format(s))
+                log.warning("Scene %s is not present", s)
                 return None
             cmd += '{:s} '.format(s)
-        ans = self.cmd_get_answare(cmd[:-1])
+        self._touch_scenes(*scenes)
+        ans = self._write_cmd(cmd[:-1], 'position')
         return ans is not None
 
     def get_schedule(self):
-        ans = self.cmd_get_answare('print-schedule')
-        if ans is None:
-            return False
-        self.schedule = []
-        for s in ans:
-            tok = s.strip().split()
-            if tok[1] == '*':
-                self.schedule += [HeliosSchedule(int(tok[0][1:-1]), tok[4], tok[5], tok[6:])]
-            else:
-                self.schedule += [HeliosSchedule(int(tok[0][1:-1]), tok[4], tok[5], tok[6:], int(tok[1]), int(tok[2]), int(tok[3]))]
-        self.schedule = sorted(self.schedule)
-        return self.schedule
+        return self._parse_schedule(self.cmd_get_answare('print-schedule'))
 
     def remove_schedule(self, s):
-        self._remove_schedule(s)
-        self._save_schedule()
-        self.get_schedule()
+        ans = self.cmd_get_answares(['delete-schedule {:d}'.format(s.id), 'save-schedule', 'print-schedule'])
+        self._parse_schedule(ans[2])
+        return ans[0] is not None and ans[1] is not None
 
     def add_schedule(self, s:HeliosSchedule):
-        self._add_schedule(s.time.hour, s.time.minute, s.time.second, s.type, s.sequence, s.year, s.month, s.day)
-        self._save_schedule()
-        self.get_schedule()
+        cmd = self._add_schedule_cmd(s.time.hour, s.time.minute, s.time.second, s.type, s.sequence, s.year, s.month, s.day)
+        if cmd is None:
+            return False
+        ans = self.cmd_get_answares([cmd, 'save-schedule', 'print-schedule'])
+        self._parse_schedule(ans[2])
+        return ans[0] is not None and ans[1] is not None
 
     def _remove_schedule(self, sch):
         ans = self.cmd_get_answare('delete-schedule {:d}'.format(sch.id))
         return ans is not None
 
     def _add_schedule(self, h, m, s, sch_type, seq=[], year=None, month=None, day=None):
-        ans = None
-        if year is not None and month is not None and day is not None:
-            dates = "{:04d} {:02d} {:02d}".format(year, month, day)
-        else:
-            dates = "0 0 0"
-
-        if sch_type == 'wifi':
-            ans = self.cmd_get_answare('add-task-wifi {:s} {:d} {:d} {:d}'.format(dates, h, m, s))
-        elif sch_type == 'sequence' and len(seq) > 0:
-            cmd = 'add-task-sequence {:s} {:d} {:d} {:d}'.format(dates, h, m, s)
-            for i in seq:
-                cmd += ' {:s}'.format(i)
-            ans = self.cmd_get_answare(cmd)
-        return ans is not None
+        cmd = self._add_schedule_cmd(h, m, s, sch_type, seq, year, month, day)
+        if cmd is None:
+            return False
+        return self.cmd_get_answare(cmd) is not None
 
     def _save_schedule(self):
         ans = self.cmd_get_answare('save-schedule')
@@ -533,8 +1286,8 @@ class HeliosUnit:
         try:
             assert abs(device_sun_alt - apy_alt)  < tol and abs(device_sun_azi - apy_azi) < tol
         except AssertionError:
-            print(device_sun_alt, apy_alt)
-            print(device_sun_azi, apy_azi)
+            log.warning("Device sun ALT %f AZI %f, expected ALT %f AZI %f",
+                        device_sun_alt, device_sun_azi, apy_alt, apy_azi)
             return False
         return True
 
@@ -546,53 +1299,150 @@ class HeliosUnit:
         return ory_alt, ory_azi
 
     def check_device_clock(self, tol=2.0):
-        current_time = Time.now()
+        # Compared with the local time halfway through the round trip
+        t0 = Time.now()
         device_time = self.get_time()
+        return self._check_clock(device_time, t0 + (Time.now() - t0) / 2., tol)
+
+    def _send(self, text):
+        data = text.encode()
+        self.tn.write(data)
+        self.metrics.sent(len(data))
+
+    def _recv(self, deadline):
+        # Whatever the unit sent so far, waits for it until deadline
+        data = self.tn.read_very_eager()
+        while not data:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError
+            if select.select([self.tn], [], [], remaining)[0]:
+                data = self.tn.read_very_eager()
+        self.metrics.received(len(data))
+        return data
+
+    def _read_answer(self, timeout):
+        # Lines of the next answer, None if it ends with [!!]
+        deadline = time.monotonic() + timeout
+        lines = []
+        while True:
+            l, end = self.parser.next_lines()
+            lines += l
+            if end is not None:
+                break
+            self.parser.feed(self._recv(deadline))
+        self.session.activity()
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("%s > %s %s", self.ip_addr, lines, "[OK]" if end else "[!!]")
+        return lines if end else None
 
-        delta = device_time-current_time
-        try:
-            assert delta.to_value('sec') < tol
-        except AssertionError:
-            print(device_time)
-            print(current_time)
-            return False
-        return True
-
-    def cmd_get_answare(self, cmd, maxlines=10):
+    def cmd_get_answare(self, cmd):
         # Send a command through the socket, read the answare, if it is ok
         # return None if it is not OK
 
-        print(cmd)
-        if self.tn is None:
+        log.debug("%s < %s", self.ip_addr, cmd)
+        if not self.ensure_connected():
             return None
 
-        self.tn.write("{:s}".format(cmd).encode())
-        self.tn.write(b"\n")
-        #print(self.socket.send("\r\n".encode()))
-        ans = []
-        for i in range(maxlines):
-            try:
-                tmpa = self.tn.read_until(b' > ')
-            except:
-                self.connect()
-                self.tn.open(self.ip)
-                return None
-            print(tmpa.decode())
-            for l in tmpa.decode().split('\n'):
-                if l:
-                    ans += [l]
+        try:
+            self._send("{:s}\n".format(cmd))
+            t0 = time.monotonic()
+            ans = self._read_answer(self.timeout)
+            self.metrics.observe(cmd, time.monotonic() - t0, ans is not None)
+        except (EOFError, OSError) as e:
+            log.warning("No answare to %s from %s", cmd, self.ip_addr)
+            if isinstance(e, TimeoutError):
+                self.metrics.timeout(cmd)
+            self._drop_link()
+            return None
+        return ans
+
+    def iter_answer(self, cmd, timeout=None):
+        # Generator over the lines of the answer to cmd as they are received,
+        # nothing is kept. Once exhausted self.answer_ok tells whether the
+        # answer ended with [OK]. If the caller stops early the rest of the
+        # answer is still read, so that the next command stays in sync.
+        # timeout is for each read, not for the whole answer.
+        self.answer_ok = False
+        log.debug("%s < %s", self.ip_addr, cmd)
+        if not self.ensure_connected():
+            return
+        if timeout is None:
+            timeout = self.timeout
+
+        end = None
+        try:
+            self._send("{:s}\n".format(cmd))
+            t0 = time.monotonic()
+            while True:
+                lines, end = self.parser.next_lines()
+                for l in lines:
+                    yield l
+                if end is not None:
+                    break
+                self.parser.feed(self._recv(time.monotonic() + timeout))
+            self.session.activity()
+            self.metrics.observe(cmd, time.monotonic() - t0, end)
+            self.answer_ok = end
+        except (EOFError, OSError) as e:
+            log.warning("No answare to %s from %s", cmd, self.ip_addr)
+            if isinstance(e, TimeoutError):
+                self.metrics.timeout(cmd)
+            self._drop_link()
+            end = False
+        finally:
+            while end is None:
+                try:
+                    end = self.parser.next_lines()[1]
+                    if end is None:
+                        self.parser.feed(self._recv(time.monotonic() + timeout))
+                except (EOFError, OSError):
+                    self._drop_link()
+                    end = False
+
+    def cmd_get_answares(self, cmds, timeout=None, window=None, progress=None):
+        # Pipelined version of cmd_get_answare: the commands are written back
+        # to back (at most window of them waiting for an answer) and the
+        # answers are split on their [OK]/[!!] terminators, one answer (or None
+        # on error) per command. progress(done, total) is called after each one.
+        for cmd in cmds:
+            log.debug("%s < %s", self.ip_addr, cmd)
+        if not self.ensure_connected():
+            return [None] * len(cmds)
+        if timeout is None:
+            timeout = self.timeout
+        if window is None:
+            window = len(cmds)
+
+        answers = []
+        sent = 0
+        # The round trip time of each command starts when it is written
+        sent_at = []
+        sent_wall = []
+        self.answer_window = []
+        for cmd in cmds:
             try:
-                assert len(ans) < maxlines and ans[-1] != '[OK] > ' and ans[-1] != '[!!] > '
-            except AssertionError:
+                if sent < len(cmds) and sent - len(answers) < window:
+                    n = min(len(cmds), len(answers) + window)
+                    self._send("".join("{:s}\n".format(c) for c in cmds[sent:n]))
+                    sent_at += [time.monotonic()] * (n - sent)
+                    sent_wall += [time.time()] * (n - sent)
+                    sent = n
+                answers += [self._read_answer(timeout)]
+                i = len(answers) - 1
+                start = sent_wall[i] if i == 0 else max(sent_wall[i], self.answer_window[-1][1])
+                self.answer_window += [(start, time.time())]
+                self.metrics.observe(cmd, time.monotonic() - sent_at[i], answers[-1] is not None)
+            except (EOFError, OSError) as e:
+                log.warning("No answare to %s from %s", cmd, self.ip_addr)
+                if isinstance(e, TimeoutError):
+                    self.metrics.timeout(cmd)
+                self._drop_link()
+                answers += [None] * (len(cmds) - len(answers))
                 break
-
-        if maxlines == 0:
-            return None
-        if ans[-1] == '[!!] > ':
-            return None
-        else:
-            return ans[:-1]
-
+            if progress is not None:
+                progress(len(answers), len(cmds))
+        return answers
 
 if __name__ == "__main__":
     import sys
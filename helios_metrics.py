@@ -0,0 +1,248 @@
+import bisect
+import json
+import os
+import threading
+
+# Link instrumentation of the Helios clients. Each unit keeps a HeliosMetrics
+# (unit.metrics) with a round trip time histogram per command verb, the
+# bytes sent and received, and the [!!] answers, timeouts and reconnects.
+# Fleets are aggregated by merging them:
+#
+#   unit.metrics.percentile(0.99)            # s, all the commands
+#   unit.metrics.percentile(0.5, 'print-scene')
+#   fleet_metrics(units).snapshot()
+#   write_prometheus(units, '/var/lib/node_exporter/helios.prom')
+
+# Upper bounds of the latency buckets [s]
+HELIOS_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                          0.25, 0.5, 1., 2.5, 5., 10., float('inf'))
+
+def command_verb(cmd):
+    # Histograms are per verb, i.e. the command without its arguments
+    verb = cmd.split(' ', 1)[0]
+    return verb if verb else 'nop'
+
+class LatencyHistogram:
+    def __init__(self, buckets=HELIOS_LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.
+
+    def observe(self, dt):
+        self.counts[bisect.bisect_left(self.buckets, dt)] += 1
+        self.count += 1
+        self.sum += dt
+
+    def merge(self, other):
+        for i, c in enumerate(other.counts):
+            self.counts[i] += c
+        self.count += other.count
+        self.sum += other.sum
+
+    def percentile(self, q):
+        # Linear interpolation inside the bucket holding the q quantile, the
+        # last (open) bucket reports its lower bound. None if empty.
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            if c > 0 and seen + c >= rank:
+                lo = self.buckets[i-1] if i > 0 else 0.
+                hi = self.buckets[i]
+                if hi == float('inf'):
+                    return lo
+                return lo + (hi - lo) * max(rank - seen, 0.) / c
+            seen += c
+        return self.buckets[-2]
+
+    def mean(self):
+        if self.count == 0:
+            return None
+        return self.sum / self.count
+
+class HeliosMetrics:
+    # Counters of one unit (or of a whole fleet once merged). Updated from
+    # the I/O thread and read from anywhere, hence the lock.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency = {}
+        self.errors = {}
+        self.timeouts = {}
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.connects = 0
+        self.reconnects = 0
+
+    def observe(self, cmd, dt, ok):
+        # One answered command, ok False for a [!!] answer
+        verb = command_verb(cmd)
+        with self.lock:
+            if verb not in self.latency:
+                self.latency[verb] = LatencyHistogram()
+            self.latency[verb].observe(dt)
+            if not ok:
+                self.errors[verb] = self.errors.get(verb, 0) + 1
+
+    def timeout(self, cmd):
+        verb = command_verb(cmd)
+        with self.lock:
+            self.timeouts[verb] = self.timeouts.get(verb, 0) + 1
+
+    def sent(self, n):
+        with self.lock:
+            self.bytes_out += n
+
+    def received(self, n):
+        with self.lock:
+            self.bytes_in += n
+
+    def connected(self):
+        with self.lock:
+            if self.connects > 0:
+                self.reconnects += 1
+            self.connects += 1
+
+    def histogram(self, verb=None):
+        # The histogram of verb, or of all the verbs merged
+        h = LatencyHistogram()
+        with self.lock:
+            if verb is not None:
+                if verb in self.latency:
+                    h.merge(self.latency[verb])
+            else:
+                for v in self.latency.values():
+                    h.merge(v)
+        return h
+
+    def percentile(self, q, verb=None):
+        return self.histogram(verb).percentile(q)
+
+    def merge(self, other):
+        # Adds the counters of other
+        with other.lock:
+            latency = {k: LatencyHistogram() for k in other.latency}
+            for k, h in other.latency.items():
+                latency[k].merge(h)
+            errors = dict(other.errors)
+            timeouts = dict(other.timeouts)
+            counts = (other.bytes_out, other.bytes_in, other.connects, other.reconnects)
+        with self.lock:
+            for k, h in latency.items():
+                self.latency.setdefault(k, LatencyHistogram()).merge(h)
+            for k, n in errors.items():
+                self.errors[k] = self.errors.get(k, 0) + n
+            for k, n in timeouts.items():
+                self.timeouts[k] = self.timeouts.get(k, 0) + n
+            self.bytes_out += counts[0]
+            self.bytes_in += counts[1]
+            self.connects += counts[2]
+            self.reconnects += counts[3]
+        return self
+
+    def snapshot(self):
+        # Plain dict, ready for json
+        with self.lock:
+            verbs = sorted(set(self.latency) | set(self.timeouts))
+            cmds = {}
+            for v in verbs:
+                h = self.latency.get(v, LatencyHistogram())
+                cmds[v] = {'count': h.count,
+                           'sum_s': h.sum,
+                           'p50_s': h.percentile(0.5),
+                           'p99_s': h.percentile(0.99),
+                           'buckets': [[b if b != float('inf') else '+Inf', c] for b, c in zip(h.buckets, h.counts)],
+                           'errors': self.errors.get(v, 0),
+                           'timeouts': self.timeouts.get(v, 0)}
+            s = {'bytes_out': self.bytes_out,
+                 'bytes_in': self.bytes_in,
+                 'reconnects': self.reconnects,
+                 'errors': sum(self.errors.values()),
+                 'timeouts': sum(self.timeouts.values()),
+                 'commands': cmds}
+        h = self.histogram()
+        s['count'] = h.count
+        s['p50_s'] = h.percentile(0.5)
+        s['p99_s'] = h.percentile(0.99)
+        return s
+
+def unit_name(unit):
+    return unit.nickname if unit.nickname is not None else unit.ip_addr
+
+def fleet_metrics(units):
+    m = HeliosMetrics()
+    for u in units:
+        m.merge(u.metrics)
+    return m
+
+def metrics_json(units):
+    return {'units': {unit_name(u): u.metrics.snapshot() for u in units},
+            'fleet': fleet_metrics(units).snapshot()}
+
+def _prom_labels(**labels):
+    return '{' + ','.join('{:s}="{:s}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+                          for k, v in labels.items()) + '}'
+
+def _prom_le(b):
+    return '+Inf' if b == float('inf') else repr(b)
+
+def metrics_prometheus(units):
+    # Prometheus text exposition format, one series per unit (and verb).
+    # Fleet totals are left to the queries, e.g. sum by (le) (...), only the
+    # fleet wide quantiles are written since they cannot be summed.
+    out = []
+    def _head(name, kind, doc):
+        out.append("# HELP {:s} {:s}".format(name, doc))
+        out.append("# TYPE {:s} {:s}".format(name, kind))
+
+    _head('helios_command_duration_seconds', 'histogram', 'Round trip time of the commands')
+    for u in units:
+        m = u.metrics
+        with m.lock:
+            hists = [(v, h.buckets, list(h.counts), h.count, h.sum) for v, h in sorted(m.latency.items())]
+        for v, buckets, counts, count, total in hists:
+            acc = 0
+            for b, c in zip(buckets, counts):
+                acc += c
+                out.append("helios_command_duration_seconds_bucket{:s} {:d}".format(
+                    _prom_labels(unit=unit_name(u), verb=v, le=_prom_le(b)), acc))
+            out.append("helios_command_duration_seconds_sum{:s} {!r}".format(_prom_labels(unit=unit_name(u), verb=v), total))
+            out.append("helios_command_duration_seconds_count{:s} {:d}".format(_prom_labels(unit=unit_name(u), verb=v), count))
+
+    for name, attr, doc in [('helios_command_errors_total', 'errors', 'Commands answered with [!!]'),
+                            ('helios_command_timeouts_total', 'timeouts', 'Commands without an answer in time')]:
+        _head(name, 'counter', doc)
+        for u in units:
+            with u.metrics.lock:
+                counts = sorted(getattr(u.metrics, attr).items())
+            for v, n in counts:
+                out.append("{:s}{:s} {:d}".format(name, _prom_labels(unit=unit_name(u), verb=v), n))
+
+    for name, fn, doc in [('helios_bytes_sent_total', lambda m: m.bytes_out, 'Bytes written to the unit'),
+                          ('helios_bytes_received_total', lambda m: m.bytes_in, 'Bytes read from the unit'),
+                          ('helios_reconnects_total', lambda m: m.reconnects, 'Connections after the first one')]:
+        _head(name, 'counter', doc)
+        for u in units:
+            out.append("{:s}{:s} {:d}".format(name, _prom_labels(unit=unit_name(u)), fn(u.metrics)))
+
+    fleet = fleet_metrics(units).histogram()
+    _head('helios_fleet_command_duration_seconds', 'gauge', 'Round trip time quantiles over the whole fleet')
+    for q in [0.5, 0.99]:
+        p = fleet.percentile(q)
+        if p is not None:
+            out.append("helios_fleet_command_duration_seconds{:s} {!r}".format(_prom_labels(quantile=q), p))
+    return "\n".join(out) + "\n"
+
+def _write_atomic(fname, text):
+    # Collectors must never read a half written file
+    tmp = fname + '.tmp'
+    with open(tmp, 'w') as f:
+        f.write(text)
+    os.replace(tmp, fname)
+
+def write_prometheus(units, fname):
+    _write_atomic(fname, metrics_prometheus(units))
+
+def write_metrics_json(units, fname):
+    _write_atomic(fname, json.dumps(metrics_json(units), indent=1, sort_keys=True))
@@ -0,0 +1,83 @@
+import logging
+
+# Framing of the Helios telnet shell: every answer is a sequence of
+# "\n"-terminated lines followed by "[OK] > " or "[!!] > ". All the client
+# modules log through the 'helios' logger, e.g.
+#
+#   logging.basicConfig()
+#   set_log_level(logging.DEBUG)   # every command and answer
+
+HELIOS_OK = b'[OK] > '
+HELIOS_ERR = b'[!!] > '
+
+log = logging.getLogger('helios')
+
+def set_log_level(level):
+    log.setLevel(level)
+
+class HeliosStreamParser:
+    # Incremental parser of the byte stream coming from a unit. Received
+    # data is appended to one bytearray and scanned in place, the terminator
+    # search resumes where the previous one stopped, and the complete lines
+    # are decoded in bulk straight from a memoryview of the buffer. Consumed
+    # bytes are dropped in bulk.
+    OK = True
+    ERR = False
+    COMPACT = 1 << 16
+
+    def __init__(self):
+        self.buf = bytearray()
+        self.start = 0
+        self.scanned = 0
+
+    def feed(self, data):
+        if self.start > 0 and (self.start == len(self.buf) or self.start >= self.COMPACT):
+            del self.buf[:self.start]
+            self.scanned -= self.start
+            self.start = 0
+        self.buf += data
+
+    def clear(self):
+        self.buf = bytearray()
+        self.start = 0
+        self.scanned = 0
+
+    def pending(self):
+        return len(self.buf) - self.start
+
+    def _find_end(self):
+        # Start of the terminator of the current answer, -1 if not received
+        buf = self.buf
+        i = max(self.start, self.scanned)
+        while True:
+            i = buf.find(b'] > ', i)
+            if i < 0:
+                # A terminator may be split across two reads
+                self.scanned = max(self.start, len(buf) - len(HELIOS_OK) + 1)
+                return -1
+            t = i - 3
+            if t >= self.start and (t == self.start or buf[t-1] == 10) and \
+               (buf.startswith(HELIOS_OK, t) or buf.startswith(HELIOS_ERR, t)):
+                return t
+            i += 1
+
+    def next_lines(self):
+        # Returns (lines, end): the non empty lines received so far and, once
+        # the whole answer is in, end is OK or ERR (None before)
+        s = self.start
+        t = self._find_end()
+        if t >= 0:
+            end = self.OK if self.buf.startswith(HELIOS_OK, t) else self.ERR
+            e = t
+            self.start = self.scanned = t + len(HELIOS_OK)
+        else:
+            end = None
+            e = self.buf.rfind(b'\n', s) + 1
+            if e <= s:
+                return [], None
+            self.start = e
+        with memoryview(self.buf) as mv:
+            text = str(mv[s:e], 'utf-8', 'replace')
+        if '\r' in text:
+            text = text.replace('\r', '')
+        return [l for l in text.split('\n') if l], end
@@ -1,12 +1,17 @@
 from tkinter import *
 import tkinter.ttk as ttk
+from tkinter import messagebox
 from ttkthemes import ThemedTk
 from helios_interface import *
+from helios_geometry import *
+from helios_trajectory import *
+from helios_fleet import *
+from helios_worker import *
 import matplotlib.pyplot as plt
 import datetime
 import numpy as np
-import threading
-import scipy
+import queue
+import logging
 from functools import partial
 
 def _create_circle(self, c, r, **kwargs):
@@ -24,88 +29,34 @@ def _set_text(self:Entry, text):
     return
 Entry.set = _set_text
 
-def sc2a(s, c):
-    a = np.asin(s)
-    if(c < 0):
-        a = np.pi -a
-    return a
-
-def absolute_to_geo(v):
-    absolute_alt_cosine = np.sqrt(v[0] * v[0] + v[1] * v[1])
-    absolute_alt_sine = v[2]
-    absolute_alt = sc2a(absolute_alt_sine, absolute_alt_cosine)
-
-    absolute_azi_sine = v[1] / absolute_alt_cosine
-    absolute_azi_cosine = v[0] / absolute_alt_cosine
-    absolute_azi = sc2a(absolute_azi_sine, absolute_azi_cosine)
-    absolute_azi = 90.0 - absolute_azi * 180/np.pi;
-    return absolute_alt * 180/np.pi, absolute_azi
-
-def geo_to_absolute(alt, azi):
-    azi_rad = azi * np.pi / 180.
-    absolute_azi_rad = np.pi/2 - azi_rad
-    absolute_alt_rad = alt * np.pi/180
-
-    v = np.zeros(3)
-    v[0] = np.cos(absolute_alt_rad) * np.cos(absolute_azi_rad)
-    v[1] = np.cos(absolute_alt_rad) * np.sin(absolute_azi_rad)
-    v[2] = np.sin(absolute_alt_rad)
-    return v
-
-def get_sun_unit_vec(loc, t):
-    azi, alt = get_sun_position(loc, t)
-    return geo_to_absolute(alt, azi)
-
-def get_normal_vec(sun, ory):
-    norm = np.dot(sun, ory)
-    norm = -2 * np.sqrt((1+norm)/2.)
-    mir = (-sun - ory)/norm
-    return mir
-
-def get_reflected_vec(sun, mir):
-    norm = np.dot(mir, sun)
-    ory = -sun + 2*norm*mir
-    return ory
-
-def ory2mir(alt, azi, loc, t):
-    ory = geo_to_absolute(alt, azi)
-    sun = get_sun_unit_vec(loc, t)
-    
-    mir = get_normal_vec(sun, ory)
-    return absolute_to_geo(mir)
-
-def mir2ory(alt, azi, loc, t):
-    mir = geo_to_absolute(alt, azi)
-    sun = get_sun_unit_vec(loc, t)
-    ory = get_reflected_vec(sun, mir)
-    return absolute_to_geo(ory)
-
 class HeliosControlTab():
-    def __init__(self, h, root):
+    def __init__(self, h, root, worker):
         self.my_helios = h
+        self.worker = worker
+        self.setpoints = SetpointChannel(worker)
         self.canva_h = 600
         self.canva_w = 900
         self.helios_canvas = None
+        self.canvas_items = None
 
-        self.helios_is_ok = False
-        stat = self.my_helios.get_status()
-        if stat['adc'] and stat['rtc'] and stat['intrtc']:
-            self.helios_is_ok = True
+        # Set by the first status answer, see apply_status
+        self.helios_is_ok = None
 
         self.mir_alt = self.my_helios.alt
         self.mir_azi = self.my_helios.azi
-        if self.helios_is_ok:
-            self.ory_alt, self.ory_azi = mir2ory(self.mir_alt, 
-                                                 self.mir_azi,
-                                                 (self.my_helios.lon, self.my_helios.lat), 
-                                                 datetime.datetime.now(datetime.timezone.utc).isoformat()[:-6])
+        self.upload_state = None
         
         self.helios_tab = ttk.Frame(root)
 
         self.control_mode = StringVar()
         self.scene_speed = DoubleVar()
+        # Play the scene path as fast as the axes allow, see retime_scene
+        self.scene_fastest = IntVar()
         self.control_mode.set("dis")
         self.current_scene = np.array([])
+        self.interp_cache = None
+        self.scene_max_speed = np.zeros(2)
+        self.scene_violations = []
 
         self.helios_canvas = Canvas(self.helios_tab, width=self.canva_w, height=self.canva_h, bg='white')
         self.pos_label = Label(self.helios_tab, text="Current Position")
@@ -128,17 +79,13 @@ class HeliosControlTab():
         self.wifi_net_but = Button(self.helios_tab, text="Wifi Networks", command=self.dialog_wifi_net)
         self.wifi_sch_but = Button(self.helios_tab, text="Wifi Schedule", command=self.dialog_wifi_sch)
         self.sequence_but = Button(self.helios_tab, text="Sequences", command=self.dialog_sequence)
+        self.upload_label = Label(self.helios_tab, text="")
         self.system_config_but = Button(self.helios_tab, text="Configs", command=self.dialog_config)
         self.calibrate_but = Button(self.helios_tab, text="Calibrate", command=self.dialog_calibrate)
-        if self.my_helios.get_status()['driver']: 
-            driver_but_str = "Turn OFF" 
-            driver_but_color = 'red'
-        else:
-            driver_but_str = "Turn ON"
-            driver_but_color = 'green'
-        self.driver_but = Button(self.helios_tab, text=driver_but_str, command=self.cmd_driver_switch, background=driver_but_color)
+        self.driver_but = Button(self.helios_tab, text="Driver ...", command=self.cmd_driver_switch)
         self.calibrate_but = Button(self.helios_tab, text="Calibrate", command=self.dialog_calibrate)
         self.scene_speed_scale = ttk.Scale(self.helios_tab, from_=0, to=1., orient="horizontal", variable=self.scene_speed)
+        self.scene_fastest_but = Checkbutton(self.helios_tab, text="Fastest", variable=self.scene_fastest)
 
 
         self.pos_label.place(x=10, y=10)
@@ -161,12 +108,14 @@ class HeliosControlTab():
         self.dis_control.place(x=1110, y=30)
         self.add_pt_but.place(x=1110, y=70)
         self.scene_speed_scale.place(x=1110, y=110)
+        self.scene_fastest_but.place(x=1220, y=110)
         self.save_scene_but.place(x=1110, y=270)
         self.test_scene_but.place(x=1110, y=150)
         self.clean_scene_but.place(x=1110, y=190)
         self.load_scene_but.place(x=1110, y=230)
         self.delete_scene_but.place(x=1110, y=310)
         self.sequence_but.place(x=1110, y=350)
+        self.upload_label.place(x=1110, y=390)
         
         self.draw_canvas_control()
         self.update_status()
@@ -182,60 +131,136 @@ class HeliosControlTab():
         x = (azi/360.0) * self.canva_w
         return x, y 
     
+    def a2c_array(self, dat):
+        alt = dat[:, 0]
+        alt = np.where(alt < -90, alt + 360, alt)
+        alt = np.where(alt > 90, alt - 360, alt)
+        azi = np.where(dat[:, 1] < 0, dat[:, 1] + 360., dat[:, 1])
+        return np.stack((azi/360.0 * self.canva_w, self.canva_h-(alt+90)/180.0 * self.canva_h), axis=-1)
+
     def draw_canvas_background(self):
         # Horizontal grid
         #Horizon
         
-        self.helios_canvas.create_line(self.a2c(0, 0), self.a2c(0, 360), width=2, fil='red')
+        self.helios_canvas.create_line(self.a2c(0, 0), self.a2c(0, 360), width=2, fil='red', tags='grid')
         for i in range(-90, 90, 30):
             if i % 90 != 0:
-                self.helios_canvas.create_line(self.a2c(i, 0), self.a2c(i, 360), width=1, fil='black')
+                self.helios_canvas.create_line(self.a2c(i, 0), self.a2c(i, 360), width=1, fil='black', tags='grid')
 
         #Vertical grid
         for i in range(0, 360, 90):
-            self.helios_canvas.create_line(self.a2c(-90, i), self.a2c(90, i), width=2, fil='red')
+            self.helios_canvas.create_line(self.a2c(-90, i), self.a2c(90, i), width=2, fil='red', tags='grid')
         for i in range(0, 360, 30):
             if i % 90 != 0:
-                self.helios_canvas.create_line(self.a2c(-90, i), self.a2c(90, i), width=1, fil='black')
+                self.helios_canvas.create_line(self.a2c(-90, i), self.a2c(90, i), width=1, fil='black', tags='grid')
 
+    def init_canvas_items(self):
+        # Static grid and dynamic markers are created once, the frame loop
+        # only moves the markers and rebuilds the scene paths when they change.
+        self.draw_canvas_background()
+        self.canvas_items = {'sun': self.helios_canvas.create_circle((0, 0), 20, fill='yellow', outline='orange'),
+                             'ory': self.helios_canvas.create_circle((0, 0), 5, fill='black', outline='blue', state='hidden'),
+                             'mir': self.helios_canvas.create_circle((0, 0), 10, fill="#BBB", outline="", state='hidden')}
+        self.canvas_radius = {'sun': 20, 'ory': 5, 'mir': 10}
+        self.canvas_pos = {}
+        self.canvas_scene_key = None
+
+    def move_canvas_item(self, name, c):
+        c = (round(c[0]), round(c[1]))
+        if self.canvas_pos.get(name) == c:
+            return
+        r = self.canvas_radius[name]
+        if name not in self.canvas_pos:
+            self.helios_canvas.itemconfigure(self.canvas_items[name], state='normal')
+        self.helios_canvas.coords(self.canvas_items[name], c[0]-r, c[1]-r, c[0]+r, c[1]+r)
+        self.canvas_pos[name] = c
+
+    def draw_canvas_path(self, dat, **kwargs):
+        xy = self.a2c_array(dat)
+        if xy.shape[0] == 1:
+            xy = np.concatenate((xy, xy))
+        # Split the path where it wraps around the canvas edges
+        jumps = np.abs(np.diff(xy, axis=0)) > (self.canva_w/2, self.canva_h/2)
+        breaks = np.nonzero(jumps.any(axis=1))[0] + 1
+        for seg in np.split(xy, breaks):
+            if seg.shape[0] == 1:
+                seg = np.concatenate((seg, seg))
+            self.helios_canvas.create_line(seg.ravel().tolist(), tags='scene', **kwargs)
+
+    def draw_canvas_scene(self):
+        key = (self.current_scene.shape, self.current_scene.tobytes(), self.scene_speed.get(), self.scene_fastest.get(),
+               self.my_helios.sequence_dt)
+        if key == self.canvas_scene_key:
+            return
+        self.canvas_scene_key = key
+        self.helios_canvas.delete('scene')
+        if self.current_scene.shape[0] > 0:
+            self.draw_canvas_path(self.current_scene, width=3, fill='green', capstyle=ROUND, joinstyle=ROUND)
+            self.draw_canvas_path(self.interp_helios(), width=2, fill='red', capstyle=ROUND, joinstyle=ROUND)
 
     def draw_canvas_control(self):
         if self.helios_canvas is None:
             return
-        self.draw_canvas_background()
+        if self.canvas_items is None:
+            self.init_canvas_items()
 
-        sun_azi, sun_alt = get_sun_position((self.my_helios.lon, self.my_helios.lat), datetime.datetime.now(datetime.timezone.utc).isoformat()[:-6]) 
-        self.helios_canvas.create_circle(self.a2c(sun_alt, sun_azi), 20, fill='yellow', outline='orange')
+        now = datetime.datetime.now(datetime.timezone.utc).isoformat()[:-6]
+        sun_azi, sun_alt = get_sun_position((self.my_helios.lon, self.my_helios.lat), now)
+        self.move_canvas_item('sun', self.a2c(sun_alt, sun_azi))
 
         if self.helios_is_ok:
             if self.control_mode.get() == 'sol':
                 self.mir_alt, self.mir_azi = ory2mir(self.ory_alt, 
                                                     self.ory_azi,
                                                     (self.my_helios.lon, self.my_helios.lat), 
-                                                    datetime.datetime.now(datetime.timezone.utc).isoformat()[:-6])
+                                                    now)
             elif self.control_mode.get() == 'abs' or self.control_mode.get() == 'dis':
                 self.ory_alt, self.ory_azi = mir2ory(self.mir_alt, 
                                                     self.mir_azi,
                                                     (self.my_helios.lon, self.my_helios.lat), 
-                                                    datetime.datetime.now(datetime.timezone.utc).isoformat()[:-6])
+                                                    now)
             
-            self.helios_canvas.create_circle(self.a2c(self.ory_alt, self.ory_azi), 5, fill='black', outline='blue')
-            self.helios_canvas.create_circle(self.a2c(self.mir_alt, self.mir_azi), 10,  fill="#BBB", outline="")
+            self.move_canvas_item('ory', self.a2c(self.ory_alt, self.ory_azi))
+            self.move_canvas_item('mir', self.a2c(self.mir_alt, self.mir_azi))
 
-        if self.current_scene.shape[0] > 0:
-            for pt in range(self.current_scene.shape[0]):
-                self.helios_canvas.create_circle(self.a2c(self.current_scene[pt][0], self.current_scene[pt][1]), 5, fill='green', outline='green')
-            
-            interp_data = self.interp_helios()
-            for pt in range(interp_data.shape[0]):
-                self.helios_canvas.create_circle(self.a2c(interp_data[pt][0], interp_data[pt][1]), 2, fill='red', outline='red')
+        self.draw_canvas_scene()
+
+    def io(self, fn, *args, done=None, **kwargs):
+        # Runs fn on the unit I/O thread, done(result) is then called on the
+        # Tk thread. Tk widgets must not be touched by fn.
+        return self.worker.submit(fn, *args, callback=done, **kwargs)
 
     def update(self):
-        self.helios_canvas.delete("all")
         self.draw_canvas_control()
+        if self.upload_state is not None:
+            self.upload_label.config(text="Upload {:d}/{:d}".format(*self.upload_state))
+            self.upload_state = None
 
-    def update_status(self):
+    def read_status(self):
+        # Runs on the I/O thread
         s = self.my_helios.get_status()
+        self.my_helios.get_position()
+        bat_lev = self.my_helios.battery_charge()
+        return s, bat_lev
+
+    def update_status(self):
+        self.io(self.read_status, done=self.apply_status)
+
+    def apply_status(self, res):
+        s, bat_lev = res
+        if s is None:
+            return
+        if self.helios_is_ok is None:
+            self.helios_is_ok = s['adc'] and s['rtc'] and s['intrtc']
+            if self.helios_is_ok:
+                self.ory_alt, self.ory_azi = mir2ory(self.mir_alt, 
+                                                     self.mir_azi,
+                                                     (self.my_helios.lon, self.my_helios.lat), 
+                                                     datetime.datetime.now(datetime.timezone.utc).isoformat()[:-6])
+        if s['driver']:
+            self.driver_but.config(text="Turn OFF", background='red')
+        else:
+            self.driver_but.config(text="Turn ON", background='green')
         if s['adc']:
             self.adc_label.config(text = "ADC OK")
         else:
@@ -253,10 +278,17 @@ class HeliosControlTab():
         else:
             self.ntp_label.config(text = "NTP NOT OK")
 
-        self.my_helios.get_position()
         self.pos_label.config(text = "{:.1f} {:.1f}".format(self.my_helios.alt, self.my_helios.azi))
-        bat_lev = self.my_helios.battery_charge()
-        self.bat_label.config(text = "BAT {:.0f} %".format(bat_lev))
+        if bat_lev is not None:
+            self.bat_label.config(text = "BAT {:.0f} %{:s}".format(bat_lev, self.rtt_text()))
+
+    def rtt_text(self):
+        # p50/p99 round trip time of the unit commands
+        p50 = self.my_helios.metrics.percentile(0.5)
+        p99 = self.my_helios.metrics.percentile(0.99)
+        if p50 is None:
+            return ""
+        return " RTT {:.0f}/{:.0f} ms".format(p50 * 1e3, p99 * 1e3)
 
     def add_point_to_scene(self):
         size = self.current_scene.shape[0]
@@ -270,57 +302,85 @@ class HeliosControlTab():
             self.current_scene[size] = [self.ory_alt-360., self.ory_azi]
         else:
             self.current_scene[size] = [self.ory_alt, self.ory_azi]
+        self.invalidate_scene()
         print(self.current_scene)
 
     def interp_helios(self):
-        s = self.scene_speed.get()
-        dat = self.current_scene
-
-        if dat.shape[0] <= 3:
-            k = dat.shape[0] - 1
-        else:
-            k=3
-        
-        if dat.shape[0] == 1:
-            smax = self.my_helios.sequence_dt
+        key = (self.current_scene.shape, self.current_scene.tobytes(), self.scene_speed.get(),
+               self.scene_fastest.get(), self.my_helios.sequence_dt, self.my_helios.sequence_max)
+        if self.interp_cache is not None and self.interp_cache[0] == key:
+            return self.interp_cache[1]
+
+        if self.scene_fastest.get():
+            # The densest spline through the key points, retimed
+            c = interp_scene(self.current_scene, 1., self.my_helios.sequence_dt, self.my_helios.sequence_max)
+            res = self.my_helios.retime_scene(c)
+            if res is not None:
+                c, report = res
+                if report['too_long']:
+                    log.warning("Scene takes %d frames at the axis limits", report['frames'])
         else:
-            smax = (self.my_helios.sequence_max - 1) * self.my_helios.sequence_dt / (dat.shape[0]-1)
-        smin = self.my_helios.sequence_dt
-        dt = smin + s*(smax-smin)
-        nout = int((dat.shape[0]-1)*dt // self.my_helios.sequence_dt  + 1)
-        
-        inter = scipy.interpolate.make_interp_spline(np.arange(0, dat.shape[0], 1.0) * dt, dat, k=k)
-        c = inter(np.arange(0, (dat.shape[0]-1)*dt, self.my_helios.sequence_dt))
-        c = np.concatenate((c, dat[-1:,:]))
-        speed_alt = 0
-        speed_azi = 0
-        for i in range(1, nout):
-            sazi = abs(c[i,0]-c[i-1,0]) / dt
-            salt = abs(c[i,1]-c[i-1,1]) / dt
-            if sazi > speed_azi:
-                speed_azi = sazi
-            if salt > speed_alt:
-                speed_alt = salt
+            c = interp_scene(self.current_scene, self.scene_speed.get(),
+                             self.my_helios.sequence_dt, self.my_helios.sequence_max)
+        self.scene_max_speed = scene_max_speed(c, self.my_helios.sequence_dt)
+        self.scene_violations = self.my_helios.check_scene(c) or []
+        if len(self.scene_violations) > 0:
+            v = self.scene_violations[0]
+            log.warning("Scene too fast for the unit: %d violations, first at frame %d (%s %s %.1f > %.1f)",
+                        len(self.scene_violations), v['frame'], v['axis'], v['kind'], v['value'], v['limit'])
+        self.interp_cache = (key, c)
         return c
     
+    def invalidate_scene(self):
+        self.interp_cache = None
     
     def test_scene(self):
         if self.current_scene.shape[0] == 0:
             return
-        self.my_helios.upload_scene('test', self.interp_helios())
-        self.my_helios.test_scene('test')
-        self.my_helios.delete_scene('test')
+        def _test(c):
+            if not self.my_helios.upload_scene('test', c, progress=self.upload_progress):
+                return False
+            self.my_helios.test_scene('test')
+            self.my_helios.delete_scene('test')
+            return True
+        self.io(_test, self.interp_helios(), done=self.upload_done)
     
+    def upload_progress(self, done, total):
+        # Called on the I/O thread, shown by update()
+        self.upload_state = (done, total)
+
+    def upload_done(self, ok):
+        self.upload_state = None
+        if ok:
+            text = "Uploaded"
+            if getattr(self.my_helios, 'last_upload', None) is not None:
+                text = "{:.1f} frames/s".format(self.my_helios.last_upload['fps'])
+            if getattr(self.my_helios, 'last_decimation', None) is not None:
+                text += "\n{:d}/{:d} frames, {:.2f} deg".format(self.my_helios.last_decimation['frames_out'],
+                                                                 self.my_helios.last_decimation['frames_in'],
+                                                                 self.my_helios.last_decimation['max_deviation'])
+                self.my_helios.last_decimation = None
+            self.upload_label.config(text=text)
+        else:
+            self.upload_label.config(text="Upload failed")
+
     def clean_scene(self):
         self.current_scene = np.array([])
-        self.my_helios.delete_scene('test')
+        self.invalidate_scene()
+        self.io(self.my_helios.delete_scene, 'test')
 
     def dialog_load_scene(self):
         dialog = Toplevel()
         dialog.wm_title("Load Scene from Helios...")
         
+        def _loaded(scene):
+            if scene is None:
+                return
+            self.current_scene = scene
+            self.invalidate_scene()
+
         def dialog_load_act(sn):
-            self.current_scene = self.my_helios.get_scene(sn)
+            self.io(self.my_helios.get_scene, sn, done=_loaded)
             dialog.destroy()
 
         for i, s in enumerate(self.my_helios.scenes.keys()):
@@ -339,11 +399,23 @@ class HeliosControlTab():
         dialog.wm_title("Save Scene to Helios...")
         
         def dialog_save_act():
-            self.my_helios.upload_scene(name_field.get(), self.interp_helios())
+            # A tolerance > 0 deg drops the frames the device would
+            # reproduce anyway, see decimate_scene
+            try:
+                tol = float(tol_field.get())
+            except ValueError:
+                tol = 0.
+            self.io(self.my_helios.upload_scene, name_field.get(), self.interp_helios(),
+                    progress=self.upload_progress, tolerance=tol if tol > 0 else None,
+                    done=self.upload_done)
             dialog.destroy()
 
         name_field = Entry(dialog, width=16)
         name_field.grid(row=1, column=1, padx=10, pady=10)
+        Label(dialog, text="Tolerance [deg]").grid(row=1, column=2, padx=10, pady=10)
+        tol_field = Entry(dialog, width=6)
+        tol_field.grid(row=1, column=3, padx=10, pady=10)
+        tol_field.set("0.0")
         Button(dialog, text="Save", command=dialog_save_act).grid(row=2, column=1, padx=10, pady=10)
         Button(dialog, text="Cancel", command=dialog.destroy).grid(row=2, column=2, padx=10, pady=10)
 
@@ -353,7 +425,7 @@ class HeliosControlTab():
         
         def dialog_delete_act(sn):
             print(sn)
-            self.my_helios.delete_scene(sn)
+            self.io(self.my_helios.delete_scene, sn)
             dialog.destroy()
 
         for i, s in enumerate(self.my_helios.scenes.keys()):
@@ -370,11 +442,11 @@ class HeliosControlTab():
         dialog.wm_title("Manage Helios WiFi Network")
         
         def dialog_delete_act(sn):
-            self.my_helios.delete_wifi_network(sn)
+            self.io(self.my_helios.delete_wifi_network, sn)
             dialog.destroy()
 
         def dialog_add_act():
-            self.my_helios.add_wifi_network(ssid_entry.get(), pass_entry.get())
+            self.io(self.my_helios.add_wifi_network, ssid_entry.get(), pass_entry.get())
             dialog.destroy()
 
         for i, s in enumerate(self.my_helios.wifi_conn.keys()):
@@ -406,7 +478,7 @@ class HeliosControlTab():
         dialog.wm_title("Manage Helios Sequence Schedule")
         
         def dialog_delete_act(s):
-            self.my_helios.remove_schedule(s)
+            self.io(self.my_helios.remove_schedule, s)
             dialog.destroy()
 
         def dialog_add_act():
@@ -422,7 +494,7 @@ class HeliosControlTab():
                 m = None
                 d = None
             hs = HeliosSchedule(0, str(utc_time), 'sequence', seq.get().split(), y=y, m=m, d=d)
-            self.my_helios.add_schedule(hs)
+            self.io(self.my_helios.add_schedule, hs)
             dialog.destroy()
 
         def dialog_add_scene_act(s):
@@ -522,7 +594,7 @@ class HeliosControlTab():
         dialog.wm_title("Manage Helios Wifi Schedule")
         
         def dialog_delete_act(s):
-            self.my_helios.remove_schedule(s)
+            self.io(self.my_helios.remove_schedule, s)
             dialog.destroy()
 
         def dialog_add_act():
@@ -538,7 +610,7 @@ class HeliosControlTab():
                 m = None
                 d = None
             hs = HeliosSchedule(0, str(utc_time), 'wifi', y=y, m=m, d=d)
-            self.my_helios.add_schedule(hs)
+            self.io(self.my_helios.add_schedule, hs)
             dialog.destroy()
 
         i = 0
@@ -607,19 +679,20 @@ class HeliosControlTab():
         dialog = Toplevel()
         dialog.wm_title("Calibrate Helios")
         
-        def _read_enc():
-            self.my_helios.get_position()
+        def _show_enc(pos):
             lab_altazi_1.config(text="ALT {:+06.1f} AZI {:+06.1f}".format(self.my_helios.alt, self.my_helios.azi))
+        def _read_enc():
+            self.io(self.my_helios.get_position, done=_show_enc)
         Label(dialog,
               text=
               """1. Check that the motors are running in the correct way, that 
                     is clockwise for azi and to up for alt, try to move and then read the 
                     encoders to ensure that everything is correct.  If not please switch 
                     motor connection.""", width=80, wraplength=600).grid(row=0, column=0, columnspan=4, padx=10, pady=10)
-        Button(dialog, text="Alt +", command=lambda :self.my_helios.alt_move(1000, int(self.my_helios.cfg['PWM_MAX_VALUE']))).grid(row=1, column=0, padx=10, pady=10)
-        Button(dialog, text="Alt -", command=lambda :self.my_helios.alt_move(1000, -int(self.my_helios.cfg['PWM_MAX_VALUE']))).grid(row=1, column=1, padx=10, pady=10)
-        Button(dialog, text="Azi +", command=lambda :self.my_helios.azi_move(1000, int(self.my_helios.cfg['PWM_MAX_VALUE']))).grid(row=1, column=2, padx=10, pady=10)
-        Button(dialog, text="Azi -", command=lambda :self.my_helios.azi_move(1000, -int(self.my_helios.cfg['PWM_MAX_VALUE']))).grid(row=1, column=3, padx=10, pady=10)
+        Button(dialog, text="Alt +", command=lambda :self.io(self.my_helios.alt_move, 1000, int(self.my_helios.cfg['PWM_MAX_VALUE']))).grid(row=1, column=0, padx=10, pady=10)
+        Button(dialog, text="Alt -", command=lambda :self.io(self.my_helios.alt_move, 1000, -int(self.my_helios.cfg['PWM_MAX_VALUE']))).grid(row=1, column=1, padx=10, pady=10)
+        Button(dialog, text="Azi +", command=lambda :self.io(self.my_helios.azi_move, 1000, int(self.my_helios.cfg['PWM_MAX_VALUE']))).grid(row=1, column=2, padx=10, pady=10)
+        Button(dialog, text="Azi -", command=lambda :self.io(self.my_helios.azi_move, 1000, -int(self.my_helios.cfg['PWM_MAX_VALUE']))).grid(row=1, column=3, padx=10, pady=10)
         Button(dialog, text="Read encoders", command=_read_enc).grid(row=2, column=1, padx=10, pady=10)
         lab_altazi_1 = Label(dialog, text="ALT ------ AZI ------")
         lab_altazi_1.grid(row=2, column=2, padx=10, pady=10)
@@ -630,36 +703,38 @@ class HeliosControlTab():
               """2. Go to zero as precisely as possible (especially for alt).""", 
               width=80, wraplength=600).grid(row=4, column=0, columnspan=4, padx=10, pady=10)
         def _set_alt_e0():
-            self.my_helios.get_position()
+            self.my_helios.get_position(max_age=0)
             alte0 = self.my_helios.alt + self.my_helios.get_prm("alte0")
             if(alte0 > 360):
                 alte0 -= 360
             if(alte0 < 0 ):
                 alte0 += 360
-            self.my_helios.set_prm("alte0", alte0)
-            self.my_helios.reload_prm()
+            tx = self.my_helios.config_transaction()
+            tx.set("alte0", alte0)
+            return tx.commit()
         def _set_azi_e0():
-            self.my_helios.get_position()
+            self.my_helios.get_position(max_age=0)
             azie0 = self.my_helios.azi + self.my_helios.get_prm("azie0")
             if(azie0 > 360):
                 azie0 -= 360
             if(azie0 < 0 ):
                 azie0 += 360
-            self.my_helios.set_prm("azie0", azie0)
-            self.my_helios.reload_prm()
+            tx = self.my_helios.config_transaction()
+            tx.set("azie0", azie0)
+            return tx.commit()
 
         speed_2_alt = DoubleVar()
         speed_2_azi = DoubleVar()
-        Button(dialog, text="Alt +", command=lambda :self.my_helios.alt_move(int(speed_2_alt.get()), int(self.my_helios.cfg['PWM_MAX_VALUE']))).grid(row=5, column=0, padx=10, pady=10)
-        Button(dialog, text="Alt -", command=lambda :self.my_helios.alt_move(int(speed_2_alt.get()), -int(self.my_helios.cfg['PWM_MAX_VALUE']))).grid(row=5, column=1, padx=10, pady=10)
-        Button(dialog, text="Azi +", command=lambda :self.my_helios.azi_move(int(speed_2_azi.get()), int(self.my_helios.cfg['PWM_MAX_VALUE']))).grid(row=5, column=2, padx=10, pady=10)
-        Button(dialog, text="Azi -", command=lambda :self.my_helios.azi_move(int(speed_2_azi.get()), -int(self.my_helios.cfg['PWM_MAX_VALUE']))).grid(row=5, column=3, padx=10, pady=10)
+        Button(dialog, text="Alt +", command=lambda :self.io(self.my_helios.alt_move, int(speed_2_alt.get()), int(self.my_helios.cfg['PWM_MAX_VALUE']))).grid(row=5, column=0, padx=10, pady=10)
+        Button(dialog, text="Alt -", command=lambda :self.io(self.my_helios.alt_move, int(speed_2_alt.get()), -int(self.my_helios.cfg['PWM_MAX_VALUE']))).grid(row=5, column=1, padx=10, pady=10)
+        Button(dialog, text="Azi +", command=lambda :self.io(self.my_helios.azi_move, int(speed_2_azi.get()), int(self.my_helios.cfg['PWM_MAX_VALUE']))).grid(row=5, column=2, padx=10, pady=10)
+        Button(dialog, text="Azi -", command=lambda :self.io(self.my_helios.azi_move, int(speed_2_azi.get()), -int(self.my_helios.cfg['PWM_MAX_VALUE']))).grid(row=5, column=3, padx=10, pady=10)
         Label(dialog, text="Alt Speed").grid(row=6, column=0, padx=10, pady=10)
         ttk.Scale(dialog, from_=10, to=1000, orient="horizontal", variable=speed_2_alt).grid(row=6, column=1, padx=10, pady=10)
         Label(dialog, text="Alt Speed").grid(row=6, column=2, padx=10, pady=10)
         ttk.Scale(dialog, from_=10, to=1000, orient="horizontal", variable=speed_2_azi).grid(row=6, column=3, padx=10, pady=10)
-        Button(dialog, text="Set Alt Zero", command=_set_alt_e0).grid(row=7, column=0, columnspan=2, padx=10, pady=10)
-        Button(dialog, text="Set Azi Zero", command=_set_azi_e0).grid(row=7, column=2, columnspan=2, padx=10, pady=10)
+        Button(dialog, text="Set Alt Zero", command=lambda :self.io(_set_alt_e0)).grid(row=7, column=0, columnspan=2, padx=10, pady=10)
+        Button(dialog, text="Set Azi Zero", command=lambda :self.io(_set_azi_e0)).grid(row=7, column=2, columnspan=2, padx=10, pady=10)
         ttk.Separator(dialog, orient=HORIZONTAL).grid(row=8, column=0, columnspan=4)
 
         Label(dialog,
@@ -672,35 +747,42 @@ class HeliosControlTab():
         speed_3_alt = DoubleVar()
         speed_3_azi = DoubleVar()
 
+        # The unit reads each axis as volts * <axis>v2d, the encoder zero
+        # <axis>e0 being in the same scaled units: correcting an axis v2d by
+        # k (the axis reads alt/90 or azi/90 times the true 90 deg) scales
+        # that axis zero by k as well, so it keeps marking the same voltage.
+        # Each axis only touches its own v2d and e0.
         def _alt_v2d_corr():
-            self.my_helios.get_position()
-            old_v2d = self.my_helios.get_prm('aziv2d')
+            self.my_helios.get_position(max_age=0)
+            old_v2d = self.my_helios.get_prm('altv2d')
             v2d = old_v2d
             v2d *= self.my_helios.alt/90.
-            self.my_helios.set_prm('altv2d', v2d)
-            self.my_helios.set_prm(HELIOS_FLOAT_EDITABLE_CFG['ALT_ENCODER_ZERO'], self.my_helios.get_prm(HELIOS_FLOAT_EDITABLE_CFG['ALT_ENCODER_ZERO'])*v2d/old_v2d)
-            self.my_helios.reload_prm()
+            tx = self.my_helios.config_transaction()
+            tx.set('altv2d', v2d)
+            tx.set('alte0', self.my_helios.get_prm('alte0')*v2d/old_v2d)
+            return tx.commit()
 
         def _azi_v2d_corr():
-            self.my_helios.get_position()
+            self.my_helios.get_position(max_age=0)
             old_v2d = self.my_helios.get_prm('aziv2d')
             v2d = old_v2d
             v2d *= self.my_helios.azi/90.
-            self.my_helios.set_prm('aziv2d', v2d)
-            self.my_helios.set_prm(HELIOS_FLOAT_EDITABLE_CFG['ALT_ENCODER_ZERO'], self.my_helios.get_prm(HELIOS_FLOAT_EDITABLE_CFG['ALT_ENCODER_ZERO'])*v2d/old_v2d)
-            self.my_helios.reload_prm()
-
-        Button(dialog, text="Go to 90.0 90.0", command=lambda :self.my_helios.absolute_move(90., 90.)).grid(row=10, column=0, columnspan=4, padx=10, pady=10)
-        Button(dialog, text="Alt +", command=lambda :self.my_helios.alt_move(int(speed_3_alt.get()), int(self.my_helios.cfg['PWM_MAX_VALUE']))).grid(row=11, column=0, padx=10, pady=10)
-        Button(dialog, text="Alt -", command=lambda :self.my_helios.alt_move(int(speed_3_alt.get()), -int(self.my_helios.cfg['PWM_MAX_VALUE']))).grid(row=11, column=1, padx=10, pady=10)
-        Button(dialog, text="Azi +", command=lambda :self.my_helios.azi_move(int(speed_3_azi.get()), int(self.my_helios.cfg['PWM_MAX_VALUE']))).grid(row=11, column=2, padx=10, pady=10)
-        Button(dialog, text="Azi -", command=lambda :self.my_helios.azi_move(int(speed_3_azi.get()), -int(self.my_helios.cfg['PWM_MAX_VALUE']))).grid(row=11, column=3, padx=10, pady=10)
+            tx = self.my_helios.config_transaction()
+            tx.set('aziv2d', v2d)
+            tx.set('azie0', self.my_helios.get_prm('azie0')*v2d/old_v2d)
+            return tx.commit()
+
+        Button(dialog, text="Go to 90.0 90.0", command=lambda :self.io(self.my_helios.absolute_move, 90., 90.)).grid(row=10, column=0, columnspan=4, padx=10, pady=10)
+        Button(dialog, text="Alt +", command=lambda :self.io(self.my_helios.alt_move, int(speed_3_alt.get()), int(self.my_helios.cfg['PWM_MAX_VALUE']))).grid(row=11, column=0, padx=10, pady=10)
+        Button(dialog, text="Alt -", command=lambda :self.io(self.my_helios.alt_move, int(speed_3_alt.get()), -int(self.my_helios.cfg['PWM_MAX_VALUE']))).grid(row=11, column=1, padx=10, pady=10)
+        Button(dialog, text="Azi +", command=lambda :self.io(self.my_helios.azi_move, int(speed_3_azi.get()), int(self.my_helios.cfg['PWM_MAX_VALUE']))).grid(row=11, column=2, padx=10, pady=10)
+        Button(dialog, text="Azi -", command=lambda :self.io(self.my_helios.azi_move, int(speed_3_azi.get()), -int(self.my_helios.cfg['PWM_MAX_VALUE']))).grid(row=11, column=3, padx=10, pady=10)
         Label(dialog, text="Alt Speed").grid(row=12, column=0, padx=10, pady=10)
         ttk.Scale(dialog, from_=10, to=1000, orient="horizontal", variable=speed_3_alt).grid(row=12, column=1, padx=10, pady=10)
         Label(dialog, text="Alt Speed").grid(row=12, column=2, padx=10, pady=10)
         ttk.Scale(dialog, from_=10, to=1000, orient="horizontal", variable=speed_3_azi).grid(row=12, column=3, padx=10, pady=10)
-        Button(dialog, text="Set Alt Correction", command=_alt_v2d_corr).grid(row=13, column=0, columnspan=2, padx=10, pady=10)
-        Button(dialog, text="Set Azi Correction", command=_azi_v2d_corr).grid(row=13, column=2, columnspan=2, padx=10, pady=10)
+        Button(dialog, text="Set Alt Correction", command=lambda :self.io(_alt_v2d_corr)).grid(row=13, column=0, columnspan=2, padx=10, pady=10)
+        Button(dialog, text="Set Azi Correction", command=lambda :self.io(_azi_v2d_corr)).grid(row=13, column=2, columnspan=2, padx=10, pady=10)
         ttk.Separator(dialog, orient=HORIZONTAL).grid(row=14, column=0, columnspan=4)
 
         Label(dialog,
@@ -733,9 +815,10 @@ class HeliosControlTab():
             
             azi_max_angular_speed = azi_move_get_speed(int(self.my_helios.cfg['PWM_MAX_VALUE']))
             alt_max_angular_speed = alt_move_get_speed(int(self.my_helios.cfg['PWM_MAX_VALUE']))
-            h.set_prm("alt_Msv", alt_max_angular_speed)
-            h.set_prm("azi_Msv", azi_max_angular_speed)
-            self.my_helios.reload_prm()
+            tx = h.config_transaction()
+            tx.set("alt_Msv", alt_max_angular_speed)
+            tx.set("azi_Msv", azi_max_angular_speed)
+            tx.commit()
 
             for pwm in range(int(self.my_helios.cfg['PWM_MAX_VALUE']), 0, -10):
                 if alt_move_get_speed(pwm) < 2.0:
@@ -761,7 +844,6 @@ class HeliosControlTab():
 
             data = np.array(data)
             alts2p = np.polyfit(data[:,1], data[:,0], 1)[0]
-            h.set_prm("alt_s2p", alts2p)
 
             data = []
             for pwm in range(azi_min_speed_pwm, int(self.my_helios.cfg['PWM_MAX_VALUE']), 5):
@@ -769,10 +851,12 @@ class HeliosControlTab():
 
             data = np.array(data)
             azis2p = np.polyfit(data[:,1], data[:,0], 1)[0]
-            h.set_prm("azi_s2p", azis2p)
-            self.my_helios.reload_prm()
+            tx = h.config_transaction()
+            tx.set("alt_s2p", alts2p)
+            tx.set("azi_s2p", azis2p)
+            return tx.commit()
 
-        Button(dialog, text="Start", command=_calibrate_speed).grid(row=16, column=0, columnspan=4, padx=10, pady=10)
+        Button(dialog, text="Start", command=lambda :self.io(_calibrate_speed)).grid(row=16, column=0, columnspan=4, padx=10, pady=10)
 
         Label(dialog,
               text=
@@ -785,32 +869,47 @@ class HeliosControlTab():
         lat_entry.grid(row=19, column=0, padx=10, pady=10)
         lon_entry = Entry(dialog, text="0.000 LON")
         lon_entry.grid(row=19, column=1, padx=10, pady=10)
-        Button(dialog, text="Set", command=lambda :self.my_helios.set_geo(float(lat_entry.get()), float(lon_entry.get()))).grid(row=19, column=3, columnspan=2, padx=10, pady=10)
+        Button(dialog, text="Set", command=lambda :self.io(self.my_helios.set_geo, float(lat_entry.get()), float(lon_entry.get()))).grid(row=19, column=3, columnspan=2, padx=10, pady=10)
 
     def cmd_driver_switch(self):
-        if self.my_helios.get_status()['driver']:
-            self.my_helios.cmd_get_answare('driver-off')
-            self.driver_but.config(text="Turn ON", background='green')
-        else:
-            self.my_helios.cmd_get_answare('driver-on')
-            self.driver_but.config(text="Turn OFF", background='red')
-        self.update_status()
+        def _switch():
+            s = self.my_helios.get_status()
+            if s is not None and s['driver']:
+                self.my_helios.driver_off()
+            else:
+                self.my_helios.driver_on()
+            return self.read_status()
+        self.io(_switch, done=self.apply_status)
     
     def dialog_config(self):
+        self.io(self.my_helios.get_cfg, done=self.show_config)
+
+    def show_config(self, cfg):
+        if cfg is None:
+            return
         dialog = Toplevel()
         dialog.wm_title("Manage Helios Configs")
 
-        self.my_helios.get_cfg()
-        def set_act_int(i, c):
-            self.my_helios.set_prm(HELIOS_INT_EDITABLE_CFG[c], int(entries[i].get()))
-            self.my_helios.reload_prm()
-            dialog.destroy()
-        def set_act_float(i, c):
-            self.my_helios.set_prm(HELIOS_FLOAT_EDITABLE_CFG[c], float(entries[i].get()))
-            self.my_helios.reload_prm()
-            dialog.destroy()
+        # All the edited parameters are applied at once, with one reload
+        def _applied(res):
+            result_label.config(text=str(res))
+            if res.ok():
+                dialog.destroy()
+        def apply_act():
+            tx = self.my_helios.config_transaction()
+            for i, c in editable:
+                if entries[i].get() == shown[i]:
+                    continue
+                if not tx.set(c, entries[i].get()):
+                    result_label.config(text="Wrong value for {:s}".format(c))
+                    return
+            if len(tx.changes) == 0:
+                dialog.destroy()
+                return
+            self.io(tx.commit, done=_applied)
 
         entries = []
+        editable = []
         ncol = 3
         for i, c in enumerate(sorted(self.my_helios.cfg.keys())):
             Label(dialog, text=c, width=30).grid(row=i//ncol, column=(i%ncol)*3, padx=10, pady=10)
@@ -829,16 +928,20 @@ class HeliosControlTab():
                 entries += [Entry(dialog, width=10)]
                 entries[i].grid(row=i//ncol, column=1+(i%ncol)*3, padx=10, pady=10)
                 entries[i].set("{:d}".format(int(self.my_helios.cfg[c])))
-                a = partial(set_act_int, i, c)
-                Button(dialog, text="Set", command=a).grid(row=i//ncol, column=2+(i%ncol)*3, padx=10, pady=10)
+                editable += [(i, c)]
             elif c in HELIOS_FLOAT_EDITABLE_CFG:
                 entries += [Entry(dialog, width=10)]
                 entries[i].grid(row=i//ncol, column=1+(i%ncol)*3, padx=10, pady=10)
                 entries[i].set("{:f}".format(self.my_helios.cfg[c]))
-                a = partial(set_act_float, i, c)
-                Button(dialog, text="Set", command=a).grid(row=i//ncol, column=2+(i%ncol)*3, padx=10, pady=10)
+                editable += [(i, c)]
             else:
                 print("Unknown config!")
+        shown = [e.get() for e in entries]
+
+        row = (len(entries) + ncol - 1) // ncol
+        result_label = Label(dialog, text="", justify=LEFT)
+        result_label.grid(row=row, column=0, columnspan=3*ncol-1, padx=10, pady=10)
+        Button(dialog, text="Apply", command=apply_act).grid(row=row, column=3*ncol-1, padx=10, pady=10)
         
 
     
@@ -846,7 +949,15 @@ class HeliosControlTab():
 class HeliosGUI():
     def __init__(self):
         self.FRAMERATE = 100
+        self.KEEPALIVE_PERIOD = 5000
+        self.IO_POLL = 20
         self.helios = []
+        self.workers = []
+        # Finished I/O requests, their callbacks run in apply_io_results
+        self.io_results = queue.Queue()
+        self.loader = HeliosWorker(None, self.io_results, name='loader')
+        # Scenes are read from the units once, see SceneCache
+        self.scene_cache = SceneCache()
 
         self.window = ThemedTk(theme="adapta")
         self.window.title("Helios Remote Control")
@@ -878,14 +989,11 @@ class HeliosGUI():
         self.main_tab = None
         self.helios_tabs = []
 
-        self.update_position = False
-        self.last_update_thread = None
-
         self.draw_main_space()
 
-        self.window.after(1000, self.send_motor_cmd)
         self.window.after(self.FRAMERATE, self.update)
-        self.window.after(30000, self.keep_helios_alive)
+        self.window.after(self.KEEPALIVE_PERIOD, self.keep_helios_alive)
+        self.window.after(self.IO_POLL, self.apply_io_results)
 
     def destroy_main_space(self):
         if self.quit_btn is not None:
@@ -911,8 +1019,8 @@ class HeliosGUI():
         else:
             self.main_tab = ttk.Notebook(self.window)
             self.helios_tabs = []
-            for h in self.helios:
-                self.helios_tabs += [HeliosControlTab(h, self.main_tab)]
+            for h, w in zip(self.helios, self.workers):
+                self.helios_tabs += [HeliosControlTab(h, self.main_tab, w)]
                 self.main_tab.add(self.helios_tabs[-1].helios_tab, text=h.nickname)
 
             self.main_tab.pack(expand = 1, fill ="both")
@@ -933,24 +1041,42 @@ class HeliosGUI():
         b_cancel = Button(self.add_unit_dialog, text="Cancel", command=self.add_unit_dialog.destroy)
         b_cancel.pack()
 
+    def add_units(self, units):
+        for h in units:
+            h.scene_cache = self.scene_cache
+            self.helios += [h]
+            self.workers += [HeliosWorker(h, self.io_results)]
+        self.draw_main_space()
+
     def add_helios_from_file(self):
-        with open('helios.config') as f:
-            for l in f:
-                if '#' in l:
-                    continue
-                else:
-                    self.add_helios_unit(l.strip().split()[0], nickname=l.strip().split()[1])
+        def _loaded(report):
+            log.info("%s", report)
+            if len(report.failed) > 0:
+                messagebox.showwarning("Load from File", str(report))
+            self.add_units(report.units)
+        self.loader.submit(load_fleet_from_file, 'helios.config', callback=_loaded)
 
     def add_helios_unit(self, ip=None, nickname=None):
+        from_dialog = ip is None
         if ip is None:
             if self.add_unit_dialog_entry_ip is not None:
                 ip = self.add_unit_dialog_entry_ip.get()
             else:
                 ip = ''
-        self.helios += [HeliosUnit(ip, nickname)]
-        if ip is None:
+        def _connect():
+            try:
+                return [HeliosUnit(ip, nickname)], None
+            except ConnectionError as e:
+                return [], e
+        def _connected(res):
+            units, err = res
+            if err is not None:
+                log.error("Cannot add unit %s: %s", ip, err)
+                messagebox.showerror("Add Helios Unit", "Cannot connect to {:s}: {:s}".format(ip, str(err)))
+            self.add_units(units)
+        self.loader.submit(_connect, callback=_connected)
+        if from_dialog and self.add_unit_dialog is not None:
             self.add_unit_dialog.destroy()
-        self.draw_main_space()
 
     def right_arrow(self, event):
         if len(self.helios) == 0:
@@ -965,14 +1091,14 @@ class HeliosGUI():
                 tab.ory_azi += speed
                 if tab.ory_azi > 360.:
                     tab.ory_azi -= 360
-                self.update_position = True
+                self.send_motor_cmd()
 
             elif cm == 'abs':
                 tab.mir_azi += speed
                 if tab.mir_azi > 360.:
                     tab.mir_azi -= 360
 
-                self.update_position = True
+                self.send_motor_cmd()
 
     def left_arrow(self, event):
         if len(self.helios) == 0:
@@ -987,14 +1113,14 @@ class HeliosGUI():
                 tab.ory_azi -= speed
                 if tab.ory_azi < 0.:
                     tab.ory_azi += 360
-                self.update_position = True
+                self.send_motor_cmd()
 
             elif cm == 'abs':
                 tab.mir_azi -= speed
                 if tab.mir_azi < 0.:
                     tab.mir_azi += 360
 
-                self.update_position = True
+                self.send_motor_cmd()
 
     def up_arrow(self, event):
         if len(self.helios) == 0:
@@ -1012,7 +1138,7 @@ class HeliosGUI():
 
                 if tab.ory_alt > 90.0 and tab.ory_alt < 180:
                     tab.ory_alt = 90.
-                self.update_position = True
+                self.send_motor_cmd()
 
             elif cm == 'abs':
                 tab.mir_alt += speed
@@ -1022,7 +1148,7 @@ class HeliosGUI():
                 if tab.mir_alt > 90.0 and tab.mir_alt < 180:
                     tab.mir_alt = 90.
 
-                self.update_position = True
+                self.send_motor_cmd()
 
     def down_arrow(self, event):
         if len(self.helios) == 0:
@@ -1040,7 +1166,7 @@ class HeliosGUI():
 
                 if tab.ory_alt < 270.0 and tab.ory_alt >= 180:
                     tab.ory_alt = 270
-                self.update_position = True
+                self.send_motor_cmd()
 
 
             elif cm == 'abs':
@@ -1051,7 +1177,7 @@ class HeliosGUI():
                 if tab.mir_alt < 270.0 and tab.mir_alt >= 180:
                     tab.mir_alt = 270
 
-                self.update_position = True
+                self.send_motor_cmd()
 
     def space_key(self, event):
         if len(self.helios) == 0:
@@ -1077,41 +1203,46 @@ class HeliosGUI():
         self.window.after(self.FRAMERATE, self.update)
 
     def send_motor_cmd(self):
-        if self.update_position:
-            self.update_position = False
-            print("send mot control")
-            if self.last_update_thread is None or not self.last_update_thread.is_alive():
-                h_idx = self.main_tab.index(self.main_tab.select())
-                h = self.helios[h_idx]
-                tab = self.helios_tabs[h_idx]
-                cm = tab.control_mode.get()
-                print("cm")
-                if cm == 'sol':
-                    thr = threading.Thread(target=h.solar_move, args=(tab.ory_alt, tab.ory_azi))
-                elif cm == 'abs':
-                    thr = threading.Thread(target=h.absolute_move, args=(tab.mir_alt, tab.mir_azi))
-                elif cm == 'dis':
-                    self.last_update_thread = None
-                    return
-                thr.start() 
-                self.last_update_thread  = thr
-        self.window.after(250, self.send_motor_cmd)
+        # Hands the new target of the selected unit to its setpoint channel,
+        # older targets not sent yet are dropped
+        h_idx = self.main_tab.index(self.main_tab.select())
+        h = self.helios[h_idx]
+        tab = self.helios_tabs[h_idx]
+        cm = tab.control_mode.get()
+        if cm == 'sol':
+            tab.setpoints.set(h.solar_move, tab.ory_alt, tab.ory_azi)
+        elif cm == 'abs':
+            tab.setpoints.set(h.absolute_move, tab.mir_alt, tab.mir_azi)
 
     def keep_helios_alive(self):
-        print('keep alive')
-        for h in self.helios:
-            print(h.id)
-            h.cmd_get_answare("")
-        self.window.after(30000, self.keep_helios_alive)
+        # Each unit pings only if its link is idle and reconnects when its
+        # session allows, dead units fail fast. Busy units are skipped.
+        for h, w in zip(self.helios, self.workers):
+            if w.pending() > 0:
+                continue
+            w.submit(h.keepalive, callback=partial(self.keepalive_done, h))
+        self.window.after(self.KEEPALIVE_PERIOD, self.keep_helios_alive)
+
+    def keepalive_done(self, h, ok):
+        if not ok:
+            log.warning("%s: %s", h.nickname, h.session)
+
+    def apply_io_results(self):
+        apply_results(self.io_results)
+        self.window.after(self.IO_POLL, self.apply_io_results)
 
 
     def main_loop(self):
         self.window.mainloop()
 
     def quit(self):
+        for w in self.workers:
+            w.close()
+        self.loader.close()
         self.window.destroy()
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     hgui = HeliosGUI()
     hgui.main_loop()
 
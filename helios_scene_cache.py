@@ -0,0 +1,110 @@
+import numpy as np
+
+import hashlib
+import json
+import os
+import threading
+
+# On-disk cache of scene frames, content addressed: the frames of a scene are
+# stored once as objects/<hash>.npy whatever unit and name they have, and
+# every unit has an index units/<unit id>.json of its scenes
+#
+#   {"scene name": {"hash": "...", "frames": 120}, ...}
+#
+# Frames are hashed at the device resolution (0.1 deg), so that a local
+# trajectory and the copy printed back by the unit have the same hash. An
+# entry is stale when list-scene reports a different number of frames for
+# the scene, see HeliosUnit.sync_scenes.
+#
+#   h.scene_cache = SceneCache()
+#   h.get_scene('sunrise')      # print-scene the first time only
+
+HELIOS_SCENE_CACHE = os.path.join(os.path.expanduser('~'), '.cache', 'helios', 'scenes')
+
+def scene_hash(data):
+    frames = np.round(np.asarray(data, dtype=float) * 10.).astype('<i4')
+    return hashlib.sha256(frames.tobytes()).hexdigest()
+
+class SceneCache:
+    def __init__(self, root=None):
+        if root is None:
+            root = os.environ.get('HELIOS_SCENE_CACHE', HELIOS_SCENE_CACHE)
+        self.root = root
+        self.lock = threading.Lock()
+        self.indexes = {}
+        os.makedirs(os.path.join(root, 'objects'), exist_ok=True)
+        os.makedirs(os.path.join(root, 'units'), exist_ok=True)
+
+    def _object_path(self, h):
+        return os.path.join(self.root, 'objects', h + '.npy')
+
+    def _index_path(self, unit_id):
+        return os.path.join(self.root, 'units', '{:s}.json'.format(str(unit_id).replace(os.sep, '_')))
+
+    def _index(self, unit_id):
+        if unit_id not in self.indexes:
+            try:
+                with open(self._index_path(unit_id)) as f:
+                    self.indexes[unit_id] = json.load(f)
+            except (OSError, ValueError):
+                self.indexes[unit_id] = {}
+        return self.indexes[unit_id]
+
+    def _write_index(self, unit_id):
+        fname = self._index_path(unit_id)
+        tmp = fname + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.indexes[unit_id], f, indent=1, sort_keys=True)
+        os.replace(tmp, fname)
+
+    def put(self, unit_id, name, data):
+        # Stores the frames (once per content) and records them as the scene
+        # name of the unit, returns the hash
+        data = np.round(np.asarray(data, dtype=float), 1)
+        h = scene_hash(data)
+        with self.lock:
+            obj = self._object_path(h)
+            if not os.path.exists(obj):
+                tmp = obj + '.tmp.npy'
+                np.save(tmp, data)
+                os.replace(tmp, obj)
+            index = self._index(unit_id)
+            if index.get(name) != {'hash': h, 'frames': data.shape[0]}:
+                index[name] = {'hash': h, 'frames': data.shape[0]}
+                self._write_index(unit_id)
+        return h
+
+    def entry(self, unit_id, name):
+        # {'hash':, 'frames':} of the scene, None if not cached
+        with self.lock:
+            return self._index(unit_id).get(name)
+
+    def get(self, unit_id, name, frames=None):
+        # The cached frames, None if missing or if frames (the length the
+        # unit reports) does not match
+        e = self.entry(unit_id, name)
+        if e is None or (frames is not None and frames != e['frames']):
+            return None
+        return self.load(e['hash'])
+
+    def load(self, h):
+        try:
+            return np.load(self._object_path(h))
+        except (OSError, ValueError):
+            return None
+
+    def holds(self, unit_id, name, data):
+        # Whether the unit scene name is known to have these frames
+        e = self.entry(unit_id, name)
+        return e is not None and e['frames'] == len(data) and e['hash'] == scene_hash(np.round(data, 1))
+
+    def forget(self, unit_id, name):
+        with self.lock:
+            index = self._index(unit_id)
+            if name in index:
+                del index[name]
+                self._write_index(unit_id)
+
+    def names(self, unit_id):
+        with self.lock:
+            return list(self._index(unit_id))
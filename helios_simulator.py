@@ -0,0 +1,514 @@
+import numpy as np
+
+import asyncio
+import datetime
+import random
+import threading
+import time
+
+from helios_ephemeris import sun_position_noaa
+
+# Local emulation of the Helios telnet shell, used to test and benchmark the
+# client offline. Every simulated unit is an asyncio TCP server answering
+# with the same "<lines>\n[OK] > " / "[!!] > " framing of the real device.
+#
+#   python -m pytest tests          # the client against simulated units
+
+SIM_DEFAULT_CFG = {"ALT_ENCODER_ZERO": 12.5,
+                   "ALT_KP": 1.2,
+                   "ALT_MIN_E": 0.2,
+                   "AZI_ENCODER_ZERO": 201.0,
+                   "AZI_KP": 1.2,
+                   "AZI_MIN_E": 0.2,
+                   "GEO_LAT": 44.49,
+                   "GEO_LON": 11.34,
+                   "AZI_MAX_SPEED_VALUE": 10.0,
+                   "AZI_VOLT_TO_DEG": 108.0,
+                   "ALT_MAX_SPEED_VALUE": 8.0,
+                   "ALT_VOLT_TO_DEG": 108.0,
+                   "SPEED_TO_PWM_ALT": 40.0,
+                   "SPEED_TO_PWM_AZI": 40.0,
+                   "SLEEP_ALT": 90.0,
+                   "SLEEP_AZI": 180.0,
+                   "ALT_SCENE_ACCEL": 20.0,
+                   "AZI_SCENE_ACCEL": 20.0,
+                   "MIN_BATTERY_LEVEL": 20.0,
+                   "ENCODER_OVERSAMPLING": 16,
+                   "LAST_NETWORK": 0,
+                   "PWM_MIN_ALT": 60,
+                   "PWM_MIN_AZI": 60,
+                   "LOG_LEVEL": 2,
+                   "LOG_DELETE_AFTER_DAYS": 7,
+                   "MAX_BLIND_MOVE_TIME_MS": 5000,
+                   "MAX_DAILY_TASKS": 16,
+                   "MAX_LOG_FILES": 8,
+                   "MAX_SCENES": 16,
+                   "MAX_SCENES_IN_SEQUENCE": 8,
+                   "MAX_SLEEP_S": 3600,
+                   "MAX_WIFI_NETWORKS": 4,
+                   "N_WIFI_ATTEMPTS": 3,
+                   "SAFETY_MAX_YEAR": 2100,
+                   "SAFETY_MIN_YEAR": 2020,
+                   "SAFETY_TIME_BEFORE_FIRST_SCENE": 10,
+                   "SAFETY_TIME_BEFORE_SEQUENCE": 60,
+                   "SCENE_LEN": 120,
+                   "SCENE_LEN_SECONDS": 60,
+                   "SCHEDULE_TIME_DELTA": 60,
+                   "SLEEP_TIME_S": 60,
+                   "TELNET_WATCHDOG_TIME": 120,
+                   "WAKEUP_TIME_BEFORE_SCHEDULE_S": 120,
+                   "WIFI_WATCHDOG_TIME": 600,
+                   "PWM_MAX_VALUE": 1023,
+                   "SCENE_DT": 500,
+                   "ATM_PRESSURE": 1010.0,
+                   "ATM_TEMPERATURE": 15.0,
+                   "BATTERY_MAX_mV": 4200.0,
+                   "BATTERY_MIN_mV": 3300.0,
+                   "BATTERY_R1_kOHM": 100.0,
+                   "BATTERY_R2_kOHM": 100.0,
+                   "BATTERY_VOLTAGE_DIVIDER_FAC": 2.0,
+                   "MIN_ALLOWED_SPEED": 0.5,
+                   "WATCHDOG_TIME_FACTOR": 1.5}
+
+SIM_PRM_KEYS = {"alte0": "ALT_ENCODER_ZERO",
+                "alt_kp": "ALT_KP",
+                "alt_me": "ALT_MIN_E",
+                "azie0": "AZI_ENCODER_ZERO",
+                "azi_kp": "AZI_KP",
+                "azi_me": "AZI_MIN_E",
+                "lat": "GEO_LAT",
+                "lon": "GEO_LON",
+                "azi_Msv": "AZI_MAX_SPEED_VALUE",
+                "aziv2d": "AZI_VOLT_TO_DEG",
+                "alt_Msv": "ALT_MAX_SPEED_VALUE",
+                "altv2d": "ALT_VOLT_TO_DEG",
+                "alt_s2p": "SPEED_TO_PWM_ALT",
+                "azi_s2p": "SPEED_TO_PWM_AZI",
+                "altnap": "SLEEP_ALT",
+                "azinap": "SLEEP_AZI",
+                "alt_sca": "ALT_SCENE_ACCEL",
+                "azi_sca": "AZI_SCENE_ACCEL",
+                "minbl": "MIN_BATTERY_LEVEL",
+                "overs": "ENCODER_OVERSAMPLING",
+                "lastnet": "LAST_NETWORK",
+                "alt_mPWM": "PWM_MIN_ALT",
+                "azi_mPWM": "PWM_MIN_AZI",
+                "logl": "LOG_LEVEL",
+                "logr": "LOG_DELETE_AFTER_DAYS"}
+
+class SimulatedAxis:
+    def __init__(self, pos, speed):
+        self.start = pos
+        self.target = pos
+        self.t0 = time.monotonic()
+        self.speed = speed
+
+    def position(self):
+        d = self.target - self.start
+        run = self.speed * (time.monotonic() - self.t0)
+        if run >= abs(d):
+            return self.target
+        return self.start + np.sign(d) * run
+
+    def move_to(self, target):
+        self.start = self.position()
+        self.target = target
+        self.t0 = time.monotonic()
+
+    def stop(self):
+        self.move_to(self.position())
+
+class HeliosSimulator:
+    def __init__(self, host='127.0.0.1', port=0, unit_id=None,
+                 latency=0., jitter=0., stall_prob=0., stall_time=2., disconnect_prob=0.,
+                 service_time=0., bandwidth=None, seed=None):
+        self.host = host
+        self.port = port
+        self.id = unit_id
+        self.latency = latency
+        self.jitter = jitter
+        self.stall_prob = stall_prob
+        self.stall_time = stall_time
+        self.disconnect_prob = disconnect_prob
+        self.service_time = service_time
+        self.bandwidth = bandwidth
+        self.rng = random.Random(seed)
+
+        self.cfg = dict(SIM_DEFAULT_CFG)
+        self.alt = SimulatedAxis(0., self.cfg["ALT_MAX_SPEED_VALUE"])
+        self.azi = SimulatedAxis(180., self.cfg["AZI_MAX_SPEED_VALUE"])
+        self.driver = True
+        self.scenes = []
+        self.scene_saved = []
+        self.schedule = []
+        self.wifi = [["helios-net", "password"]]
+        self.log = ["boot ok"]
+        self.ory = (0., 0.)
+        self.battery = 87.5
+
+        self.n_commands = 0
+        self.n_connections = 0
+        self.sessions = set()
+        self.server = None
+        self.loop = None
+
+    # Command implementations, each returns (ok, lines)
+
+    def _cmd_id(self, args):
+        return True, [self.id]
+
+    def _cmd_time(self, args):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        return True, ["UTC", now.isoformat()[:-6]]
+
+    def _cmd_get_geo(self, args):
+        return True, ["LAT: {:.3f} LON: {:.3f}".format(self.cfg["GEO_LAT"], self.cfg["GEO_LON"])]
+
+    def _cmd_set_geo(self, args):
+        self.cfg["GEO_LAT"] = float(args[0])
+        self.cfg["GEO_LON"] = float(args[1])
+        return True, []
+
+    def _cmd_configs(self, args):
+        return True, ["{:s} {:f}".format(k, float(v)) for k, v in self.cfg.items()]
+
+    def _cmd_get(self, args):
+        if args[0] not in SIM_PRM_KEYS:
+            return False, ["Unknown parameter"]
+        return True, ["{:s} = {:f}".format(args[0], float(self.cfg[SIM_PRM_KEYS[args[0]]]))]
+
+    def _cmd_set(self, args):
+        if args[0] not in SIM_PRM_KEYS:
+            return False, ["Unknown parameter"]
+        self.cfg[SIM_PRM_KEYS[args[0]]] = float(args[1])
+        return True, []
+
+    def _cmd_reload_prm(self, args):
+        self.alt.speed = self.cfg["ALT_MAX_SPEED_VALUE"]
+        self.azi.speed = self.cfg["AZI_MAX_SPEED_VALUE"]
+        return True, []
+
+    def _cmd_current_position(self, args):
+        return True, ["ABSOLUTE ALT {:.2f} AZI {:.2f}".format(self.alt.position(), self.azi.position())]
+
+    def _cmd_mc(self, args):
+        if not self.driver:
+            return False, ["Driver is off"]
+        self.alt.move_to(float(args[0]))
+        self.azi.move_to(float(args[1]))
+        return True, []
+
+    def _cmd_sc(self, args):
+        self.ory = (float(args[0]), float(args[1]))
+        return self._cmd_mc(args)
+
+    def _cmd_set_ory(self, args):
+        self.ory = (float(args[0]), float(args[1]))
+        return True, []
+
+    async def _axis_move(self, axis, args):
+        t = int(args[0]) / 1000.
+        pwm = int(args[1])
+        speed = axis.speed * min(abs(pwm) / self.cfg["PWM_MAX_VALUE"], 1.)
+        axis.move_to(axis.position() + np.sign(pwm) * speed * t)
+        await asyncio.sleep(t)
+        return True, []
+
+    async def _cmd_alt_move(self, args):
+        return await self._axis_move(self.alt, args)
+
+    async def _cmd_azi_move(self, args):
+        return await self._axis_move(self.azi, args)
+
+    def _cmd_stop(self, args):
+        self.alt.stop()
+        self.azi.stop()
+        return True, []
+
+    def _cmd_driver_on(self, args):
+        self.driver = True
+        return True, []
+
+    def _cmd_driver_off(self, args):
+        self.driver = False
+        self._cmd_stop(args)
+        return True, []
+
+    def _cmd_status(self, args):
+        return True, ["NTP: OK", "RTC: OK", "internal RTC: OK", "external ADC: OK",
+                      "driver is ON" if self.driver else "driver is OFF"]
+
+    def _cmd_battery(self, args):
+        return True, ["{:.1f} %".format(self.battery)]
+
+    def _cmd_mirror_log(self, args):
+        now = datetime.datetime.now(datetime.timezone.utc).isoformat()[:-6]
+        sun_azi, sun_alt = sun_position_noaa(self.cfg["GEO_LON"], self.cfg["GEO_LAT"], np.datetime64(now))
+        return True, ["SUN POSITION",
+                      "ALT {:.2f} AZI {:.2f}".format(sun_alt, sun_azi),
+                      "OUT-RAY",
+                      "ALT {:.2f} AZI {:.2f}".format(*self.ory),
+                      "MIRROR",
+                      "ALT {:.2f} AZI {:.2f}".format(self.alt.position(), self.azi.position()),
+                      "TIME UTC {:s}".format(now)]
+
+    def _cmd_list_scene(self, args):
+        return True, ["[{:d}] {:s} {:d}".format(i, s[0], len(s[1])) for i, s in enumerate(self.scenes)]
+
+    def _scene_id(self, args):
+        i = int(args[0])
+        if i < 0 or i >= len(self.scenes):
+            raise ValueError
+        return i
+
+    def _cmd_new_scene(self, args):
+        if len(self.scenes) >= self.cfg["MAX_SCENES"]:
+            return False, ["Too many scenes"]
+        self.scenes += [[args[0], []]]
+        self.scene_saved += [False]
+        return True, ["Created scene id {:d} {:s}".format(len(self.scenes)-1, args[0])]
+
+    def _cmd_add_frame_scene(self, args):
+        i = self._scene_id(args)
+        if len(self.scenes[i][1]) >= self.cfg["SCENE_LEN"]:
+            return False, ["Scene is full"]
+        self.scenes[i][1] += [(float(args[1]), float(args[2]))]
+        return True, []
+
+    def _cmd_write_scene(self, args):
+        self.scene_saved[self._scene_id(args)] = True
+        return True, []
+
+    def _cmd_remove_scene(self, args):
+        i = self._scene_id(args)
+        del self.scenes[i]
+        del self.scene_saved[i]
+        return True, []
+
+    def _cmd_print_scene(self, args):
+        i = self._scene_id(args)
+        name, frames = self.scenes[i]
+        lines = ["SCENE {:d} {:s} {:d}".format(i, name, len(frames))]
+        for j, fr in enumerate(frames):
+            lines += ["FRAME {:d} T {:d} {:.1f} {:.1f}".format(j, int(j * self.cfg["SCENE_DT"]), fr[0], fr[1])]
+        return True, lines
+
+    def _cmd_test_scene(self, args):
+        if args[0] not in [s[0] for s in self.scenes]:
+            return False, ["Scene not found"]
+        return True, []
+
+    def _cmd_run_test_sequence(self, args):
+        for a in args:
+            if a not in [s[0] for s in self.scenes]:
+                return False, ["Scene not found"]
+        return True, []
+
+    def _cmd_print_schedule(self, args):
+        lines = []
+        for i, s in enumerate(self.schedule):
+            y, m, d, h, mi, se = s[:6]
+            if y == 0:
+                dates = "* * *"
+            else:
+                dates = "{:04d} {:02d} {:02d}".format(y, m, d)
+            lines += ["[{:d}] {:s} {:02d}:{:02d}:{:02d} {:s}".format(i, dates, h, mi, se, " ".join(s[6:]))]
+        return True, lines
+
+    def _cmd_add_task(self, args, kind):
+        if len(self.schedule) >= self.cfg["MAX_DAILY_TASKS"]:
+            return False, ["Too many tasks"]
+        self.schedule += [[int(a) for a in args[:6]] + [kind] + args[6:]]
+        self.schedule.sort(key=lambda s: s[3:6])
+        return True, []
+
+    def _cmd_add_task_wifi(self, args):
+        return self._cmd_add_task(args, 'wifi')
+
+    def _cmd_add_task_sequence(self, args):
+        return self._cmd_add_task(args, 'sequence')
+
+    def _cmd_delete_schedule(self, args):
+        del self.schedule[int(args[0])]
+        return True, []
+
+    def _cmd_print_wifi(self, args):
+        return True, ["[{:d}] {:s} {:s}".format(i, w[0], w[1]) for i, w in enumerate(self.wifi)]
+
+    def _cmd_add_wifi(self, args):
+        self.wifi += [[args[0], args[1]]]
+        return True, []
+
+    def _cmd_delete_wifi(self, args):
+        del self.wifi[int(args[0])]
+        return True, []
+
+    def _cmd_syslog(self, args):
+        return True, list(self.log)
+
+    def _cmd_ls(self, args):
+        return True, ["{:s}/log{:d}.txt".format(args[0] if args else '', i) for i in range(3)]
+
+    def _cmd_ok(self, args):
+        return True, []
+
+    _cmd_ = _cmd_ok
+    _cmd_save_schedule = _cmd_ok
+    _cmd_save_wifi = _cmd_ok
+    _cmd_sync_rtc_ntp = _cmd_ok
+    _cmd_factory_reset = _cmd_ok
+    _cmd_sleep = _cmd_ok
+
+    async def execute(self, line):
+        tok = line.split()
+        cmd = tok[0] if tok else ''
+        fn = getattr(self, '_cmd_' + cmd.replace('-', '_'), None)
+        if fn is None:
+            return False, ["Unknown command {:s}".format(cmd)]
+        try:
+            ans = fn(tok[1:])
+            if asyncio.iscoroutine(ans):
+                ans = await ans
+            return ans
+        except (ValueError, IndexError):
+            return False, ["Wrong arguments"]
+
+    def _link_delay(self):
+        d = self.latency
+        if self.jitter > 0:
+            d += self.rng.uniform(0, self.jitter)
+        if self.stall_prob > 0 and self.rng.random() < self.stall_prob:
+            d += self.stall_time
+        return d
+
+    async def _sender(self, writer, queue):
+        # Answers are delivered in order, each one no earlier than its own
+        # link delay, so pipelined commands overlap their round trips.
+        loop = asyncio.get_running_loop()
+        while True:
+            due, out = await queue.get()
+            if out is None:
+                break
+            if due > loop.time():
+                await asyncio.sleep(due - loop.time())
+            if self.bandwidth is not None:
+                await asyncio.sleep(len(out) / self.bandwidth)
+            writer.write(out)
+            await writer.drain()
+
+    async def handle(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        self.n_connections += 1
+        self.sessions.add(asyncio.current_task())
+        queue = asyncio.Queue()
+        sender = asyncio.ensure_future(self._sender(writer, queue))
+        writer.write("Helios {:s}\n> ".format(self.id).encode())
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                line = line.decode().strip()
+                self.n_commands += 1
+                if self.service_time > 0:
+                    await asyncio.sleep(self.service_time)
+                if self.disconnect_prob > 0 and self.rng.random() < self.disconnect_prob:
+                    sender.cancel()
+                    break
+                if line in ['quit', 'wifi-off', 'reboot']:
+                    break
+                ok, lines = await self.execute(line)
+                out = "".join(l + "\n" for l in lines)
+                out += "[OK] > " if ok else "[!!] > "
+                await queue.put((loop.time() + self._link_delay(), out.encode()))
+            if not sender.done():
+                await queue.put((0., None))
+                await sender
+        except (ConnectionError, OSError, asyncio.CancelledError):
+            sender.cancel()
+        finally:
+            self.sessions.discard(asyncio.current_task())
+            writer.close()
+
+    async def stop_async(self):
+        # Closes the server and drops the open sessions, like a power cycle
+        self.server.close()
+        await self.server.wait_closed()
+        for task in list(self.sessions):
+            task.cancel()
+        await asyncio.gather(*self.sessions, return_exceptions=True)
+
+    async def start_async(self):
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        if self.id is None:
+            self.id = "SIM{:05d}".format(self.port)
+        return self
+
+    @property
+    def address(self):
+        return "{:s}:{:d}".format(self.host, self.port)
+
+class HeliosSimulatorPool:
+    # Runs any number of simulated units on one event loop in a background
+    # thread, so they can be used from blocking client code.
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.units = []
+
+    def spawn(self, n=1, **kwargs):
+        new = []
+        for i in range(n):
+            sim = HeliosSimulator(**kwargs)
+            sim.loop = self.loop
+            asyncio.run_coroutine_threadsafe(sim.start_async(), self.loop).result()
+            new += [sim]
+        self.units += new
+        return new
+
+    def close(self):
+        async def _close():
+            for sim in self.units:
+                await sim.stop_async()
+        asyncio.run_coroutine_threadsafe(_close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+def spawn_simulators(n, **kwargs):
+    pool = HeliosSimulatorPool()
+    pool.spawn(n, **kwargs)
+    return pool
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Run simulated Helios units")
+    parser.add_argument("-n", type=int, default=1, help="number of units")
+    parser.add_argument("--host", default='127.0.0.1')
+    parser.add_argument("--port", type=int, default=2323, help="port of the first unit, the others follow")
+    parser.add_argument("--latency", type=float, default=0., help="answer latency [s]")
+    parser.add_argument("--jitter", type=float, default=0., help="random extra latency [s]")
+    parser.add_argument("--stall-prob", type=float, default=0.)
+    parser.add_argument("--stall-time", type=float, default=2.)
+    parser.add_argument("--disconnect-prob", type=float, default=0.)
+    args = parser.parse_args()
+
+    pool = HeliosSimulatorPool()
+    for i in range(args.n):
+        pool.spawn(host=args.host, port=args.port + i if args.port else 0,
+                   latency=args.latency, jitter=args.jitter,
+                   stall_prob=args.stall_prob, stall_time=args.stall_time,
+                   disconnect_prob=args.disconnect_prob)
+    for sim in pool.units:
+        print(sim.address, sim.id)
+    try:
+        pool.thread.join()
+    except KeyboardInterrupt:
+        pool.close()
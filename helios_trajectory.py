@@ -0,0 +1,176 @@
+import numpy as np
+import scipy.interpolate
+
+# Scene trajectories are (N, 2) arrays of [alt, azi] frames.
+
+def interp_scene(dat, s, sequence_dt, sequence_max):
+    # Spline through the scene key points, sampled every sequence_dt seconds.
+    # s in [0, 1] stretches the time between key points from sequence_dt up
+    # to the longest spacing that still fits sequence_max frames.
+    if dat.shape[0] <= 3:
+        k = dat.shape[0] - 1
+    else:
+        k=3
+
+    if dat.shape[0] == 1:
+        smax = sequence_dt
+    else:
+        smax = (sequence_max - 1) * sequence_dt / (dat.shape[0]-1)
+    smin = sequence_dt
+    dt = smin + s*(smax-smin)
+
+    inter = scipy.interpolate.make_interp_spline(np.arange(0, dat.shape[0], 1.0) * dt, dat, k=k)
+    c = inter(np.arange(0, (dat.shape[0]-1)*dt, sequence_dt))
+    return np.concatenate((c, dat[-1:,:]))
+
+def scene_max_speed(c, sequence_dt):
+    # Peak [alt, azi] angular speed in deg/s between consecutive frames
+    if c.shape[0] < 2:
+        return np.zeros(2)
+    return np.abs(np.diff(c, axis=0)).max(axis=0) / sequence_dt
+
+def _segment_distance(c, a, b):
+    # Distance in deg of the points c from the segments a-b, row by row
+    d = b - a
+    l2 = (d ** 2).sum(axis=1)
+    t = ((c - a) * d).sum(axis=1) / np.where(l2 > 0., l2, 1.)
+    t = np.clip(t, 0., 1.)
+    return np.linalg.norm(c - a - t[:, None] * d, axis=1)
+
+def decimate_scene(c, tol, max_step=None):
+    # Douglas-Peucker simplification in the alt/azi plane: drops the frames
+    # that the straight moves between the kept ones reproduce within tol
+    # degrees. All the segments of a level are split at once, so the loop
+    # runs once per level, not once per segment. The device plays frames on
+    # its fixed SCENE_DT grid, so the path is kept but the moves get
+    # shorter (in time) where frames are dropped. Holds, runs of repeated
+    # frames, last as many frames as they have and are kept whole. max_step
+    # ([alt, azi] or scalar, degrees) bounds the move between two kept
+    # frames so that it stays within the axis speeds. Returns the kept
+    # frames and a report of the reduction and of the largest deviation.
+    c = np.asarray(c, dtype=float)
+    n = c.shape[0]
+    if n < 3:
+        return c, {'frames_in': n, 'frames_out': n, 'reduction': 0., 'max_deviation': 0.}
+    keep = np.zeros(n, dtype=bool)
+    keep[[0, -1]] = True
+    still = (np.diff(c, axis=0) == 0.).all(axis=1)
+    keep[1:] |= still
+    keep[:-1] |= still
+    dist = np.zeros(n)
+    idx = np.arange(n)
+    while True:
+        k = np.flatnonzero(keep)
+        seg = np.minimum(np.searchsorted(k, idx, side='right') - 1, len(k) - 2)
+        dist = _segment_distance(c, c[k[seg]], c[k[seg + 1]])
+        dist[keep] = 0.
+        # The farthest frame of each segment
+        order = np.lexsort((-dist, seg))
+        first = order[np.r_[0, np.flatnonzero(np.diff(seg[order])) + 1]]
+        split = first[dist[first] > tol]
+        if max_step is not None:
+            # Too long moves are halved
+            long_seg = (np.abs(np.diff(c[k], axis=0)) > max_step).any(axis=1) & (np.diff(k) > 1)
+            split = np.union1d(split, (k[:-1][long_seg] + k[1:][long_seg]) // 2)
+        if len(split) == 0:
+            break
+        keep[split] = True
+    report = {'frames_in': n,
+              'frames_out': int(keep.sum()),
+              'reduction': float(1. - keep.sum() / n),
+              'max_deviation': float(dist.max())}
+    return c[keep], report
+
+HELIOS_AXES = ('alt', 'azi')
+
+def check_scene_kinematics(c, dt, max_speed, max_accel):
+    # Frames played every dt seconds against the [alt, azi] limits in deg/s
+    # and deg/s^2. Returns the violations, each with the frame where the
+    # limit is exceeded: the speed reaching frame i, the acceleration at i.
+    c = np.asarray(c, dtype=float)
+    max_speed = np.broadcast_to(np.asarray(max_speed, dtype=float), (2,))
+    max_accel = np.broadcast_to(np.asarray(max_accel, dtype=float), (2,))
+    v = np.diff(c, axis=0) / dt
+    a = np.diff(v, axis=0) / dt
+    violations = []
+    for kind, x, lim, first in [('speed', v, max_speed, 1), ('accel', a, max_accel, 1)]:
+        # 1e-9 leaves out the rounding of limits met exactly
+        frame, axis = np.nonzero(np.abs(x) > lim * (1. + 1e-9))
+        for i, j in zip(frame, axis):
+            violations += [{'frame': int(i + first), 'axis': HELIOS_AXES[j], 'kind': kind,
+                            'value': float(abs(x[i, j])), 'limit': float(lim[j])}]
+    return sorted(violations, key=lambda x: x['frame'])
+
+def _speed_profile(c, max_speed, max_accel):
+    # Fastest path speed (deg/s along the arc length s) at each frame of the
+    # path c, starting and ending at rest. Turning may take at most half of
+    # each axis acceleration, speeding up and slowing down get what turning
+    # leaves at the speed cap of the frame (all of it on straight stretches).
+    # The forward/backward passes v[i]^2 <= v[j]^2 + 2 a (s[i] - s[j]) are
+    # running minima of prefix sums, no loop over frames.
+    ds = np.linalg.norm(np.diff(c, axis=0), axis=1)
+    s = np.r_[0., np.cumsum(ds)]
+    d1 = np.abs(np.gradient(c, s, axis=0))
+    d2 = np.abs(np.gradient(np.gradient(c, s, axis=0), s, axis=0))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        vlim = np.min(np.where(d1 > 0., max_speed / d1, np.inf), axis=1)
+        vlim = np.minimum(vlim, np.min(np.where(d2 > 0., np.sqrt(0.5 * max_accel / d2), np.inf), axis=1))
+        turn = d2 * np.minimum(vlim, 1e6)[:, None] ** 2
+        acc = np.min(np.where(d1 > 0., (max_accel - turn) / d1, np.inf), axis=1)
+    acc = np.minimum(acc[:-1], acc[1:])
+    vlim[[0, -1]] = 0.
+    vlim = np.minimum(vlim, 1e6)
+    acc = np.minimum(acc, 1e6)
+
+    effort = np.r_[0., np.cumsum(2. * acc * ds)]
+    v2 = vlim ** 2
+    v2 = np.minimum(v2, effort + np.minimum.accumulate(v2 - effort))
+    back = effort[-1] - effort
+    v2 = np.minimum(v2, (back + np.minimum.accumulate((v2 - back)[::-1])[::-1]))
+    return s, ds, np.sqrt(np.maximum(v2, 0.)), acc
+
+def retime_scene(c, dt, max_speed, max_accel, max_frames=None, max_iter=20):
+    # Replays the path of the dense scene c (e.g. from interp_scene) as fast
+    # as the axis limits allow, sampled on the dt grid of the device. The
+    # time law comes from _speed_profile; the sampled frames are then
+    # checked with check_scene_kinematics and, if some discretisation error
+    # is left, time is stretched until they pass. Returns the frames and a
+    # report; report['violations'] lists what is still wrong (only if
+    # max_iter is not enough) and report['too_long'] tells if the result
+    # does not fit max_frames.
+    c = np.asarray(c, dtype=float)
+    max_speed = np.broadcast_to(np.asarray(max_speed, dtype=float), (2,))
+    max_accel = np.broadcast_to(np.asarray(max_accel, dtype=float), (2,))
+    report = {'frames_in': c.shape[0],
+              'input_violations': check_scene_kinematics(c, dt, max_speed, max_accel)}
+
+    # Repeated frames carry no motion
+    c = c[np.r_[True, np.linalg.norm(np.diff(c, axis=0), axis=1) > 0.]]
+    if c.shape[0] < 2:
+        report.update({'frames': c.shape[0], 'duration': 0., 'stretch': 1., 'violations': [], 'too_long': False})
+        return c.copy(), report
+
+    s, ds, v, acc = _speed_profile(c, max_speed, max_accel)
+    vsum = v[:-1] + v[1:]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        seg_t = np.where(vsum > 0., 2. * ds / vsum, 2. * np.sqrt(ds / acc))
+    t = np.r_[0., np.cumsum(seg_t)]
+
+    stretch = 1.
+    for i in range(max_iter):
+        n = int(np.ceil(t[-1] * stretch / dt)) + 1
+        grid = np.minimum(np.arange(n) * dt / stretch, t[-1])
+        out = np.c_[np.interp(grid, t, c[:, 0]), np.interp(grid, t, c[:, 1])]
+        violations = check_scene_kinematics(out, dt, max_speed, max_accel)
+        if len(violations) == 0:
+            break
+        excess = max(x['value'] / x['limit'] if x['kind'] == 'speed' else np.sqrt(x['value'] / x['limit'])
+                     for x in violations)
+        stretch *= max(excess, 1.01)
+
+    report.update({'frames': out.shape[0],
+                   'duration': (out.shape[0] - 1) * dt,
+                   'stretch': stretch,
+                   'violations': violations,
+                   'too_long': max_frames is not None and out.shape[0] > max_frames})
+    return out, report
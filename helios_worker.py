@@ -0,0 +1,176 @@
+import threading
+import time
+import queue
+from concurrent.futures import Future
+
+from helios_protocol import log
+
+# One I/O thread per unit, so that blocking telnet exchanges never run on
+# the Tk main thread. Requests are queued and run in order; each returns a
+# Future, and an optional callback(result) is handed over to the results
+# queue, to be called from the GUI thread by apply_results():
+#
+#   w = HeliosWorker(h, results)
+#   w.submit(h.get_status, callback=self.apply_status)
+#   ...
+#   apply_results(results)   # periodically, from window.after
+
+class HeliosWorker:
+    def __init__(self, unit, results=None, name=None):
+        # unit may be None for workers not bound to a unit (e.g. the fleet
+        # loader), name then defaults to 'loader'
+        self.unit = unit
+        self.results = results
+        self.requests = queue.Queue()
+        self.busy = False
+        if name is None:
+            name = str(unit.ip_addr) if unit is not None else 'loader'
+        self.thread = threading.Thread(target=self._run, daemon=True,
+                                       name="helios-io-{:s}".format(name))
+        self.thread.start()
+
+    def submit(self, fn, *args, callback=None, **kwargs):
+        future = Future()
+        self.requests.put((future, fn, args, kwargs, callback))
+        return future
+
+    def pending(self):
+        return self.requests.qsize() + int(self.busy)
+
+    def close(self):
+        self.requests.put(None)
+
+    def _run(self):
+        while True:
+            req = self.requests.get()
+            if req is None:
+                break
+            future, fn, args, kwargs, callback = req
+            if not future.set_running_or_notify_cancel():
+                continue
+            self.busy = True
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+            self.busy = False
+            if callback is not None and self.results is not None:
+                self.results.put((callback, future))
+
+def apply_results(results, max_items=100):
+    # Runs the callbacks of the finished requests, returns how many ran
+    n = 0
+    while n < max_items:
+        try:
+            callback, future = results.get_nowait()
+        except queue.Empty:
+            break
+        n += 1
+        if future.exception() is not None:
+            log.warning("I/O request failed: %r", future.exception())
+            continue
+        callback(future.result())
+    return n
+
+class SetpointChannel:
+    # Latest-wins delivery of motion targets (e.g. solar_move/absolute_move
+    # while jogging) through a unit worker. At most one send is in flight;
+    # targets set meanwhile overwrite each other and only the newest is sent
+    # when the link frees up, so the send rate follows the round trip time.
+    # min_period caps the rate on fast links. A target whose send fails is
+    # sent again as soon as the session of the unit allows a reconnect, but
+    # targets older than max_age seconds are dropped: a late jog target
+    # would move the mirror after the operator stopped.
+    def __init__(self, worker, min_period=0.05, alpha=0.2, max_age=1.):
+        self.worker = worker
+        self.min_period = min_period
+        self.alpha = alpha
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.target = None
+        self.in_flight = False
+        self.last_sent = 0.
+        self.rtt = None
+        self.sent = 0
+        self.coalesced = 0
+        self.failed = 0
+        self.stale = 0
+
+    def set(self, fn, *args):
+        with self.lock:
+            if self.target is not None:
+                self.coalesced += 1
+            self.target = (fn, args, time.monotonic())
+            if self.in_flight:
+                return
+            self.in_flight = True
+        self.worker.submit(self._drain)
+
+    def flush(self):
+        # Resends a pending target, if any and none is in flight
+        with self.lock:
+            if self.target is None or self.in_flight:
+                return
+            self.in_flight = True
+        self.worker.submit(self._drain)
+
+    def pending(self):
+        return self.target is not None
+
+    def _drain(self):
+        while True:
+            wait = self.last_sent + self.min_period - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            with self.lock:
+                if self.target is None:
+                    self.in_flight = False
+                    return
+                fn, args, t_set = self.target
+                self.target = None
+                if time.monotonic() - t_set > self.max_age:
+                    self.stale += 1
+                    continue
+
+            t0 = time.monotonic()
+            try:
+                ok = fn(*args)
+            except Exception as e:
+                log.warning("Setpoint failed: %r", e)
+                ok = False
+            self.last_sent = time.monotonic()
+            if not ok:
+                with self.lock:
+                    self.failed += 1
+                    if self.target is None:
+                        self.target = (fn, args, t_set)
+                    self.in_flight = False
+                self._retry()
+                return
+            rtt = self.last_sent - t0
+            self.rtt = rtt if self.rtt is None else (1 - self.alpha) * self.rtt + self.alpha * rtt
+            self.sent += 1
+
+    def _retry(self):
+        # Schedules the flush of a failed target for when the unit session
+        # allows a new attempt, drops it if it would be stale by then
+        wait = self.min_period
+        session = getattr(self.worker.unit, 'session', None)
+        if session is not None:
+            wait = max(wait, session.next_attempt - time.monotonic())
+        with self.lock:
+            if self.target is None:
+                return
+            if time.monotonic() - self.target[2] + wait > self.max_age:
+                self.target = None
+                self.stale += 1
+                return
+        timer = threading.Timer(wait, self.flush)
+        timer.daemon = True
+        timer.start()
+
+    def rate(self):
+        # Expected sends per second while jogging
+        if self.rtt is None:
+            return 1. / self.min_period
+        return 1. / max(self.rtt, self.min_period)
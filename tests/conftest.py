@@ -0,0 +1,19 @@
+import os
+import sys
+
+import pytest
+
+# The client modules live at the top of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from helios_simulator import HeliosSimulatorPool
+
+@pytest.fixture
+def sim_pool():
+    pool = HeliosSimulatorPool()
+    yield pool
+    pool.close()
+
+@pytest.fixture
+def sim(sim_pool):
+    return sim_pool.spawn()[0]
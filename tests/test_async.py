@@ -0,0 +1,84 @@
+import asyncio
+
+import numpy as np
+
+from helios_async import AsyncHeliosUnit, connect_fleet
+
+def _create(sim, **kwargs):
+    return AsyncHeliosUnit.create('127.0.0.1', port=sim.port, settle=0., **kwargs)
+
+def test_create_and_load_state(sim):
+    async def _main():
+        h = await _create(sim)
+        assert h is not None
+        assert h.id == sim.id and h.nickname == sim.id
+        assert h.cfg['SCENE_LEN'] == 120
+        assert 'helios-net' in h.wifi_conn
+        assert await h.get_id() == sim.id
+        await h.disconnect()
+    asyncio.run(_main())
+
+def test_concurrent_commands(sim):
+    # Commands from many tasks share the link, each gets its own answer
+    async def _main():
+        h = await _create(sim)
+        res = await asyncio.gather(*[h.get_id() for i in range(20)],
+                                   *[h.get_geo() for i in range(5)])
+        assert res[:20] == [sim.id] * 20
+        assert all(r is not False and r is not None for r in res[20:])
+        await h.disconnect()
+    asyncio.run(_main())
+
+def test_timeout_drops_link_and_reconnects(sim):
+    async def _main():
+        h = await _create(sim)
+        h.session.backoff = 0.
+        sim.latency = 0.5
+        assert await h.get_id(timeout=0.1) is False
+        assert h.writer is None
+        assert sum(h.metrics.timeouts.values()) == 1
+        sim.latency = 0.
+        assert await h.get_id() == sim.id
+        assert h.metrics.reconnects == 1
+        await h.disconnect()
+    asyncio.run(_main())
+
+def test_upload_and_get_scene(sim):
+    data = np.c_[np.linspace(10., 40., 60), np.linspace(100., 160., 60)]
+    async def _main():
+        h = await _create(sim)
+        assert await h.upload_scene('sweep', data, window=8)
+        assert h.scenes_frames['sweep'] == 60
+        assert np.allclose(await h.get_scene('sweep'), np.round(data, 1))
+        assert await h.delete_scene('sweep')
+        assert 'sweep' not in h.scenes
+        await h.disconnect()
+    asyncio.run(_main())
+
+def test_apply_config_and_wifi(sim):
+    async def _main():
+        h = await _create(sim)
+        res = await h.apply_config({'alt_kp': 0.8, 'alte0': 13.5})
+        assert res.ok() and sorted(res.applied) == ['alt_kp', 'alte0']
+        assert sim.cfg['ALT_KP'] == 0.8 and sim.cfg['ALT_ENCODER_ZERO'] == 13.5
+        assert await h.add_wifi_network('field', 'secret')
+        assert 'field' in h.wifi_conn
+        assert await h.delete_wifi_network('field')
+        assert 'field' not in h.wifi_conn
+        assert await h.check_device_clock()
+        await h.disconnect()
+    asyncio.run(_main())
+
+def test_create_many(sim_pool):
+    # One loop connects several units at once, None for the dead ones
+    sims = sim_pool.spawn(3)
+    async def _main():
+        units = await asyncio.gather(*[AsyncHeliosUnit.create('127.0.0.1', 'u{:d}'.format(i), port=s.port, settle=0.)
+                                       for i, s in enumerate(sims)],
+                                     AsyncHeliosUnit.create('127.0.0.1', 'dead', port=1, timeout=1., settle=0.))
+        assert [h.nickname for h in units[:3]] == ['u0', 'u1', 'u2']
+        assert units[3] is None
+        for h in units[:3]:
+            await h.disconnect()
+        assert await connect_fleet([('127.0.0.1', 'dead')], timeout=1., settle=0.) == [None]
+    asyncio.run(_main())
@@ -0,0 +1,43 @@
+import json
+import os
+import subprocess
+import sys
+
+from helios_benchmark import run_benchmarks, compare, format_time
+
+def _results(**times):
+    return {'meta': {}, 'results': times}
+
+def test_compare():
+    base = _results(a=1e-3, b=1e-3, c=1e-3)
+    new = _results(a=0.5e-3, b=1.4e-3, c=2e-3, d=1.)
+    rows, regressions = compare(base, new)
+    assert regressions == ['c']
+    assert rows[0] == ('a', 1e-3, 0.5e-3, 2.)
+    assert rows[3] == ('d', None, 1., None)
+    assert compare(base, new, tolerance=2.5)[1] == []
+
+def test_format_time():
+    assert format_time(None) == '-'
+    assert format_time(2.5e-6) == '2.5 us'
+    assert format_time(0.0123) == '12.30 ms'
+    assert format_time(3.) == '3.00 s'
+
+def test_run_benchmarks():
+    r = run_benchmarks(['trajectory', 'protocol'], quick=True, latency=0.)
+    assert r['meta']['quick'] and r['meta']['latency_s'] == 0.
+    assert 'retime_scene.120_frames' in r['results'] and 'upload_scene_120' in r['results']
+    assert all(t > 0 for t in r['results'].values())
+
+def test_baseline_regression_exit_code(tmp_path):
+    script = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'helios_benchmark.py')
+    cmd = [sys.executable, script, '--groups', 'trajectory', '--quick']
+    out = tmp_path / 'run.json'
+    assert subprocess.run(cmd + ['-o', str(out)], capture_output=True).returncode == 0
+    # The same run against a baseline ten times faster fails
+    base = json.loads(out.read_text())
+    base['results'] = {k: t / 10. for k, t in base['results'].items()}
+    fast = tmp_path / 'fast.json'
+    fast.write_text(json.dumps(base))
+    p = subprocess.run(cmd + ['--baseline', str(fast)], capture_output=True, text=True)
+    assert p.returncode == 1 and 'Regressions beyond 1.50x' in p.stdout
@@ -0,0 +1,49 @@
+from helios_interface import HeliosUnit, config_prm_name, check_prm_value
+
+def _unit(sim, **kwargs):
+    return HeliosUnit('127.0.0.1', port=sim.port, settle=0., **kwargs)
+
+def test_config_transaction(sim):
+    h = _unit(sim)
+    tx = h.config_transaction()
+    assert tx.set('alte0', 13.5)
+    assert tx.set('ALT_KP', 0.8)
+    assert not tx.set('NOT_A_PARAMETER', 1.)
+    assert not tx.set('alt_kp', 'fast')
+    res = tx.commit()
+    assert res.ok()
+    assert sorted(res.applied) == ['alt_kp', 'alte0']
+    assert sim.cfg['ALT_ENCODER_ZERO'] == 13.5 and sim.cfg['ALT_KP'] == 0.8
+    assert h.get_cfg()['ALT_KP'] == 0.8
+    h.disconnect()
+
+def test_config_transaction_rejected(sim):
+    h = _unit(sim)
+    set_prm = sim._cmd_set
+    def _set(args):
+        if args[0] == 'azi_kp':
+            return False, ["Rejected"]
+        return set_prm(args)
+    sim._cmd_set = _set
+    res = h.apply_config({'alt_kp': 0.9, 'azi_kp': 0.7})
+    assert not res.ok()
+    assert res.applied == ['alt_kp'] and res.failed == {'azi_kp': 'rejected'}
+    assert res.reloaded
+    assert sim.cfg['AZI_KP'] == 1.2
+    h.disconnect()
+
+def test_prm_names_and_values():
+    assert config_prm_name('ALT_ENCODER_ZERO') == 'alte0'
+    assert config_prm_name('logl') == 'logl'
+    assert config_prm_name('SCENE_LEN') is None
+    assert check_prm_value('alte0', '12.5') == 12.5
+    assert check_prm_value('logl', 3.) == 3 and isinstance(check_prm_value('logl', 3.), int)
+    assert check_prm_value('logl', 2.5) is None
+    assert check_prm_value('alte0', True) is None
+    assert check_prm_value('alte0', float('nan')) is None
+
+def test_empty_transaction(sim):
+    h = _unit(sim)
+    res = h.config_transaction().commit()
+    assert res.ok() and res.applied == []
+    h.disconnect()
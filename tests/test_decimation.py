@@ -0,0 +1,70 @@
+import numpy as np
+
+from helios_interface import HeliosUnit
+from helios_trajectory import decimate_scene, check_scene_kinematics, _segment_distance
+
+def _scene(n=120):
+    t = np.linspace(0., 1., n)
+    return np.c_[20. + 30. * np.sin(np.pi * t), 100. + 80. * t]
+
+def _deviation(c, kept):
+    # Largest distance of the frames of c from the polyline of kept
+    # (whose frames are a subset of c, in order)
+    idx = [int(np.flatnonzero((c == k).all(axis=1))[0]) for k in kept]
+    d = 0.
+    for a, b in zip(idx[:-1], idx[1:]):
+        seg = c[a:b+1]
+        d = max(d, _segment_distance(seg, np.tile(c[a], (len(seg), 1)), np.tile(c[b], (len(seg), 1))).max())
+    return d
+
+def test_decimate_within_tolerance():
+    c = _scene()
+    for tol in [0.01, 0.1, 1.]:
+        out, report = decimate_scene(c, tol)
+        assert (out[0] == c[0]).all() and (out[-1] == c[-1]).all()
+        assert report['frames_out'] == len(out) < len(c)
+        assert report['max_deviation'] <= tol
+        assert _deviation(c, out) <= tol + 1e-9
+
+def test_decimate_tighter_keeps_more():
+    c = _scene()
+    n = [len(decimate_scene(c, tol)[0]) for tol in [1., 0.1, 0.01]]
+    assert n[0] <= n[1] <= n[2]
+
+def test_decimate_max_step():
+    c = np.c_[np.linspace(0., 60., 61), np.full(61, 100.)]
+    out, report = decimate_scene(c, 0.1, [4., 5.])
+    assert len(out) < len(c)
+    assert (np.abs(np.diff(out, axis=0)) <= [4., 5.]).all()
+    assert len(decimate_scene(c, 0.1)[0]) == 2
+
+def test_decimate_short_scenes():
+    for n in [0, 1, 2]:
+        c = _scene(n) if n > 0 else np.zeros((0, 2))
+        out, report = decimate_scene(c, 0.1)
+        assert out.shape == (n, 2)
+        assert report['frames_out'] == n and report['reduction'] == 0.
+
+def test_decimate_keeps_holds():
+    assert decimate_scene(np.zeros((5, 2)), 0.1)[0].shape == (5, 2)
+    ramp = np.c_[np.linspace(0., 10., 11), np.zeros(11)]
+    c = np.r_[ramp, np.tile([[10., 0.]], (6, 1)), ramp + [10., 0.]]
+    out, report = decimate_scene(c, 0.1)
+    # Both ramps collapse, the 8 frames at 10 deg stay
+    assert (out[:, 0] == [0.] + [10.] * 8 + [20.]).all()
+
+def test_upload_decimated_sweep(sim):
+    # Up and back down: the reversal must not come out too fast
+    t = np.linspace(0., 1., 120)
+    c = np.round(np.c_[20. + 25. * np.sin(np.pi * t), 100. + 20. * t], 1)
+    h = HeliosUnit('127.0.0.1', port=sim.port, settle=0.)
+    max_speed, max_accel, dt = h.scene_limits()
+    assert h.upload_scene('sweep', c, tolerance=0.2)
+    report = h.last_decimation
+    assert report['violations'] == []
+    assert report['frames_in'] == 120 and report['frames_out'] < 120
+    assert h.scenes_frames['sweep'] == report['frames_out']
+    out = h.get_scene('sweep')
+    assert check_scene_kinematics(out, dt, max_speed, max_accel) == []
+    assert _deviation(c, out) <= 0.2 + 1e-9
+    h.disconnect()
@@ -0,0 +1,70 @@
+import numpy as np
+
+from helios_interface import HeliosUnit
+from helios_fleet import distribute_scenes, load_scene_library
+
+def _unit(sim, **kwargs):
+    return HeliosUnit('127.0.0.1', port=sim.port, settle=0., **kwargs)
+
+def _library():
+    t = np.linspace(0., 1., 30)
+    return {'a': np.round(np.c_[20. + 10. * t, 100. + 50. * t], 1),
+            'b': np.round(np.c_[40. - 10. * t, 200. - 50. * t], 1)}
+
+def test_distribute_scenes(sim_pool):
+    sims = sim_pool.spawn(3)
+    units = [_unit(s, nickname='u{:d}'.format(i)) for i, s in enumerate(sims)]
+    library = _library()
+    # u1 already holds a, u2 holds an older b
+    assert units[1].upload_scene('a', library['a'])
+    assert units[2].upload_scene('b', library['b'] + 1.)
+    progress = []
+    report = distribute_scenes(units, library, progress=lambda *p: progress.append(p))
+    assert report.failed == {}
+    assert sorted(report.uploaded['u0']) == ['a', 'b'] and report.skipped['u0'] == []
+    assert report.uploaded['u1'] == ['b'] and report.skipped['u1'] == ['a']
+    assert sorted(report.uploaded['u2']) == ['a', 'b'] and report.skipped['u2'] == []
+    assert report.total_frames() == 5 * 30
+    assert ('u0', 60, 60) in progress
+    for s in sims:
+        assert sorted(name for name, frames in s.scenes) == ['a', 'b']
+        assert all(len(frames) == 30 for name, frames in s.scenes)
+
+    # All up to date now
+    report = distribute_scenes(units, library)
+    assert report.total_frames() == 0
+    assert all(sorted(report.skipped[u.nickname]) == ['a', 'b'] for u in units)
+    for h in units:
+        h.disconnect()
+
+def test_distribute_duplicate_units(sim_pool):
+    sim = sim_pool.spawn()[0]
+    a = _unit(sim, nickname='a')
+    b = _unit(sim, nickname='b')
+    report = distribute_scenes([a, b], _library())
+    assert sorted(report.uploaded['a']) == ['a', 'b']
+    assert list(report.failed.values()) == [{'*': "duplicate unit"}]
+    assert len(sim.scenes) == 2
+    a.disconnect()
+    b.disconnect()
+
+def test_distribute_unreachable_unit(sim_pool):
+    sim = sim_pool.spawn()[0]
+    h = _unit(sim, nickname='u')
+    sim._cmd_list_scene = lambda args: (False, ["Busy"])
+    report = distribute_scenes([h], _library())
+    assert report.failed == {'u': {'*': "cannot list scenes"}}
+    assert report.uploaded['u'] == []
+    h.disconnect()
+
+def test_load_scene_library(tmp_path):
+    library = _library()
+    np.save(str(tmp_path / 'a.npy'), library['a'])
+    np.savetxt(str(tmp_path / 'b.csv'), library['b'], delimiter=',')
+    np.save(str(tmp_path / 'flat.npy'), np.arange(10.))
+    np.save(str(tmp_path / 'long.npy'), np.zeros((200, 2)))
+    (tmp_path / 'broken.csv').write_text("1,2\nthree,4\n")
+    (tmp_path / 'notes.txt').write_text("not a scene")
+    res = load_scene_library(str(tmp_path))
+    assert sorted(res) == ['a', 'b']
+    assert np.allclose(res['a'], library['a']) and np.allclose(res['b'], library['b'])
@@ -0,0 +1,66 @@
+import numpy as np
+
+from helios_ephemeris import (SunEphemerisCache, sun_position, sun_position_noaa,
+                               sun_position_astropy, to_unix_seconds)
+
+LOC = (11.34, 44.49)
+
+def _angle_diff(a, b):
+    return np.abs(np.mod(np.asarray(a) - b + 180., 360.) - 180.)
+
+def _day(date='2024-06-21', step_min=30):
+    start = np.datetime64(date + 'T00:00:00', 'us')
+    return start + np.arange(0, 24 * 60, step_min) * np.timedelta64(60 * 10**6, 'us')
+
+def test_time_formats():
+    t = np.datetime64('2024-06-21T10:00:00', 'us')
+    unix = to_unix_seconds(t)
+    assert unix == to_unix_seconds('2024-06-21T10:00:00') == to_unix_seconds(float(unix))
+    assert sun_position_noaa(LOC[0], LOC[1], t) == sun_position_noaa(LOC[0], LOC[1], unix)
+
+def test_noaa_matches_astropy():
+    for date in ['2024-03-20', '2024-06-21', '2024-12-21']:
+        t = _day(date)
+        az, alt = sun_position_noaa(LOC[0], LOC[1], t)
+        ref_az, ref_alt = sun_position_astropy(LOC[0], LOC[1], t)
+        assert np.abs(alt - ref_alt).max() < 0.05
+        # Azimuth weighted by the horizontal projection, ill defined at zenith
+        assert (_angle_diff(az, ref_az) * np.cos(np.radians(ref_alt))).max() < 0.05
+
+def test_noaa_broadcasts():
+    t = _day()[:6]
+    lat = np.array([0., 45., 60.])
+    az, alt = sun_position_noaa(LOC[0], lat[:, None], t[None, :])
+    assert az.shape == alt.shape == (3, 6)
+    for i, la in enumerate(lat):
+        a, b = sun_position_noaa(LOC[0], la, t)
+        assert np.allclose(az[i], a) and np.allclose(alt[i], b)
+    az, alt = sun_position_noaa(LOC[0], LOC[1], t[0])
+    assert np.ndim(az) == 0 and np.ndim(alt) == 0
+
+def test_cached_tables_interpolate():
+    cache = SunEphemerisCache(step_s=60., backend='noaa')
+    t = _day(step_min=7)
+    az, alt = cache.sun_position(LOC[0], LOC[1], t)
+    ref_az, ref_alt = sun_position_noaa(LOC[0], LOC[1], t)
+    assert np.abs(alt - ref_alt).max() < 0.01
+    assert (_angle_diff(az, ref_az) * np.cos(np.radians(ref_alt))).max() < 0.01
+    # One table for the whole day
+    assert cache.stats()['tables'] == 1 and cache.stats()['misses'] == 1
+    cache.sun_position(LOC[0], LOC[1], t[5])
+    assert cache.stats()['hits'] == 1
+
+def test_cached_tables_per_site_and_day():
+    cache = SunEphemerisCache(step_s=300., max_days=2, backend='noaa')
+    t = np.r_[_day('2024-06-21', 120), _day('2024-06-22', 120)]
+    lat = np.r_[np.full(12, 44.49), np.full(12, 45.)]
+    az, alt = cache.sun_position(LOC[0], lat[:, None], t[None, :])
+    assert az.shape == (24, 24)
+    ref_az, ref_alt = sun_position_noaa(LOC[0], lat[:, None], t[None, :])
+    assert np.abs(alt - ref_alt).max() < 0.05
+    # 2 sites x 2 days, only the 2 most recent kept
+    assert cache.stats()['misses'] == 4 and cache.stats()['tables'] == 2
+
+def test_default_backend_is_cached():
+    t = _day()[20]
+    assert np.allclose(sun_position(LOC[0], LOC[1], t), sun_position_noaa(LOC[0], LOC[1], t), atol=0.05)
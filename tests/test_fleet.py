@@ -0,0 +1,48 @@
+import time
+
+import helios_fleet
+from helios_fleet import load_fleet
+
+def test_load_fleet(sim_pool):
+    sims = sim_pool.spawn(3)
+    fleet = [('127.0.0.1:{:d}'.format(s.port), 'u{:d}'.format(i)) for i, s in enumerate(sims)]
+    fleet += [('127.0.0.1:1', 'dead')]
+    report = load_fleet(fleet, timeout=1, settle=0.)
+    assert [h.nickname for h in report.units] == ['u0', 'u1', 'u2']
+    assert list(report.failed) == ['dead']
+    for h in report.units:
+        h.disconnect()
+
+def test_load_fleet_closes_abandoned_units(sim_pool, monkeypatch):
+    sim = sim_pool.spawn()[0]
+    late = []
+    bootstrap = helios_fleet._bootstrap_unit
+    def _slow_bootstrap(*args):
+        h, dt = bootstrap(*args)
+        late.append(h)
+        time.sleep(0.5)
+        return h, dt
+    monkeypatch.setattr(helios_fleet, '_bootstrap_unit', _slow_bootstrap)
+
+    report = load_fleet([('127.0.0.1:{:d}'.format(sim.port), 'slow')], timeout=0.1, settle=0.)
+    assert report.units == []
+    assert 'slow' in report.failed
+    deadline = time.monotonic() + 5
+    while (len(late) == 0 or late[0].tn is not None or len(sim.sessions) > 0) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert len(late) == 1 and late[0].tn is None
+    assert len(sim.sessions) == 0
+
+def test_load_fleet_duplicates(sim_pool):
+    a, b = sim_pool.spawn(2)
+    fleet = [('127.0.0.1:{:d}'.format(a.port), 'A'),
+             ('127.0.0.1:{:d}'.format(b.port), 'A'),
+             ('127.0.0.1:{:d}'.format(a.port), 'B'),
+             ('127.0.0.1:{:d}'.format(b.port), 'C')]
+    report = load_fleet(fleet, timeout=1, settle=0.)
+    assert [h.nickname for h in report.units] == ['A', 'C']
+    assert sorted(report.failed.values()) == ["duplicate fleet entry"] * 2
+    # The duplicates were never connected
+    assert a.n_connections == 1 and b.n_connections == 1
+    for h in report.units:
+        h.disconnect()
@@ -0,0 +1,55 @@
+import numpy as np
+
+from helios_geometry import (ory2mir, mir2ory, geo_to_absolute, absolute_to_geo,
+                             get_sun_unit_vec, get_normal_vec, get_reflected_vec)
+
+LOC = (11.34, 44.49)
+T = '2024-06-21T10:00:00'
+
+def _targets(n=50):
+    rng = np.random.default_rng(0)
+    return rng.uniform(1., 80., n), rng.uniform(0., 359., n)
+
+def _angle_diff(a, b):
+    return np.abs(np.mod(np.asarray(a) - b + 180., 360.) - 180.)
+
+def test_geo_round_trip():
+    alt, azi = _targets()
+    v = geo_to_absolute(alt, azi)
+    assert v.shape == (50, 3)
+    assert np.allclose(np.linalg.norm(v, axis=-1), 1.)
+    alt2, azi2 = absolute_to_geo(v)
+    assert np.allclose(alt2, alt) and _angle_diff(azi2, azi).max() < 1e-9
+
+def test_reflection_law():
+    alt, azi = _targets()
+    ory = geo_to_absolute(alt, azi)
+    sun = get_sun_unit_vec(LOC, T)
+    mir = get_normal_vec(sun, ory)
+    assert np.allclose(np.linalg.norm(mir, axis=-1), 1.)
+    assert np.allclose(get_reflected_vec(sun, mir), ory)
+
+def test_arrays_match_scalars():
+    alt, azi = _targets(10)
+    m_alt, m_azi = ory2mir(alt, azi, LOC, T)
+    o_alt, o_azi = mir2ory(alt, azi, LOC, T)
+    for i in range(10):
+        a, z = ory2mir(alt[i], azi[i], LOC, T)
+        assert np.ndim(a) == 0
+        assert np.isclose(a, m_alt[i]) and _angle_diff(z, m_azi[i]) < 1e-9
+        a, z = mir2ory(alt[i], azi[i], LOC, T)
+        assert np.isclose(a, o_alt[i]) and _angle_diff(z, o_azi[i]) < 1e-9
+
+def test_ory_mir_round_trip():
+    alt, azi = _targets()
+    m_alt, m_azi = ory2mir(alt, azi, LOC, T)
+    o_alt, o_azi = mir2ory(m_alt, m_azi, LOC, T)
+    assert np.allclose(o_alt, alt) and _angle_diff(o_azi, azi).max() < 1e-6
+
+def test_broadcast_mirrors_and_times():
+    alt, azi = _targets(4)
+    t = np.datetime64(T, 'us') + np.arange(6) * np.timedelta64(600 * 10**6, 'us')
+    m_alt, m_azi = ory2mir(alt[:, None], azi[:, None], LOC, t)
+    assert m_alt.shape == m_azi.shape == (4, 6)
+    a, z = ory2mir(alt[2], azi[2], LOC, t[3])
+    assert np.isclose(a, m_alt[2, 3]) and _angle_diff(z, m_azi[2, 3]) < 1e-9
@@ -0,0 +1,35 @@
+import pytest
+
+from helios_interface import HeliosUnit
+
+def _unit(sim, **kwargs):
+    return HeliosUnit('127.0.0.1', port=sim.port, settle=0., **kwargs)
+
+def test_lazy_state(sim):
+    h = _unit(sim, lazy=True)
+    assert 'cfg' not in h.__dict__
+    assert h.cfg['SCENE_LEN'] == 120
+    assert h.nickname == sim.id
+    h.disconnect()
+
+def test_lazy_state_failure(sim):
+    h = _unit(sim, lazy=True)
+    sim._cmd_id = lambda args: (False, ["Busy"])
+    sim._cmd_get_geo = lambda args: (False, ["Busy"])
+    with pytest.raises(ConnectionError):
+        h.id
+    with pytest.raises(ConnectionError):
+        hasattr(h, 'lat')
+    assert 'id' not in h.__dict__
+    del sim._cmd_id
+    assert h.nickname == sim.id
+    h.disconnect()
+
+def test_lazy_state_loads_one_group(sim):
+    h = _unit(sim, lazy=True)
+    n = sim.n_commands
+    assert h.wifi_conn is not None
+    # Only print-wifi was sent, the other groups stay unloaded
+    assert sim.n_commands == n + 1
+    assert 'cfg' not in h.__dict__ and 'wifi_conn' in h.__dict__
+    h.disconnect()
@@ -0,0 +1,65 @@
+import json
+
+import pytest
+
+from helios_interface import HeliosUnit
+from helios_metrics import *
+
+def _unit(sim, **kwargs):
+    return HeliosUnit('127.0.0.1', port=sim.port, settle=0., **kwargs)
+
+def test_histogram_percentile():
+    h = LatencyHistogram()
+    assert h.percentile(0.5) is None and h.mean() is None
+    for i in range(100):
+        h.observe(0.02)
+    # All in the (0.01, 0.025] bucket, interpolated inside it
+    assert h.percentile(0.5) == pytest.approx(0.0175)
+    assert h.percentile(1.) == pytest.approx(0.025)
+    h.observe(60.)
+    assert h.percentile(1.) == 10.
+    assert h.mean() == pytest.approx((2. + 60.) / 101)
+
+def test_histogram_merge():
+    a, b = LatencyHistogram(), LatencyHistogram()
+    a.observe(0.002)
+    b.observe(0.3)
+    b.observe(0.3)
+    a.merge(b)
+    assert a.count == 3 and a.sum == pytest.approx(0.602)
+    assert a.counts[1] == 1 and a.counts[8] == 2
+
+def test_unit_metrics(sim):
+    h = _unit(sim)
+    assert h.metrics.connects == 1
+    for i in range(5):
+        assert h.get_id() == sim.id
+    assert h.cmd_get_answare('not-a-command') is None
+    m = h.metrics.snapshot()
+    assert m['commands']['id']['count'] >= 5
+    assert m['commands']['not-a-command']['errors'] == 1 and m['errors'] == 1
+    assert m['bytes_in'] > 0 and m['bytes_out'] > 0
+    assert h.metrics.percentile(0.5, 'id') < 0.1
+    h.disconnect()
+
+def test_fleet_exports(sim_pool, tmp_path):
+    units = [_unit(s, nickname='u{:d}'.format(i)) for i, s in enumerate(sim_pool.spawn(2))]
+    units[0].get_id()
+    n = sum(u.metrics.histogram().count for u in units)
+    j = metrics_json(units)
+    assert sorted(j['units']) == ['u0', 'u1']
+    assert j['fleet']['count'] == n
+    json.dumps(j)
+
+    text = metrics_prometheus(units)
+    assert '# TYPE helios_command_duration_seconds histogram' in text
+    assert 'helios_command_duration_seconds_bucket{unit="u0",verb="id",le="+Inf"}' in text
+    assert 'helios_reconnects_total{unit="u1"} 0' in text
+    assert 'helios_fleet_command_duration_seconds{quantile="0.5"}' in text
+
+    fname = str(tmp_path / 'helios.prom')
+    write_prometheus(units, fname)
+    assert open(fname).read() == metrics_prometheus(units)
+    assert not (tmp_path / 'helios.prom.tmp').exists()
+    for u in units:
+        u.disconnect()
@@ -0,0 +1,57 @@
+from helios_interface import HeliosUnit
+
+def _unit(sim, **kwargs):
+    return HeliosUnit('127.0.0.1', port=sim.port, settle=0., **kwargs)
+
+def test_bootstrap(sim):
+    h = _unit(sim)
+    assert h.id == sim.id
+    assert h.cfg['SCENE_DT'] == 500.
+    assert 'helios-net' in h.wifi_conn
+    assert len(h.answer_window) == len(HeliosUnit.STATE_CMDS)
+    assert h.check_device_clock()
+    h.disconnect()
+
+def test_pipelined_window(sim):
+    h = _unit(sim)
+    writes = []
+    send = h._send
+    def _send(text):
+        writes.append(text.count('\n'))
+        send(text)
+    h._send = _send
+    ans = h.cmd_get_answares(['id'] * 50 + ['bogus-command', 'id'], window=4)
+    assert len(ans) == 52
+    assert ans[0] is not None and ans[:50] == [ans[0]] * 50
+    assert ans[50] is None
+    assert ans[51] is not None
+    assert max(writes) <= 4 and sum(writes) == 52
+    # Still in sync with the unit
+    assert h.get_id() == sim.id
+    h.disconnect()
+
+def test_wifi_without_print_wifi_answer(sim):
+    h = _unit(sim)
+    sim._cmd_print_wifi = lambda args: (False, ["Busy"])
+    assert h.add_wifi_network('other', 'secret')
+    assert sim.wifi[-1] == ['other', 'secret']
+    h.disconnect()
+
+def test_pipeline_drops_link_on_disconnect(sim):
+    h = _unit(sim)
+    h.session.backoff = 0.
+    sim.disconnect_prob = 1.
+    ans = h.cmd_get_answares(['id', 'configs', 'time'])
+    # The whole batch fails, the link is dropped and the next batch reconnects
+    assert ans == [None, None, None] and h.tn is None
+    sim.disconnect_prob = 0.
+    ans = h.cmd_get_answares(['id', 'time'])
+    assert ans[0] == [sim.id] and ans[1] is not None
+    h.disconnect()
+
+def test_pipeline_progress(sim):
+    h = _unit(sim)
+    done = []
+    h.cmd_get_answares(['id'] * 5, window=2, progress=lambda i, n: done.append((i, n)))
+    assert done == [(i, 5) for i in range(1, 6)]
+    h.disconnect()
@@ -0,0 +1,60 @@
+import numpy as np
+
+from helios_interface import HeliosUnit
+from helios_trajectory import interp_scene, check_scene_kinematics, retime_scene
+
+DT = 0.5
+MAX_SPEED = np.array([8., 10.])
+MAX_ACCEL = np.array([20., 20.])
+
+def test_check_scene_kinematics():
+    c = np.c_[np.r_[0., 2., 4., 10., 10.], np.zeros(5)]
+    v = check_scene_kinematics(c, DT, MAX_SPEED, MAX_ACCEL)
+    assert {(x['frame'], x['kind']) for x in v} == {(3, 'speed'), (3, 'accel')}
+    assert all(x['axis'] == 'alt' for x in v)
+    assert check_scene_kinematics(c[:3], DT, MAX_SPEED, MAX_ACCEL) == []
+
+def test_retime_passes_kinematics_check():
+    key = np.array([[20., 100.], [50., 140.], [25., 200.], [60., 230.], [30., 260.]])
+    c = interp_scene(key, 0., DT, 120)
+    assert len(check_scene_kinematics(c, DT, MAX_SPEED, MAX_ACCEL)) > 0
+    out, report = retime_scene(interp_scene(key, 0., 0.05, 1200), DT, MAX_SPEED, MAX_ACCEL, 120)
+    assert report['violations'] == []
+    assert check_scene_kinematics(out, DT, MAX_SPEED, MAX_ACCEL) == []
+    assert np.allclose(out[0], key[0]) and np.allclose(out[-1], key[-1])
+    assert report['frames'] == len(out)
+    assert report['duration'] == (len(out) - 1) * DT
+
+def test_retime_straight_move():
+    c = np.c_[np.linspace(0., 40., 401), np.full(401, 180.)]
+    out, report = retime_scene(c, DT, MAX_SPEED, MAX_ACCEL)
+    assert check_scene_kinematics(out, DT, MAX_SPEED, MAX_ACCEL) == []
+    # 40 deg at 8 deg/s take at least 5 s
+    assert report['duration'] >= 5.
+    assert not report['too_long']
+    assert retime_scene(c, DT, MAX_SPEED, MAX_ACCEL, max_frames=5)[1]['too_long']
+
+def test_retime_still_scene():
+    out, report = retime_scene(np.tile([[10., 20.]], (5, 1)), DT, MAX_SPEED, MAX_ACCEL)
+    assert len(out) == 1 and report['violations'] == []
+
+def test_unit_scene_limits(sim):
+    h = HeliosUnit('127.0.0.1', port=sim.port, settle=0.)
+    max_speed, max_accel, dt = h.scene_limits()
+    assert list(max_speed) == [8., 10.] and list(max_accel) == [20., 20.] and dt == 0.5
+    assert h.apply_config({'alt_Msv': 4.}).ok()
+    assert h.scene_limits()[0][0] == 4.
+    h.disconnect()
+
+def test_unit_retime_and_upload(sim):
+    h = HeliosUnit('127.0.0.1', port=sim.port, settle=0.)
+    key = np.array([[20., 100.], [50., 140.], [25., 200.]])
+    c = np.round(interp_scene(key, 0., DT, 60), 1)
+    assert len(h.check_scene(c)) > 0
+    out, report = h.retime_scene(interp_scene(key, 0., 0.05, 600))
+    assert report['violations'] == [] and not report['too_long']
+    assert len(out) <= sim.cfg['SCENE_LEN']
+    assert h.upload_scene('retimed', out)
+    # The copy on the unit (rounded to 0.1 deg) is still within the limits
+    assert h.check_scene(h.get_scene('retimed')) == []
+    h.disconnect()
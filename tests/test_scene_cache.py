@@ -0,0 +1,63 @@
+import numpy as np
+
+from helios_interface import HeliosUnit
+from helios_scene_cache import SceneCache, scene_hash
+
+def _unit(sim, **kwargs):
+    return HeliosUnit('127.0.0.1', port=sim.port, settle=0., **kwargs)
+
+def _frames(n=20, offset=0.):
+    # On the 0.1 deg grid of the unit
+    return np.round(np.c_[np.linspace(10., 20., n) + offset, np.linspace(100., 110., n)], 1)
+
+def test_scene_hash_resolution():
+    data = _frames()
+    assert scene_hash(data) == scene_hash(data + 0.02)
+    assert scene_hash(data) != scene_hash(data + 0.1)
+    assert scene_hash(data) != scene_hash(data[:-1])
+
+def test_cache_put_get(tmp_path):
+    c = SceneCache(str(tmp_path))
+    data = _frames()
+    h = c.put('U1', 'a', data)
+    # Same frames under another unit and name share the object
+    assert c.put('U2', 'b', data + 0.01) == h
+    assert len(list((tmp_path / 'objects').iterdir())) == 1
+    assert np.allclose(c.get('U1', 'a'), data)
+    assert c.get('U1', 'a', frames=len(data) + 1) is None
+    assert c.get('U1', 'b') is None
+    assert c.holds('U2', 'b', data) and not c.holds('U2', 'b', data + 1.)
+    c.forget('U1', 'a')
+    assert c.names('U1') == [] and c.names('U2') == ['b']
+    # The indexes are read back from disk
+    assert SceneCache(str(tmp_path)).entry('U2', 'b') == {'hash': h, 'frames': len(data)}
+
+def test_get_scene_from_cache(sim, tmp_path):
+    h = _unit(sim)
+    h.scene_cache = SceneCache(str(tmp_path))
+    data = _frames()
+    assert h.upload_scene('s', data)
+    n = sim.n_commands
+    assert np.allclose(h.get_scene('s'), data)
+    assert sim.n_commands == n
+    # Uploading the same frames again is a no-op
+    assert h.upload_scene('s', data)
+    assert sim.n_commands == n
+    h.disconnect()
+
+def test_sync_scenes(sim, tmp_path):
+    for i in range(3):
+        sim.scenes += [('s{:d}'.format(i), [(10. + j, 100.) for j in range(5)])]
+        sim.scene_saved += [True]
+    h = _unit(sim)
+    h.scene_cache = SceneCache(str(tmp_path))
+    assert sorted(h.sync_scenes()) == ['s0', 's1', 's2']
+    assert h.sync_scenes() == []
+    # s1 changed length on the unit, s2 is gone
+    sim.scenes[1][1].append((15., 100.))
+    del sim.scenes[2]
+    del sim.scene_saved[2]
+    assert h.sync_scenes() == ['s1']
+    assert sorted(h.scene_cache.names(h.id)) == ['s0', 's1']
+    assert h.get_scene('s1').shape == (6, 2)
+    h.disconnect()
@@ -0,0 +1,59 @@
+import datetime
+
+import numpy as np
+
+from helios_interface import HeliosUnit
+
+def _unit(sim, **kwargs):
+    return HeliosUnit('127.0.0.1', port=sim.port, settle=0., **kwargs)
+
+def _frames(n=10, offset=0.):
+    return np.c_[np.linspace(10., 20., n) + offset, np.linspace(100., 110., n)]
+
+def test_make_room_keeps_pinned_scenes(sim):
+    slots = int(sim.cfg['MAX_SCENES'])
+    for i in range(slots):
+        sim.scenes += [('s{:d}'.format(i), [list(f) for f in _frames(5, i)])]
+        sim.scene_saved += [True]
+    # s0 and s1 run every day
+    sim.schedule = [[0, 0, 0, 6, 0, 0, 'sequence', 's0', 's1']]
+    h = _unit(sim)
+    assert h.scene_pins() == {'s0', 's1'}
+
+    # Full: no room without evicting
+    assert not h.upload_scene('new', _frames())
+    for i in range(2, slots):
+        h.scene_use['s{:d}'.format(i)] = 1000. + i
+    h.scene_use['s2'] = 5000.
+    assert h.make_room(2, keep=['s3']) == ['s4', 's5']
+    assert sorted(h.scenes) == sorted(s[0] for s in sim.scenes)
+    assert 's0' in h.scenes and 's1' in h.scenes and 's4' not in h.scenes
+    # The ids follow the renumbering of the unit
+    assert all(sim.scenes[i][0] == n for n, i in h.scenes.items())
+
+    assert h.upload_scene('new', _frames())
+    assert h.upload_scene('fill', _frames(offset=2.))
+    # Full again, s3 is not kept any more and is the least recently used
+    assert h.upload_scene('newer', _frames(offset=1.), evict=True)
+    assert 's3' not in h.scenes and 'newer' in h.scenes
+    assert h.make_room(slots) is None
+    h.disconnect()
+
+def test_dated_tasks(sim):
+    for name in ['past', 'future', 'idle']:
+        sim.scenes += [(name, [list(f) for f in _frames(5)])]
+        sim.scene_saved += [True]
+    sim.schedule = [[2020, 1, 1, 6, 0, 0, 'sequence', 'past'],
+                    [2099, 1, 1, 6, 0, 0, 'sequence', 'future']]
+    h = _unit(sim)
+    # Only the tasks still to come pin their scenes, the past ones count as
+    # a use of them
+    assert h.scene_pins() == {'future'}
+    t = datetime.datetime(2020, 1, 1, 6, tzinfo=datetime.timezone.utc).timestamp()
+    assert h.scene_last_use('past') == t
+    assert h.scene_last_use('idle') == 0.
+    sim.cfg['MAX_SCENES'] = 3
+    h.get_cfg(max_age=0)
+    assert h.make_room(2) == ['idle', 'past']
+    assert list(h.scenes) == ['future']
+    h.disconnect()
@@ -0,0 +1,69 @@
+import time
+
+from helios_interface import HeliosUnit, HeliosSession
+
+def _unit(sim, **kwargs):
+    return HeliosUnit('127.0.0.1', port=sim.port, settle=0., **kwargs)
+
+def test_session_backoff_and_reconnect(sim):
+    h = _unit(sim)
+    h.session.backoff = 0.2
+    sim.disconnect_prob = 1.
+    assert h.cmd_get_answare('id') is None
+    assert h.tn is None and h.session.failures == 1
+    sim.disconnect_prob = 0.
+    # Backing off: fails fast without touching the unit
+    n = sim.n_connections
+    assert h.cmd_get_answare('id') is None
+    assert sim.n_connections == n
+    time.sleep(0.25)
+    assert h.get_id() == sim.id
+    assert sim.n_connections == n + 1
+    assert h.session.failures == 0 and h.session.reconnects == 1
+    assert h.metrics.reconnects == 1
+    h.disconnect()
+
+def test_session_circuit_breaker():
+    s = HeliosSession(backoff=0., max_failures=3, open_time=60.)
+    for i in range(2):
+        s.failed()
+        assert s.state == HeliosSession.DISCONNECTED and s.can_attempt()
+    s.failed()
+    assert s.state == HeliosSession.OPEN and not s.can_attempt()
+    s.connected()
+    s.activity()
+    assert s.failures == 0 and s.reconnects == 1
+
+def test_session_backoff_is_capped():
+    s = HeliosSession(backoff=1., max_backoff=4., max_failures=10)
+    waits = []
+    for i in range(5):
+        s.failed()
+        waits.append(s.next_attempt - time.monotonic())
+    assert [round(w) for w in waits] == [1, 2, 4, 4, 4]
+
+def test_session_half_open():
+    s = HeliosSession(backoff=0., max_failures=2, open_time=0.1)
+    s.failed()
+    s.failed()
+    assert not s.can_attempt()
+    time.sleep(0.15)
+    # One attempt after open_time, failing it opens the circuit again
+    assert s.can_attempt()
+    s.failed()
+    assert s.state == HeliosSession.OPEN and not s.can_attempt()
+
+def test_session_open_circuit_skips_unit(sim):
+    h = _unit(sim)
+    h.session.backoff = 0.
+    h.session.open_time = 60.
+    sim.disconnect_prob = 1.
+    for i in range(h.session.max_failures):
+        assert h.get_id() is False
+    assert h.session.state == HeliosSession.OPEN
+    # Fails fast while open, the unit sees no connection at all
+    sim.disconnect_prob = 0.
+    n = sim.n_connections
+    assert h.get_id() is False
+    assert sim.n_connections == n
+    h.disconnect()
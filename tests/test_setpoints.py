@@ -0,0 +1,96 @@
+import threading
+import time
+
+from helios_interface import HeliosUnit, HeliosSession
+from helios_worker import HeliosWorker, SetpointChannel
+
+class _FakeUnit:
+    # Only what SetpointChannel reads from the unit
+    def __init__(self):
+        self.ip_addr = 'fake'
+        self.session = HeliosSession(backoff=0.1)
+
+def _wait(cond, timeout=5.):
+    deadline = time.monotonic() + timeout
+    while not cond() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return cond()
+
+def test_setpoints_latest_wins():
+    w = HeliosWorker(_FakeUnit())
+    ch = SetpointChannel(w, min_period=0.)
+    sent = []
+    started = threading.Event()
+    gate = threading.Event()
+    def _move(x):
+        started.set()
+        gate.wait(5)
+        sent.append(x)
+        return True
+    ch.set(_move, 0)
+    assert started.wait(5)
+    # Sent while 0 is in flight, only the newest goes out after it
+    for x in range(1, 5):
+        ch.set(_move, x)
+    gate.set()
+    assert _wait(lambda: not ch.pending() and not ch.in_flight)
+    assert sent == [0, 4]
+    assert ch.coalesced == 3
+    w.close()
+
+def test_setpoints_retry_after_backoff():
+    unit = _FakeUnit()
+    w = HeliosWorker(unit)
+    ch = SetpointChannel(w, min_period=0.01, max_age=1.)
+    sent = []
+    def _move(x):
+        # Fails once, like a dropped link
+        if not sent:
+            sent.append(None)
+            unit.session.failed()
+            return False
+        sent.append(x)
+        return True
+    ch.set(_move, 1)
+    # Retried by the channel itself once the 0.1 s backoff is over
+    assert _wait(lambda: sent == [None, 1])
+    assert ch.failed == 1 and ch.stale == 0 and not ch.pending()
+    w.close()
+
+def test_setpoints_drop_stale_targets():
+    unit = _FakeUnit()
+    unit.session.backoff = 5.
+    w = HeliosWorker(unit)
+    ch = SetpointChannel(w, min_period=0.01, max_age=0.5)
+    calls = []
+    def _move(x):
+        calls.append(x)
+        unit.session.failed()
+        return False
+    ch.set(_move, 1)
+    # The retry would come after max_age, the target is dropped
+    assert _wait(lambda: ch.stale == 1)
+    assert not ch.pending()
+    time.sleep(0.2)
+    ch.flush()
+    time.sleep(0.1)
+    assert calls == [1]
+    w.close()
+
+def test_setpoints_jog_simulator(sim):
+    h = HeliosUnit('127.0.0.1', port=sim.port, settle=0.)
+    w = HeliosWorker(h)
+    ch = SetpointChannel(w, min_period=0.)
+    sim.latency = 0.02
+    n = sim.n_commands
+    for i in range(50):
+        ch.set(h.absolute_move, 20. + i * 0.1, 150.)
+        time.sleep(0.002)
+    assert _wait(lambda: not ch.pending() and not ch.in_flight)
+    # The unit ends on the last target, most of the others never went out
+    assert round(sim.alt.target, 1) == 24.9 and sim.azi.target == 150.
+    assert ch.sent == sim.n_commands - n < 50
+    assert ch.sent + ch.coalesced == 50
+    w.close()
+    w.thread.join(timeout=5)
+    h.disconnect()
@@ -0,0 +1,63 @@
+import socket
+import time
+
+import pytest
+
+from helios_simulator import HeliosSimulatorPool
+
+def _session(sim):
+    s = socket.create_connection(('127.0.0.1', sim.port), timeout=5)
+    assert _read_prompt(s).startswith("Helios {:s}\n".format(sim.id))
+    return s
+
+def _read_prompt(s):
+    # Everything up to the next prompt
+    data = b''
+    while not data.endswith(b'> '):
+        chunk = s.recv(4096)
+        if not chunk:
+            break
+        data += chunk
+    return data.decode()
+
+def test_framing(sim):
+    s = _session(sim)
+    s.sendall(b"id\n")
+    assert _read_prompt(s) == "{:s}\n[OK] > ".format(sim.id)
+    s.sendall(b"not-a-command\n")
+    assert _read_prompt(s) == "Unknown command not-a-command\n[!!] > "
+    s.sendall(b"get\n")
+    assert _read_prompt(s) == "Wrong arguments\n[!!] > "
+    s.close()
+
+def test_pipelined_answers_overlap(sim):
+    # Ten commands sent at once take about one latency, not ten
+    sim.latency = 0.1
+    s = _session(sim)
+    t0 = time.monotonic()
+    s.sendall(b"id\n" * 10)
+    data = ''
+    while data.count('[OK] > ') < 10:
+        data += s.recv(4096).decode()
+    assert time.monotonic() - t0 < 0.5
+    assert sim.n_commands == 10
+    s.close()
+
+def test_disconnect(sim):
+    sim.disconnect_prob = 1.
+    s = _session(sim)
+    s.sendall(b"id\n")
+    assert s.recv(4096) == b''
+    assert sim.n_connections == 1
+    s.close()
+
+def test_pool_close_drops_sessions():
+    pool = HeliosSimulatorPool()
+    sims = pool.spawn(2)
+    assert sims[0].port != sims[1].port and sims[0].id != sims[1].id
+    s = _session(sims[0])
+    pool.close()
+    assert s.recv(4096) == b''
+    s.close()
+    with pytest.raises(OSError):
+        socket.create_connection(('127.0.0.1', sims[0].port), timeout=1)
@@ -0,0 +1,54 @@
+import time
+
+from helios_interface import HeliosUnit, HeliosStateCache
+
+def _unit(sim, **kwargs):
+    return HeliosUnit('127.0.0.1', port=sim.port, settle=0., **kwargs)
+
+def test_cache_ttl():
+    c = HeliosStateCache({'position': 0.1})
+    assert c.ttl['cfg'] == 600. and c.ttl['position'] == 0.1
+    assert c.get('position') is None
+    c.put('position', (1., 2.))
+    assert c.get('position') == (1., 2.)
+    assert c.get('position', max_age=0) is None
+    time.sleep(0.15)
+    assert c.get('position') is None
+    assert c.hits == 1 and c.misses == 3
+    # Fields without a TTL are never served
+    c.put('other', 1)
+    assert c.get('other') is None
+
+def test_cached_queries(sim):
+    h = _unit(sim)
+    assert h.battery_charge() is not None
+    n = sim.n_commands
+    for i in range(10):
+        assert h.get_cfg()['ALT_KP'] == 1.2
+        assert h.battery_charge() is not None
+    assert sim.n_commands == n
+    assert h.get_cfg(max_age=0) is not None
+    assert sim.n_commands == n + 1
+    h.disconnect()
+
+def test_writes_invalidate(sim):
+    h = _unit(sim)
+    assert h.get_position() is not None
+    n = sim.n_commands
+    h.get_position()
+    assert sim.n_commands == n
+    assert h.absolute_move(30., 200.)
+    h.get_position()
+    assert sim.n_commands == n + 2
+
+    assert h.set_prm('alt_kp', 0.7)
+    assert h.get_cfg()['ALT_KP'] == 0.7
+    h.disconnect()
+
+def test_get_prm_from_cfg(sim):
+    h = _unit(sim)
+    n = sim.n_commands
+    assert h.get_prm('alt_kp') == 1.2
+    assert h.get_prm('azie0') == 201.
+    assert sim.n_commands == n
+    h.disconnect()
@@ -0,0 +1,76 @@
+from helios_interface import HeliosUnit
+from helios_protocol import HeliosStreamParser, HELIOS_OK, HELIOS_ERR
+
+def _parse_all(chunks):
+    # All the answers of a stream fed in chunks, as (lines, end), and the
+    # lines of the answer not complete yet
+    p = HeliosStreamParser()
+    answers = []
+    lines = []
+    for c in chunks:
+        p.feed(c)
+        while True:
+            l, end = p.next_lines()
+            lines += l
+            if end is None:
+                break
+            answers += [(lines, end)]
+            lines = []
+    return answers, lines
+
+def test_single_answer():
+    answers, rest = _parse_all([b"a\nb\n" + HELIOS_OK])
+    assert answers == [(['a', 'b'], True)]
+    assert rest == []
+
+def test_error_and_empty_answers():
+    answers, rest = _parse_all([HELIOS_OK + b"bad\n" + HELIOS_ERR + HELIOS_OK])
+    assert answers == [([], True), (['bad'], False), ([], True)]
+
+def test_byte_by_byte():
+    stream = b"x 1\ny 2\n" + HELIOS_ERR + b"z\n" + HELIOS_OK
+    answers, rest = _parse_all([stream[i:i+1] for i in range(len(stream))])
+    assert answers == [(['x 1', 'y 2'], False), (['z'], True)]
+
+def test_terminator_split_across_reads():
+    for term, end in [(HELIOS_OK, True), (HELIOS_ERR, False)]:
+        for cut in range(1, len(term)):
+            answers, rest = _parse_all([b"line\n" + term[:cut], term[cut:] + b"next\n"])
+            assert answers == [(['line'], end)]
+            assert rest == ['next']
+
+def test_terminator_inside_a_line():
+    # Only a terminator at the start of a line ends the answer
+    answers, rest = _parse_all([b"text [OK] > more\n" + HELIOS_OK])
+    assert answers == [(['text [OK] > more'], True)]
+
+def test_partial_lines_are_held_back():
+    p = HeliosStreamParser()
+    p.feed(b"first\nsec")
+    assert p.next_lines() == (['first'], None)
+    assert p.next_lines() == ([], None)
+    p.feed(b"ond\r\n" + HELIOS_OK)
+    assert p.next_lines() == (['second'], True)
+
+def test_compaction():
+    p = HeliosStreamParser()
+    line = b"FRAME 0 T 0 10.0 100.0\n"
+    n = 0
+    for i in range(2 * HeliosStreamParser.COMPACT // len(line) + 10):
+        p.feed(line + HELIOS_OK)
+        lines, end = p.next_lines()
+        assert lines == [line.decode().strip()] and end is True
+        n += 1
+    assert p.pending() == 0
+    assert len(p.buf) < HeliosStreamParser.COMPACT + 2 * len(line)
+
+def test_slow_link_pipelined_answers(sim):
+    # Long answers queued behind each other on a slow link come out whole
+    # and in order, whatever the reads return
+    h = HeliosUnit('127.0.0.1', port=sim.port, settle=0.)
+    cmds = ['configs', 'id', 'print-wifi', 'not-a-command', 'configs', 'id']
+    expected = [h.cmd_get_answare(c) for c in cmds]
+    sim.bandwidth = 20000.
+    assert h.cmd_get_answares(cmds, window=len(cmds)) == expected
+    assert expected[3] is None and len(expected[0]) == len(sim.cfg)
+    h.disconnect()
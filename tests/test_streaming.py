@@ -0,0 +1,51 @@
+import numpy as np
+
+from helios_interface import HeliosUnit
+
+def _unit(sim, **kwargs):
+    return HeliosUnit('127.0.0.1', port=sim.port, settle=0., **kwargs)
+
+def _frames(n=10, offset=0.):
+    return np.c_[np.linspace(10., 20., n) + offset, np.linspace(100., 110., n)]
+
+def test_iter_answer_early_break(sim):
+    h = _unit(sim)
+    assert h.upload_scene('long', _frames(100))
+    for i, l in enumerate(h.iter_answer('print-scene {:d}'.format(h.scenes['long']))):
+        if i == 2:
+            break
+    # The rest of the answer was drained, the next command gets its own
+    assert h.get_id() == sim.id
+    assert h.get_scene('long').shape == (100, 2)
+    h.disconnect()
+
+def test_get_scene_error_answer(sim):
+    h = _unit(sim)
+    assert h.upload_scene('s', _frames())
+    sim._cmd_print_scene = lambda args: (False, ["Scene busy", "try again later", "code 7"])
+    assert h.get_scene('s') is None
+    sim._cmd_print_scene = lambda args: (True, ["SCENE 0 s 2", "FRAME 0 T 0 10.0 100.0", "garbage"])
+    assert h.get_scene('s') is None
+    del sim._cmd_print_scene
+    assert h.get_scene('s').shape == (10, 2)
+    h.disconnect()
+
+def test_syslog_long_answer(sim):
+    sim.log = ["line {:d} ".format(i) for i in range(5000)]
+    sim.bandwidth = 200000.
+    h = _unit(sim)
+    assert h.syslog() == [l.strip() for l in sim.log]
+    # Stopping after the first line still drains the rest of it
+    it = h.iter_syslog()
+    assert next(it) == 'line 0'
+    it.close()
+    assert h.get_id() == sim.id
+    h.disconnect()
+
+def test_syslog_error_answer(sim):
+    h = _unit(sim)
+    sim._cmd_syslog = lambda args: (False, ["SD card error"] * 20)
+    assert h.syslog() is None
+    del sim._cmd_syslog
+    assert h.syslog() == sim.log
+    h.disconnect()
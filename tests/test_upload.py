@@ -0,0 +1,55 @@
+import numpy as np
+
+from helios_interface import HeliosUnit
+
+def _unit(sim, **kwargs):
+    return HeliosUnit('127.0.0.1', port=sim.port, settle=0., **kwargs)
+
+def _frames(n=120):
+    t = np.linspace(0., 1., n)
+    return np.c_[20. + 30. * np.sin(np.pi * t), 100. + 80. * t]
+
+def test_upload_round_trip(sim):
+    h = _unit(sim)
+    data = _frames()
+    done = []
+    assert h.upload_scene('sweep', data, window=8, progress=lambda i, n: done.append(i))
+    assert done[-1] == len(done) and len(done) >= 120
+    assert h.last_upload['frames'] == 120 and h.last_upload['fps'] > 0
+    assert h.scenes_frames['sweep'] == 120
+    assert h.scenes_len['sweep'] == 120 * h.cfg['SCENE_DT']
+    name, frames = sim.scenes[h.scenes['sweep']]
+    assert name == 'sweep' and np.allclose(frames, np.round(data, 1))
+    assert sim.scene_saved[h.scenes['sweep']]
+    assert np.allclose(h.get_scene('sweep'), np.round(data, 1))
+    h.disconnect()
+
+def test_upload_detects_corrupted_frames(sim):
+    h = _unit(sim)
+    add_frame = sim._cmd_add_frame_scene
+    def _add_frame(args):
+        if args[1] == '50.0':
+            args = [args[0], '49.0', args[2]]
+        return add_frame(args)
+    sim._cmd_add_frame_scene = _add_frame
+    data = np.c_[np.linspace(40., 60., 21), np.full(21, 100.)]
+    assert not h.upload_scene('bad', data)
+    assert 'bad' not in h.scenes
+    h.disconnect()
+
+def test_upload_rejected_frames(sim):
+    h = _unit(sim)
+    sim.cfg['SCENE_LEN'] = 10
+    assert not h.upload_scene('long', _frames(20))
+    assert 'long' not in h.scenes
+    # Still in sync after the failed batch
+    assert h.get_id() == sim.id
+    h.disconnect()
+
+def test_upload_wrong_shape(sim):
+    h = _unit(sim)
+    n = sim.n_commands
+    assert not h.upload_scene('huge', _frames(121))
+    assert not h.upload_scene('flat', np.zeros((10, 3)))
+    assert sim.n_commands == n
+    h.disconnect()
@@ -0,0 +1,33 @@
+import queue
+
+from helios_worker import HeliosWorker, apply_results
+
+def test_worker_without_unit():
+    results = queue.Queue()
+    w = HeliosWorker(None, results)
+    assert w.thread.name == 'helios-io-loader'
+    done = []
+    f = w.submit(lambda a, b: a + b, 1, 2, callback=done.append)
+    assert f.result(timeout=5) == 3
+    w.close()
+    w.thread.join(timeout=5)
+    assert apply_results(results) == 1
+    assert done == [3]
+
+def test_worker_name():
+    w = HeliosWorker(None, name='fleet')
+    assert w.thread.name == 'helios-io-fleet'
+    w.close()
+
+def test_worker_failed_request_skips_callback():
+    results = queue.Queue()
+    w = HeliosWorker(None, results)
+    done = []
+    def _fail():
+        raise ConnectionError("unreachable")
+    f = w.submit(_fail, callback=done.append)
+    assert isinstance(f.exception(timeout=5), ConnectionError)
+    w.close()
+    w.thread.join(timeout=5)
+    assert apply_results(results) == 1
+    assert done == []